@@ -9,9 +9,10 @@ from app.database.base import Base
 
 #### import of definitions that alembic tracks
 from app.database.models.configuration import ElectricitySeason, HourlyBlockLevel
-from app.database.models.customer import ElectricityCustomer, ElectricityProvider, CustomerContract
+from app.database.models.customer import ElectricityCustomer, ElectricityProvider, CustomerContract, PriceSchedule
+from app.database.models.document import InvoiceDocument
 from app.database.models.invoice import ElectricityInvoice, ElectricityInvoiceItem
-from app.database.models.measurement import ElectricityUsage
+from app.database.models.measurement import ElectricityUsage, MeasurementDirtyWindow
 ####
 
 # this is the Alembic Config object, which provides
@@ -0,0 +1,32 @@
+"""active_contract_partial_index
+
+Revision ID: 8e3f2a61c7b5
+Revises: 5c1e7a9b2d40
+Create Date: 2026-10-19 10:24:51.093127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e3f2a61c7b5'
+down_revision: Union[str, Sequence[str], None] = '5c1e7a9b2d40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # index is built concurrently, so contracts are not locked for writes,
+    # concurrent builds can not run in a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('electricity_customers_contracts_active_customer_idx', 'electricity_customers_contracts', ['customer_id'], unique=False, postgresql_where=sa.text('termination_date IS NULL'), postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('electricity_customers_contracts_active_customer_idx', table_name='electricity_customers_contracts', postgresql_where=sa.text('termination_date IS NULL'), postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,36 @@
+"""invoice_and_contract_indexes
+
+Revision ID: 2b9d4f6e0a18
+Revises: 8e3f2a61c7b5
+Create Date: 2026-10-19 11:31:07.662410
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b9d4f6e0a18'
+down_revision: Union[str, Sequence[str], None] = '8e3f2a61c7b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# electricity_invoices.contract_id is already covered by the unique constraint on
+# (contract_id, service_date) and active contracts by the partial index on customer_id
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # indexes are built concurrently, so tables are not locked for writes,
+    # this can not run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_electricity_invoices_items_electricity_invoice_id'), 'electricity_invoices_items', ['electricity_invoice_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_electricity_customers_contracts_customer_id'), 'electricity_customers_contracts', ['customer_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_electricity_customers_contracts_customer_id'), table_name='electricity_customers_contracts', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_electricity_invoices_items_electricity_invoice_id'), table_name='electricity_invoices_items', postgresql_concurrently=True, if_exists=True)
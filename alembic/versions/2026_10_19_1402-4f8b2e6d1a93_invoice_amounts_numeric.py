@@ -0,0 +1,73 @@
+"""invoice_amounts_numeric
+
+Revision ID: 4f8b2e6d1a93
+Revises: 7d4a1c93e6f2
+Create Date: 2026-10-19 14:02:48.531906
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f8b2e6d1a93'
+down_revision: Union[str, Sequence[str], None] = '7d4a1c93e6f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# amounts are rounded to cents and quantities to Wh
+AMOUNT_COLUMNS = {
+    'electricity_invoices': {
+        'base_amount': sa.Numeric(14, 2),
+        'tax_amount': sa.Numeric(14, 2),
+        'total_amount': sa.Numeric(14, 2),
+        'total_quantity': sa.Numeric(14, 3),
+    },
+    'electricity_invoices_items': {
+        'quantity': sa.Numeric(14, 3),
+        'amount': sa.Numeric(14, 2),
+    },
+}
+
+PREVIOUS_TYPES = {
+    'electricity_invoices': {
+        'base_amount': sa.Float(),
+        'tax_amount': sa.Float(),
+        'total_amount': sa.Float(),
+        'total_quantity': sa.Float(),
+    },
+    'electricity_invoices_items': {
+        'quantity': sa.Integer(),
+        'amount': sa.Float(),
+    },
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, columns in AMOUNT_COLUMNS.items():
+        for column, type_ in columns.items():
+            op.alter_column(
+                table,
+                column,
+                existing_type=PREVIOUS_TYPES[table][column],
+                type_=type_,
+                existing_nullable=False,
+                postgresql_using=f'round({column}::numeric, {type_.scale})',
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, columns in PREVIOUS_TYPES.items():
+        for column, type_ in columns.items():
+            op.alter_column(
+                table,
+                column,
+                existing_type=AMOUNT_COLUMNS[table][column],
+                type_=type_,
+                existing_nullable=False,
+                postgresql_using=f'{column}::{"integer" if isinstance(type_, sa.Integer) else "double precision"}',
+            )
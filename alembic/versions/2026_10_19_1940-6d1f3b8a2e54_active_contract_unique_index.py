@@ -0,0 +1,57 @@
+"""active_contract_unique_index
+
+Revision ID: 6d1f3b8a2e54
+Revises: 4c8e1f6a2d93
+Create Date: 2026-10-19 19:40:27.610354
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6d1f3b8a2e54'
+down_revision: Union[str, Sequence[str], None] = '4c8e1f6a2d93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# contract creation relies on the unique index to reject a second active contract
+DUPLICATE_ACTIVE_CONTRACTS = """
+    SELECT customer_id, array_agg(id ORDER BY id) AS contract_ids
+    FROM electricity_customers_contracts
+    WHERE termination_date IS NULL
+    GROUP BY customer_id
+    HAVING count(*) > 1
+    ORDER BY customer_id
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # contracts are not terminated by the migration, that is up to the operators
+    duplicates = op.get_bind().execute(sa.text(DUPLICATE_ACTIVE_CONTRACTS)).all()
+    if duplicates:
+        listed = "; ".join(
+            f"customer {customer_id}: contracts {', '.join(map(str, contract_ids))}"
+            for customer_id, contract_ids in duplicates
+        )
+        raise RuntimeError(
+            "Customers have more than one active contract, terminate all but one "
+            f"before upgrading: {listed}"
+        )
+
+    # index is built concurrently, so contracts are not locked for writes,
+    # concurrent builds can not run in a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('electricity_customers_contracts_active_customer_key', 'electricity_customers_contracts', ['customer_id'], unique=True, postgresql_where=sa.text('termination_date IS NULL'), postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('electricity_customers_contracts_active_customer_idx', table_name='electricity_customers_contracts', postgresql_where=sa.text('termination_date IS NULL'), postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('electricity_customers_contracts_active_customer_idx', 'electricity_customers_contracts', ['customer_id'], unique=False, postgresql_where=sa.text('termination_date IS NULL'), postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('electricity_customers_contracts_active_customer_key', table_name='electricity_customers_contracts', postgresql_where=sa.text('termination_date IS NULL'), postgresql_concurrently=True, if_exists=True)
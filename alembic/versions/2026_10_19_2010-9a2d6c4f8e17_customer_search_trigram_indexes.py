@@ -0,0 +1,44 @@
+"""customer_search_trigram_indexes
+
+Revision ID: 9a2d6c4f8e17
+Revises: 6d1f3b8a2e54
+Create Date: 2026-10-19 20:10:42.503117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a2d6c4f8e17'
+down_revision: Union[str, Sequence[str], None] = '6d1f3b8a2e54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# trigram indexes answer both similarity operators and ILIKE with wildcards on both sides
+SEARCH_INDEXES = [
+    ('electricity_customers_fullname_trgm_idx', 'electricity_customers', 'fullname'),
+    ('electricity_customers_email_trgm_idx', 'electricity_customers', 'email'),
+    ('electricity_customers_tax_code_trgm_idx', 'electricity_customers', 'tax_code'),
+    ('electricity_customers_contracts_contract_number_trgm_idx', 'electricity_customers_contracts', 'contract_number'),
+    ('electricity_customers_contracts_energy_meter_number_trgm_idx', 'electricity_customers_contracts', 'energy_meter_number'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # indexes are built concurrently, so tables are not locked for writes,
+    # this can not run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, column in SEARCH_INDEXES:
+            op.create_index(name, table, [column], unique=False, postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'}, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # extension is kept, other database objects could use it
+    with op.get_context().autocommit_block():
+        for name, table, column in reversed(SEARCH_INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,339 @@
+"""
+Monthly billing run, creates invoices for all customers with an active contract.
+
+Customer id space is sharded over worker processes, each worker uses its own
+database connection. Customers that already have an invoice overlapping the selected
+period are skipped, so an interrupted run can simply be started again.
+With --months, invoices cover several months starting with the selected one,
+for example --months 3 for quarterly invoices.
+
+Usage:
+    python -m app.cli.billing_run --year 2025 --month 8 --workers 4 \\
+        --payment-reason "Račun za elektriko {month}/{year}" \\
+        --invoice-number "{year}{month:02d}-{customer_id}" \\
+        --receiver-reference "SI00 {contract_number}-{year}{month:02d}" \\
+        --location-issued Ljubljana --pdf-dir invoices/
+"""
+
+import argparse
+from dataclasses import dataclass, field
+from datetime import date
+import multiprocessing
+import os
+from pathlib import Path
+import queue
+import time
+
+from dateutil.relativedelta import relativedelta
+import structlog
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+
+from app.database.models.customer import CustomerContract
+from app.database.models.invoice import ElectricityInvoice
+from app.schema.invoice import CreateInvoice
+
+log = structlog.get_logger()
+
+# how often the main process reports progress, in seconds
+PROGRESS_INTERVAL = 5
+
+
+@dataclass
+class WorkerSummary:
+    worker: int
+    created: int = 0
+    skipped: int = 0
+    empty: int = 0
+    failed: int = 0
+    documents: int = 0
+    elapsed: float = 0.0
+    failed_customers: list = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+
+def _shard_filter(worker: int, workers: int):
+    return CustomerContract.customer_id % workers == worker
+
+
+def _active_contracts_query(worker: int, workers: int):
+    return (
+        select(CustomerContract)
+        .options(joinedload(CustomerContract.provider, innerjoin=True))
+        .filter(CustomerContract.termination_date == None)
+        .filter(_shard_filter(worker, workers))
+        .order_by(CustomerContract.customer_id)
+    )
+
+
+def _invoice_period(args) -> tuple[date, date]:
+    period_start = date(args.year, args.month, 1)
+    return period_start, period_start + relativedelta(months=args.months, days=-1)
+
+
+def _invoice_data(args, contract: CustomerContract) -> CreateInvoice:
+    placeholders = {
+        "year": args.year,
+        "month": args.month,
+        "customer_id": contract.customer_id,
+        "contract_id": contract.id,
+        "contract_number": contract.contract_number,
+    }
+    period_start, period_end = _invoice_period(args)
+    return CreateInvoice(
+        customer_id=contract.customer_id,
+        period_start=period_start,
+        period_end=period_end,
+        payment_reason=args.payment_reason.format(**placeholders),
+        receiver_reference=args.receiver_reference.format(**placeholders),
+        invoice_number=args.invoice_number.format(**placeholders),
+        location_issued=args.location_issued,
+        invoice_code=args.invoice_code,
+        days_payment_due=args.days_payment_due,
+    )
+
+
+def _write_document(session, invoice: ElectricityInvoice, pdf_dir: Path) -> bool:
+    # PDF rendering is imported only when documents are requested
+    from app.utils.document import (
+        invoice_document_filename,
+        invoice_render_data,
+        render_invoice_pdf,
+        write_document,
+    )
+    from app.utils.invoice import load_invoices_with_details
+
+    path = pdf_dir / invoice_document_filename(invoice)
+    if path.exists():
+        return False
+
+    # created invoice is completed with its contract, provider and customer
+    invoice = load_invoices_with_details(session, [invoice.id])[invoice.id]
+    customer_contract = invoice.customer_contract
+    write_document(
+        path, render_invoice_pdf(invoice_render_data(invoice, customer_contract))
+    )
+    return True
+
+
+def run_worker(worker: int, args, progress: multiprocessing.Queue):
+    # imported inside the worker, so each process creates its own engine and connections
+    from app.database.session import SessionLocal
+    from app.utils.invoice_corrections import clear_dirty_windows
+    from app.utils.invoice import (
+        build_invoice,
+        find_period_invoice,
+        lock_invoice_period,
+    )
+
+    summary = WorkerSummary(worker=worker)
+    period_start, service_date = _invoice_period(args)
+    pdf_dir = Path(args.pdf_dir) if args.pdf_dir else None
+    started = time.perf_counter()
+
+    # contracts are loaded once per shard, they should not be expired by commits
+    with SessionLocal(expire_on_commit=False) as session:
+        contracts = (
+            session.execute(_active_contracts_query(worker, args.workers))
+            .scalars()
+            .all()
+        )
+
+        for contract in contracts:
+            status = "created"
+            try:
+                # lock protects against API requests creating the same invoice
+                lock_invoice_period(session, contract.id)
+                invoice = find_period_invoice(
+                    session, contract.id, period_start, service_date
+                )
+                if invoice is not None:
+                    status = "skipped"
+                else:
+                    clear_dirty_windows(
+                        session, contract.customer_id, period_start, service_date
+                    )
+                    invoice = build_invoice(
+                        session, contract, _invoice_data(args, contract)
+                    )
+                    if invoice.total_quantity == 0:
+                        status = "empty"
+                        invoice = None
+                    else:
+                        session.add(invoice)
+                        session.commit()
+
+                if invoice is not None and pdf_dir:
+                    if _write_document(session, invoice, pdf_dir):
+                        summary.documents += 1
+
+                # ends the transaction, so the invoice period lock is released
+                session.commit()
+
+            except Exception as e:
+                session.rollback()
+                status = "failed"
+                summary.failed_customers.append(contract.customer_id)
+                log.error(
+                    "Invoice creation failed",
+                    worker=worker,
+                    customer_id=contract.customer_id,
+                    error=str(e),
+                )
+
+            setattr(summary, status, getattr(summary, status) + 1)
+            progress.put(("progress", worker, status))
+
+    summary.elapsed = time.perf_counter() - started
+    progress.put(("done", worker, summary))
+
+
+def _count_active_contracts() -> int:
+    from app.database.session import SessionLocal
+
+    with SessionLocal() as session:
+        return session.scalar(
+            select(func.count(CustomerContract.id)).filter(
+                CustomerContract.termination_date == None
+            )
+        )
+
+
+def _report_summary(summaries: list[WorkerSummary], elapsed: float):
+    for summary in sorted(summaries, key=lambda s: s.worker):
+        log.info(
+            "Worker summary",
+            worker=summary.worker,
+            created=summary.created,
+            skipped=summary.skipped,
+            empty=summary.empty,
+            failed=summary.failed,
+            documents=summary.documents,
+            elapsed=round(summary.elapsed, 2),
+            invoices_per_second=round(summary.throughput, 2),
+        )
+
+    created = sum(s.created for s in summaries)
+    log.info(
+        "Billing run finished",
+        created=created,
+        skipped=sum(s.skipped for s in summaries),
+        empty=sum(s.empty for s in summaries),
+        failed=sum(s.failed for s in summaries),
+        failed_customers=sorted(c for s in summaries for c in s.failed_customers),
+        elapsed=round(elapsed, 2),
+        invoices_per_second=round(created / elapsed if elapsed else 0.0, 2),
+    )
+
+
+def run(args) -> list[WorkerSummary]:
+    if args.pdf_dir:
+        Path(args.pdf_dir).mkdir(parents=True, exist_ok=True)
+
+    total = _count_active_contracts()
+    log.info(
+        "Billing run started",
+        year=args.year,
+        month=args.month,
+        months=args.months,
+        workers=args.workers,
+        contracts=total,
+    )
+
+    # spawn is used, so no database connections are inherited from the parent
+    context = multiprocessing.get_context("spawn")
+    progress = context.Queue()
+    processes = [
+        context.Process(target=run_worker, args=(worker, args, progress))
+        for worker in range(args.workers)
+    ]
+
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+
+    summaries: list[WorkerSummary] = []
+    processed = 0
+    last_report = started
+    while len(summaries) < len(processes):
+        try:
+            kind, worker, payload = progress.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                log.error("Workers exited without reporting a summary")
+                break
+            continue
+
+        if kind == "done":
+            summaries.append(payload)
+            continue
+
+        processed += 1
+        now = time.perf_counter()
+        if now - last_report >= PROGRESS_INTERVAL or processed == total:
+            last_report = now
+            log.info(
+                "Billing run progress",
+                processed=processed,
+                total=total,
+                percent=round(100 * processed / total, 1) if total else 100.0,
+                invoices_per_second=round(processed / (now - started), 2),
+            )
+
+    for process in processes:
+        process.join()
+
+    _report_summary(summaries, time.perf_counter() - started)
+    return summaries
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Create invoices for all active contracts for the selected month."
+    )
+    parser.add_argument("--year", type=int, required=True)
+    parser.add_argument("--month", type=int, required=True)
+    parser.add_argument(
+        "--months",
+        type=int,
+        default=1,
+        help="number of months in the invoiced period, starting with --month",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="number of processes"
+    )
+    parser.add_argument(
+        "--payment-reason",
+        required=True,
+        help="template, placeholders: {year}, {month}, {customer_id}, {contract_id}, {contract_number}",
+    )
+    parser.add_argument("--receiver-reference", required=True, help="template")
+    parser.add_argument("--invoice-number", required=True, help="template")
+    parser.add_argument("--location-issued", required=True)
+    parser.add_argument("--invoice-code", default="OTHR")
+    parser.add_argument("--days-payment-due", type=int, default=15)
+    parser.add_argument(
+        "--pdf-dir", help="when set, PDF documents are rendered into this directory"
+    )
+
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if not 1 <= args.month <= 12:
+        parser.error("--month must be inside 1 - 12 range")
+    if not 1 <= args.months <= 12:
+        parser.error("--months must be inside 1 - 12 range")
+    return args
+
+
+def main(argv=None):
+    summaries = run(parse_args(argv))
+    failed = sum(summary.failed for summary in summaries)
+    return 1 if failed or len(summaries) == 0 else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,134 @@
+"""
+Invoice document worker, renders PDF documents queued by the API.
+
+Runs separately from the API, only this process needs WeasyPrint and its native
+libraries. Jobs are consumed from the electricity_invoices_documents table and
+documents are written to DOCUMENTS_STORAGE_PATH, which is shared with the API.
+Any number of workers can run at the same time.
+
+Usage:
+    python -m app.cli.document_worker --poll-interval 1
+"""
+
+import argparse
+from datetime import timedelta
+import signal
+import threading
+
+import structlog
+
+from app.database.cache import start_invalidation_listener
+from app.database.session import SessionLocal
+from app.utils.document import (
+    documents_storage_path,
+    invoice_document_storage_name,
+    invoice_render_data,
+    render_invoice_pdf,
+    write_document,
+)
+from app.utils.document_queue import claim_document, complete_document, fail_document
+from app.utils.invoice import load_invoices_with_details
+
+log = structlog.get_logger()
+
+
+def _render(session, invoice_id: int) -> str:
+    invoice = load_invoices_with_details(session, [invoice_id])[invoice_id]
+    customer_contract = invoice.customer_contract
+    if not customer_contract:
+        raise ValueError("Customer contract for invoice does not exists")
+
+    storage_name = invoice_document_storage_name(invoice.id)
+    write_document(
+        documents_storage_path / storage_name,
+        render_invoice_pdf(invoice_render_data(invoice, customer_contract)),
+    )
+    return storage_name
+
+
+def process_next(session, args) -> bool:
+    """Renders a single queued document, returns False when the queue is empty."""
+    document = claim_document(session, timedelta(seconds=args.stale_after))
+    # claimed job is committed, so it is visible as running while it is rendered
+    session.commit()
+    if document is None:
+        return False
+
+    try:
+        complete_document(document, _render(session, document.electricity_invoice_id))
+        session.commit()
+        log.info(
+            "Invoice document rendered",
+            invoice_id=document.electricity_invoice_id,
+            attempts=document.attempts,
+        )
+    except Exception as e:
+        session.rollback()
+        fail_document(document, str(e), args.max_attempts)
+        session.commit()
+        log.error(
+            "Invoice document rendering failed",
+            invoice_id=document.electricity_invoice_id,
+            attempts=document.attempts,
+            error=str(e),
+        )
+    return True
+
+
+def run(args, stop: threading.Event):
+    log.info("Document worker started", storage=str(documents_storage_path))
+    # claimed jobs are used after commits, they should not be expired
+    with SessionLocal(expire_on_commit=False) as session:
+        while not stop.is_set():
+            try:
+                if process_next(session, args):
+                    continue
+            except Exception as e:
+                # database is not reachable, the job stays queued
+                session.rollback()
+                log.error("Document queue is not available", error=str(e))
+            stop.wait(args.poll_interval)
+    log.info("Document worker stopped")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render invoice PDF documents queued by the API."
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=1.0,
+        help="seconds to wait when the queue is empty",
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=3,
+        help="failed jobs are retried until attempts are used up",
+    )
+    parser.add_argument(
+        "--stale-after",
+        type=int,
+        default=600,
+        help="seconds after which a running job of a crashed worker is claimed again",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # cached reference entities are changed by writes of API processes
+    start_invalidation_listener()
+
+    # current document is finished before the worker stops
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    run(args, stop)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
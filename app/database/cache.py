@@ -0,0 +1,286 @@
+"""
+Process local read-through cache for reference entities:
+customers, providers, contracts and the active contract of a customer.
+
+Only column values are cached, on a hit detached instances are merged into the
+session of the request without loading them from the database.
+Write endpoints invalidate entries inside their transaction, entries are removed
+after the commit. Values read on the replica are returned but not cached,
+the replica can lag behind invalidations. When REFERENCE_CACHE_NOTIFY is enabled, invalidations are
+also sent with Postgres NOTIFY, so caches of other pods are cleared too.
+"""
+
+import os
+import select as select_module
+import threading
+import time
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import (
+    Session,
+    joinedload,
+    make_transient_to_detached,
+)
+from sqlalchemy.orm.attributes import set_committed_value
+import structlog
+
+from app.database.models.customer import (
+    CustomerContract,
+    ElectricityCustomer,
+    ElectricityProvider,
+)
+from app.database.session import REPLICA_SESSION, engine
+
+__all__ = [
+    "get_active_contract",
+    "get_contract",
+    "get_customer",
+    "invalidate_contract",
+    "invalidate_customer",
+    "invalidate_provider",
+    "start_invalidation_listener",
+]
+
+log = structlog.get_logger()
+
+cache_notify = os.getenv("REFERENCE_CACHE_NOTIFY", "true").lower() == "true"
+# value of 0 disables the cache, without notifications other processes only see
+# changes after entries expire, so they are kept for a few seconds
+cache_ttl = float(os.getenv("REFERENCE_CACHE_TTL", "300" if cache_notify else "5"))
+
+NOTIFY_CHANNEL = "reference_cache"
+# notification payload that clears the whole cache
+CLEAR_ALL = "*"
+# key inside session.info with invalidations waiting for commit
+PENDING_INVALIDATIONS = "reference_cache_invalidations"
+
+_entries: dict[str, tuple[float, object]] = {}
+_lock = threading.Lock()
+# incremented on every invalidation, values loaded before an invalidation are not stored
+_generation = 0
+
+
+def _customer_key(customer_id: int) -> str:
+    return f"customer:{customer_id}"
+
+
+def _provider_key(provider_id: int) -> str:
+    return f"provider:{provider_id}"
+
+
+def _contract_key(contract_id: int) -> str:
+    return f"contract:{contract_id}"
+
+
+def _active_contract_key(customer_id: int) -> str:
+    return f"active_contract:{customer_id}"
+
+
+def _lookup(key: str) -> tuple[bool, object]:
+    entry = _entries.get(key)
+    if entry is None or entry[0] < time.monotonic():
+        return False, None
+    return True, entry[1]
+
+
+def _store(session: Session, generation: int, values: dict[str, object]):
+    # invalidation could already be processed while the replica still has old values
+    if cache_ttl <= 0 or session.info.get(REPLICA_SESSION):
+        return
+    expires_at = time.monotonic() + cache_ttl
+    with _lock:
+        if generation != _generation:
+            return
+        for key, value in values.items():
+            _entries[key] = (expires_at, value)
+
+
+def _discard(keys):
+    global _generation
+    with _lock:
+        _generation += 1
+        if CLEAR_ALL in keys:
+            _entries.clear()
+            return
+        for key in keys:
+            _entries.pop(key, None)
+
+
+def _column_values(obj) -> dict:
+    return {attr.key: getattr(obj, attr.key) for attr in obj.__mapper__.column_attrs}
+
+
+def _detached(model, values: dict):
+    obj = model(**values)
+    make_transient_to_detached(obj)
+    return obj
+
+
+def _contract_values(contract: CustomerContract) -> dict[str, object]:
+    return {
+        _contract_key(contract.id): _column_values(contract),
+        _provider_key(contract.provider_id): _column_values(contract.provider),
+        _customer_key(contract.customer_id): _column_values(contract.customer),
+    }
+
+
+def _load_contract(session: Session, *criteria) -> CustomerContract | None:
+    return (
+        session.query(CustomerContract)
+        .options(
+            joinedload(CustomerContract.provider, innerjoin=True),
+            joinedload(CustomerContract.customer, innerjoin=True),
+        )
+        .filter(*criteria)
+        .first()
+    )
+
+
+def get_customer(session: Session, customer_id: int) -> ElectricityCustomer | None:
+    hit, values = _lookup(_customer_key(customer_id))
+    if hit:
+        return session.merge(_detached(ElectricityCustomer, values), load=False)
+
+    generation = _generation
+    customer = (
+        session.query(ElectricityCustomer)
+        .filter(ElectricityCustomer.id == customer_id)
+        .first()
+    )
+    if customer:
+        _store(
+            session, generation, {_customer_key(customer_id): _column_values(customer)}
+        )
+    return customer
+
+
+def get_contract(session: Session, contract_id: int) -> CustomerContract | None:
+    """Contract with its provider and customer loaded."""
+    hit_contract, contract_values = _lookup(_contract_key(contract_id))
+    if hit_contract:
+        hit_provider, provider_values = _lookup(
+            _provider_key(contract_values["provider_id"])
+        )
+        hit_customer, customer_values = _lookup(
+            _customer_key(contract_values["customer_id"])
+        )
+        if hit_provider and hit_customer:
+            contract = _detached(CustomerContract, contract_values)
+            set_committed_value(
+                contract, "provider", _detached(ElectricityProvider, provider_values)
+            )
+            set_committed_value(
+                contract, "customer", _detached(ElectricityCustomer, customer_values)
+            )
+            # merge cascades to provider and customer
+            return session.merge(contract, load=False)
+
+    generation = _generation
+    contract = _load_contract(session, CustomerContract.id == contract_id)
+    if contract:
+        _store(session, generation, _contract_values(contract))
+    return contract
+
+
+def get_active_contract(session: Session, customer_id: int) -> CustomerContract | None:
+    """Active contract of the customer, with its provider and customer loaded."""
+    key = _active_contract_key(customer_id)
+    hit, contract_id = _lookup(key)
+    if hit:
+        if contract_id is None:
+            return None
+        contract = get_contract(session, contract_id)
+        if contract and contract.termination_date is None:
+            return contract
+
+    generation = _generation
+    contract = _load_contract(
+        session,
+        CustomerContract.customer_id == customer_id,
+        CustomerContract.termination_date == None,
+    )
+    if contract:
+        values = _contract_values(contract)
+        values[key] = contract.id
+        _store(session, generation, values)
+    else:
+        _store(session, generation, {key: None})
+    return contract
+
+
+def _invalidate(session: Session, keys: list[str]):
+    """Entries are removed after the transaction commits."""
+    session.info.setdefault(PENDING_INVALIDATIONS, set()).update(keys)
+    if cache_notify:
+        # notifications are transactional, other pods receive them on commit
+        for key in keys:
+            session.execute(select(func.pg_notify(NOTIFY_CHANNEL, key)))
+
+
+def invalidate_customer(session: Session, customer_id: int):
+    _invalidate(
+        session, [_customer_key(customer_id), _active_contract_key(customer_id)]
+    )
+
+
+def invalidate_contract(session: Session, contract: CustomerContract):
+    _invalidate(
+        session,
+        [_contract_key(contract.id), _active_contract_key(contract.customer_id)],
+    )
+
+
+def invalidate_provider(session: Session, provider_id: int):
+    _invalidate(session, [_provider_key(provider_id)])
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session):
+    keys = session.info.pop(PENDING_INVALIDATIONS, None)
+    if keys:
+        _discard(keys)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _after_rollback(session: Session, previous_transaction):
+    session.info.pop(PENDING_INVALIDATIONS, None)
+
+
+def _listen():
+    while True:
+        dbapi_connection = None
+        try:
+            connection = engine.raw_connection()
+            # connection is used only for listening, it is never returned to the pool
+            connection.detach()
+            dbapi_connection = connection.dbapi_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            # notifications could be missed while not connected
+            _discard([CLEAR_ALL])
+
+            while True:
+                if select_module.select([dbapi_connection], [], [], 5) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                keys = set()
+                while dbapi_connection.notifies:
+                    keys.add(dbapi_connection.notifies.pop(0).payload)
+                if keys:
+                    _discard(keys)
+        except Exception as e:
+            log.error("Reference cache listener failed", error=str(e))
+            _discard([CLEAR_ALL])
+            if dbapi_connection is not None:
+                dbapi_connection.close()
+            time.sleep(5)
+
+
+def start_invalidation_listener():
+    if not cache_notify or cache_ttl <= 0:
+        return
+    thread = threading.Thread(
+        target=_listen, name="reference-cache-listener", daemon=True
+    )
+    thread.start()
@@ -1,8 +1,20 @@
-from datetime import datetime
+from datetime import date, datetime
+from decimal import Decimal
 from enum import Enum
 from typing import List
 
-from sqlalchemy import DateTime, Enum as SqlEnum, ForeignKey, Integer, String
+from sqlalchemy import (
+    Date,
+    DateTime,
+    Enum as SqlEnum,
+    ForeignKey,
+    Index,
+    Integer,
+    Numeric,
+    SmallInteger,
+    String,
+    text,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ..base import Base
@@ -21,11 +33,28 @@ class CustomerType(Enum):
             "residential": "Gospodinjski odjem",
             "commercial": "Poslovni odjem",
             "industrial": "Industrijski odjem",
+            "business": "Poslovni odjem",
+            "municipal": "Odjem občine",
         }[self.value]
 
 
+def _trigram_index(name: str, column: str) -> Index:
+    # used by customer search, for similarity operators and ILIKE
+    return Index(
+        name,
+        column,
+        postgresql_using="gin",
+        postgresql_ops={column: "gin_trgm_ops"},
+    )
+
+
 class ElectricityCustomer(Base, TimestampMixin):
     __tablename__ = "electricity_customers"
+    __table_args__ = (
+        _trigram_index("electricity_customers_fullname_trgm_idx", "fullname"),
+        _trigram_index("electricity_customers_email_trgm_idx", "email"),
+        _trigram_index("electricity_customers_tax_code_trgm_idx", "tax_code"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -63,10 +92,61 @@ class ElectricityProvider(Base, TimestampMixin):
         back_populates="provider",
         cascade="all, delete",
     )
+    price_schedules: Mapped[List["PriceSchedule"]] = relationship(
+        back_populates="provider",
+        cascade="all, delete",
+    )
+
+
+class PriceSchedule(Base, TimestampMixin):
+    # price per kWh of a time block level for contracts with the provider and package
+    __tablename__ = "electricity_price_schedules"
+    __table_args__ = (
+        Index(
+            "electricity_price_schedules_lookup_idx",
+            "provider_id",
+            "package_name",
+            "block_level",
+            "valid_from",
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    provider_id: Mapped[int] = mapped_column(
+        ForeignKey("electricity_providers.id", ondelete="CASCADE")
+    )
+    provider: Mapped["ElectricityProvider"] = relationship(
+        "ElectricityProvider", back_populates="price_schedules"
+    )
+
+    package_name: Mapped[str] = mapped_column(String)
+    block_level: Mapped[int] = mapped_column(SmallInteger)
+    price_per_kwh: Mapped[Decimal] = mapped_column(Numeric(10, 6))
+
+    # local days, valid_from is included and valid_to excluded, null is open ended
+    valid_from: Mapped[date] = mapped_column(Date)
+    valid_to: Mapped[date] = mapped_column(Date, nullable=True)
 
 
 class CustomerContract(Base, TimestampMixin):
     __tablename__ = "electricity_customers_contracts"
+    __table_args__ = (
+        # customer can have only one active contract
+        Index(
+            "electricity_customers_contracts_active_customer_key",
+            "customer_id",
+            unique=True,
+            postgresql_where=text("termination_date IS NULL"),
+        ),
+        _trigram_index(
+            "electricity_customers_contracts_contract_number_trgm_idx",
+            "contract_number",
+        ),
+        _trigram_index(
+            "electricity_customers_contracts_energy_meter_number_trgm_idx",
+            "energy_meter_number",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     provider_id: Mapped[int] = mapped_column(ForeignKey("electricity_providers.id"))
@@ -74,7 +154,9 @@ class CustomerContract(Base, TimestampMixin):
         "ElectricityProvider", back_populates="contracts"
     )
 
-    customer_id: Mapped[int] = mapped_column(ForeignKey("electricity_customers.id"))
+    customer_id: Mapped[int] = mapped_column(
+        ForeignKey("electricity_customers.id"), index=True
+    )
     customer: Mapped["ElectricityCustomer"] = relationship(
         "ElectricityCustomer", back_populates="contracts"
     )
@@ -0,0 +1,46 @@
+from enum import Enum
+
+from sqlalchemy import Enum as SqlEnum, ForeignKey, Index, Integer, String, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..base import Base
+from ..mixins import TimestampDBMixin
+
+
+class DocumentStatus(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class InvoiceDocument(Base, TimestampDBMixin):
+    # render job of invoice PDF document, consumed by app.cli.document_worker
+    __tablename__ = "electricity_invoices_documents"
+    __table_args__ = (
+        # workers only look for jobs that are waiting or running
+        Index(
+            "ix_electricity_invoices_documents_queued",
+            "id",
+            postgresql_where=text("status IN ('PENDING', 'RUNNING')"),
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    electricity_invoice_id: Mapped[int] = mapped_column(
+        ForeignKey("electricity_invoices.id", ondelete="CASCADE"), unique=True
+    )
+
+    status: Mapped[DocumentStatus] = mapped_column(
+        SqlEnum(
+            DocumentStatus,
+            name="electricity_invoices_documents_status",
+            native_enum=True,
+        ),
+        default=DocumentStatus.PENDING,
+    )
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    error: Mapped[str] = mapped_column(String, nullable=True)
+    # path relative to DOCUMENTS_STORAGE_PATH
+    document_path: Mapped[str] = mapped_column(String, nullable=True)
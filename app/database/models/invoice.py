@@ -1,24 +1,50 @@
 from datetime import datetime
-from typing import List
-
-from sqlalchemy import DateTime, Float, ForeignKey, Integer, String
+from decimal import Decimal
+from typing import List, TYPE_CHECKING
+
+from sqlalchemy import (
+    DateTime,
+    ForeignKey,
+    Integer,
+    Numeric,
+    String,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
 from ..base import Base
 from ..mixins import TimestampMixin
 
+if TYPE_CHECKING:
+    from .customer import CustomerContract
+
 
 class ElectricityInvoice(Base, TimestampMixin):
     __tablename__ = "electricity_invoices"
+    __table_args__ = (
+        # only one invoice can exist for a contract and service date
+        UniqueConstraint(
+            "contract_id",
+            "service_date",
+            name="electricity_invoices_contract_service_date_key",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
     contract_id: Mapped[int] = mapped_column(
         ForeignKey("electricity_customers_contracts.id")
     )
+    customer_contract: Mapped["CustomerContract"] = relationship(
+        "CustomerContract", viewonly=True
+    )
 
     invoice_number: Mapped[str] = mapped_column(String)
     issued_date: Mapped[datetime] = mapped_column(DateTime)
+    # invoiced period, service date is its last day,
+    # periods of invoices of the same contract do not overlap
+    period_start: Mapped[datetime] = mapped_column(DateTime)
     service_date: Mapped[datetime] = mapped_column(DateTime)
     location_issued: Mapped[str] = mapped_column(String)
     due_date: Mapped[datetime] = mapped_column(DateTime)
@@ -32,14 +58,22 @@ class ElectricityInvoice(Base, TimestampMixin):
     # referenca prejemnika
     receiver_reference: Mapped[str] = mapped_column(String)
 
-    base_amount: Mapped[float] = mapped_column(Float)
-    tax_amount: Mapped[float] = mapped_column(Float)
-    total_amount: Mapped[float] = mapped_column(Float)
-    total_quantity: Mapped[float] = mapped_column(Float)
+    # amounts in EUR with cents, quantities in kWh with Wh precision
+    base_amount: Mapped[Decimal] = mapped_column(Numeric(14, 2))
+    tax_amount: Mapped[Decimal] = mapped_column(Numeric(14, 2))
+    total_amount: Mapped[Decimal] = mapped_column(Numeric(14, 2))
+    total_quantity: Mapped[Decimal] = mapped_column(Numeric(14, 3))
+
+    # consumption per day and time block for the chart on the invoice document
+    usage_profile: Mapped[dict] = mapped_column(JSONB, nullable=True)
+
+    # value of Idempotency-Key header, repeated requests return the same invoice
+    idempotency_key: Mapped[str] = mapped_column(String, nullable=True, unique=True)
 
     items: Mapped[List["ElectricityInvoiceItem"]] = relationship(
         back_populates="electricity_invoice",
         cascade="all, delete",
+        order_by="ElectricityInvoiceItem.id",
     )
 
 
@@ -49,7 +83,7 @@ class ElectricityInvoiceItem(Base, TimestampMixin):
     id: Mapped[int] = mapped_column(primary_key=True)
 
     electricity_invoice_id: Mapped[int] = mapped_column(
-        ForeignKey("electricity_invoices.id")
+        ForeignKey("electricity_invoices.id"), index=True
     )
     electricity_invoice: Mapped["ElectricityInvoice"] = relationship(
         "ElectricityInvoice", back_populates="items"
@@ -57,8 +91,10 @@ class ElectricityInvoiceItem(Base, TimestampMixin):
 
     name: Mapped[str] = mapped_column(String)
     unit: Mapped[str] = mapped_column(String)
-    quantity: Mapped[int] = mapped_column(Integer)
-    amount: Mapped[float] = mapped_column(Float)
+    # level of time block for consumption items, corrections are added per block
+    time_block: Mapped[int] = mapped_column(Integer, nullable=True)
+    quantity: Mapped[Decimal] = mapped_column(Numeric(14, 3))
+    amount: Mapped[Decimal] = mapped_column(Numeric(14, 2))
 
     date_from: Mapped[datetime] = mapped_column(DateTime)
     date_to: Mapped[datetime] = mapped_column(DateTime)
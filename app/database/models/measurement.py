@@ -1,12 +1,24 @@
-from datetime import datetime
+from datetime import date, datetime
+from enum import IntEnum
 
-from sqlalchemy import DateTime, desc, ForeignKey, Float, Index
+from sqlalchemy import Date, DateTime, desc, ForeignKey, Float, Index, SmallInteger
 from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
 
 from ..base import Base
 from ..mixins import TimestampDBMixin
 
 
+# time blocks, months and days of measurements are in local time of the meters
+LOCAL_TIMEZONE = "Europe/Ljubljana"
+
+
+class MeasurementDayType(IntEnum):
+    # stored as smallint, same days as SeasonDayType
+    WORKDAY = 0
+    OFFDAY = 1
+
+
 class ElectricityUsage(Base, TimestampDBMixin):
     __tablename__ = "measurements_electricity_usage"
 
@@ -18,4 +30,25 @@ class ElectricityUsage(Base, TimestampDBMixin):
     )
 
     consumption_kwh: Mapped[float] = mapped_column(Float)
-    price_per_kwh: Mapped[float] = mapped_column(Float)
+    # null when the price is resolved from price schedules of the contract
+    price_per_kwh: Mapped[float] = mapped_column(Float, nullable=True)
+
+    # resolved in LOCAL_TIMEZONE when measurements are uploaded
+    local_hour: Mapped[int] = mapped_column(SmallInteger)
+    day_type: Mapped[int] = mapped_column(SmallInteger)
+    # level of time block, null when time blocks do not cover the measurement
+    block_level: Mapped[int] = mapped_column(SmallInteger, nullable=True)
+
+
+class MeasurementDirtyWindow(Base):
+    # customer months with measurements changed after they could have been invoiced
+    __tablename__ = "measurements_dirty_windows"
+
+    customer_id: Mapped[int] = mapped_column(
+        ForeignKey("electricity_customers.id", ondelete="CASCADE"), primary_key=True
+    )
+    # first day of the month
+    month: Mapped[date] = mapped_column(Date, primary_key=True)
+    marked_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
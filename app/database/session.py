@@ -1,14 +1,142 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import math
 import os
+import threading
+import time
+
 from dotenv import load_dotenv
+from fastapi import Request
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import sessionmaker
+
+from app.database.models.measurement import LOCAL_TIMEZONE
 
 load_dotenv()
 
 debug_queries = os.getenv("DEBUG_QUERIES", "false").lower() == "true"
+# optional streaming replica for read-only endpoints
+replica_uri = os.getenv("DATABASE_REPLICA_URI")
+# replica is not used while it is more seconds behind the primary
+replica_max_lag = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+# queries on the replica are cancelled after this many seconds, 0 disables the limit
+replica_statement_timeout = float(os.getenv("REPLICA_STATEMENT_TIMEOUT_SECONDS", "30"))
+# unreachable replica fails fast, reads then fall back to the primary
+REPLICA_CONNECT_TIMEOUT = 2
+# seconds between checks of the replay position of the replica
+REPLICA_CHECK_INTERVAL = 1.0
+# time of the last write of a client, its reads stay on the primary until the replica has it
+LAST_WRITE_COOKIE = "db_last_write"
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+# key inside session.info of sessions bound to the replica
+REPLICA_SESSION = "replica"
+
+# received WAL is compared with replayed WAL, an idle primary has no new transactions to replay,
+# a server that is not in recovery is the primary itself
+REPLAY_POSITION = text("""
+    SELECT EXTRACT(EPOCH FROM now()) AS checked_at,
+        NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() AS caught_up,
+        EXTRACT(EPOCH FROM pg_last_xact_replay_timestamp()) AS replayed_at
+""")
+
+
+def _create_engine(uri: str, options: str = "", **connect_args):
+    # dates and months of measurements do not depend on the timezone of the database server
+    return create_engine(
+        uri,
+        echo=debug_queries,
+        connect_args={
+            "options": f"-c timezone={LOCAL_TIMEZONE} {options}".strip(),
+            **connect_args,
+        },
+    )
+
+
+engine = _create_engine(os.getenv("DATABASE_URI"))
+# committed objects are returned by endpoints without reading them again
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
+
+replica_engine = (
+    _create_engine(
+        replica_uri,
+        options=f"-c statement_timeout={int(replica_statement_timeout * 1000)}",
+        connect_timeout=REPLICA_CONNECT_TIMEOUT,
+    )
+    if replica_uri
+    else None
+)
+ReplicaSessionLocal = (
+    sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        expire_on_commit=False,
+        bind=replica_engine,
+        info={REPLICA_SESSION: True},
+    )
+    if replica_engine
+    else None
+)
+
+
+class ReplicaStatus:
+    """
+    Replay position of the replica, as wall clock time up to which
+    transactions of the primary are visible on it. Checked at most once per interval,
+    None when the replica is not reachable.
+    One thread checks the replica, others use the last value in the meantime.
+    """
+
+    def __init__(self, replica_engine, interval: float):
+        self.engine = replica_engine
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._checked_at = -math.inf
+        self._replayed_until = None
+
+    def replayed_until(self) -> float | None:
+        # lock is only taken without waiting, requests never wait for the replica
+        if self._expired() and self._lock.acquire(blocking=False):
+            try:
+                # another thread could have checked it before the lock was taken
+                if self._expired():
+                    self._replayed_until = self._check()
+                    self._checked_at = time.monotonic()
+            finally:
+                self._lock.release()
+        return self._replayed_until
 
-engine = create_engine(os.getenv("DATABASE_URI"), echo=debug_queries)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    def _expired(self) -> bool:
+        return time.monotonic() - self._checked_at >= self.interval
+
+    def _check(self) -> float | None:
+        try:
+            with self.engine.connect() as connection:
+                row = connection.execute(REPLAY_POSITION).one()
+        except SQLAlchemyError:
+            return None
+        if row.caught_up:
+            return float(row.checked_at)
+        return float(row.replayed_at) if row.replayed_at is not None else None
+
+
+replica_status = (
+    ReplicaStatus(replica_engine, REPLICA_CHECK_INTERVAL) if replica_engine else None
+)
+
+
+def replica_usable(
+    replayed_until: float | None, last_write: str | None, now: float
+) -> bool:
+    # replica has to be within the allowed lag and contain the last write of the client
+    if replayed_until is None or now - replayed_until > replica_max_lag:
+        return False
+    try:
+        written_at = float(last_write) if last_write else 0.0
+    except ValueError:
+        written_at = 0.0
+    return replayed_until >= written_at
 
 
 def get_db():
@@ -17,3 +145,38 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_db_readonly(request: Request):
+    """
+    Session for endpoints that only read, on the replica when it is configured,
+    not lagging behind and already has the last write of the client,
+    otherwise on the primary.
+    """
+    use_replica = replica_status is not None and replica_usable(
+        replica_status.replayed_until(),
+        request.cookies.get(LAST_WRITE_COOKIE),
+        time.time(),
+    )
+    db = ReplicaSessionLocal() if use_replica else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def last_write_middleware(request: Request, call_next):
+    # successful writes are remembered by the client, for read-after-write on the primary
+    response = await call_next(request)
+    if (
+        replica_status is not None
+        and request.method not in READ_METHODS
+        and response.status_code < 400
+    ):
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            f"{time.time():.3f}",
+            max_age=math.ceil(replica_max_lag) + 1,
+            httponly=True,
+        )
+    return response
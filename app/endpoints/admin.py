@@ -0,0 +1,55 @@
+import asyncio
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse
+
+from app.utils.admin import require_admin
+from app.utils.profiling import Profile, profile_route, sampler
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"],
+    dependencies=[Depends(require_admin)],
+)
+
+
+@router.post("/profiling/sample", response_class=PlainTextResponse)
+async def profile_process(seconds: Annotated[float, Query(gt=0, le=120)] = 10):
+    # all threads of this worker process, returned in collapsed stack format
+    profile = Profile()
+    sampler.subscribe(profile)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.unsubscribe(profile)
+
+    return PlainTextResponse(
+        profile.collapsed(), headers={"X-Profile-Samples": str(profile.samples)}
+    )
+
+
+@router.post("/profiling/requests", response_class=PlainTextResponse)
+async def profile_requests(
+    request: Request,
+    route: Annotated[str, Query(description="route path, for example /invoices")],
+    method: str | None = None,
+    requests: Annotated[int, Query(gt=0, le=1000)] = 10,
+    timeout: Annotated[float, Query(gt=0, le=600)] = 60,
+):
+    if route not in request.app.openapi()["paths"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Route not found"
+        )
+
+    # only requests handled by this worker process are profiled
+    route_profiling = await profile_route(
+        route, method.upper() if method else None, requests, timeout
+    )
+    return PlainTextResponse(
+        route_profiling.profile.collapsed(),
+        headers={
+            "X-Profile-Samples": str(route_profiling.profile.samples),
+            "X-Profiled-Requests": str(route_profiling.profiled),
+        },
+    )
@@ -1,21 +1,55 @@
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
-from sqlalchemy.orm import Session
-
-from app.database.session import get_db
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    HTTPException,
+    Query,
+    status,
+    UploadFile,
+)
+from pydantic import AwareDatetime
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, Session
+
+from app.database.cache import (
+    get_active_contract,
+    get_customer,
+    invalidate_contract,
+    invalidate_customer,
+)
+from app.database.session import get_db, get_db_readonly
 from app.database.models.customer import (
     ElectricityCustomer,
     CustomerContract,
-    ElectricityProvider,
 )
 from app.schema.customer import (
     CustomerCreate,
     CustomerUpdate,
     CustomerContractCreate,
     CustomerContractUpdate,
+    CustomerContractResponse,
+    CustomerDetailResponse,
+    CustomerImportResponse,
+    CustomerResponse,
+    CustomerSearchResult,
+)
+from app.schema.measurement import ConsumptionBucket, ConsumptionSeriesResponse
+from app.utils.constraints import raise_constraint_error
+from app.utils.consumption_series import (
+    MAX_SERIES_BUCKETS,
+    consumption_series,
+    series_bucket_count,
 )
+from app.utils.customer_import import (
+    MAX_REPORTED_ERRORS,
+    merge_customer_import,
+    parse_customer_import,
+    stage_customer_import,
+)
+from app.utils.customer_search import MIN_QUERY_LENGTH, search_customers
 
 
 router = APIRouter(
@@ -24,76 +58,181 @@ router = APIRouter(
 )
 
 
-@router.get("/")
-def all_customers(session: Session = Depends(get_db)):
+@router.get("/", response_model=list[CustomerResponse])
+def all_customers(session: Session = Depends(get_db_readonly)):
     return session.execute(select(ElectricityCustomer)).scalars().all()
 
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=CustomerResponse)
 def create_customer(
     data: CustomerCreate,
     session: Session = Depends(get_db),
 ):
-    db_item = ElectricityCustomer(
-        fullname=data.fullname,
-        email=data.email,
-        tax_code=data.tax_code,
-        zip_name=data.zip_name,
-        zip_code=data.zip_code,
-        street_address=data.street_address,
-    )
-    session.add(db_item)
+    db_item = session.scalars(
+        insert(ElectricityCustomer)
+        .values(
+            fullname=data.fullname,
+            email=data.email,
+            tax_code=data.tax_code,
+            zip_name=data.zip_name,
+            zip_code=data.zip_code,
+            street_address=data.street_address,
+        )
+        .returning(ElectricityCustomer)
+    ).one()
     session.commit()
-    session.refresh(db_item)
     return db_item
 
 
-@router.get("/{customer_id}")
-def customer_details(customer_id: int, session: Session = Depends(get_db)):
-    customer_item = (
-        session.query(ElectricityCustomer)
-        .filter(ElectricityCustomer.id == customer_id)
-        .first()
+@router.post(
+    "/import",
+    status_code=status.HTTP_201_CREATED,
+    response_model=CustomerImportResponse,
+)
+def import_customers(
+    file: UploadFile = File(...),
+    session: Session = Depends(get_db),
+):
+    filename = file.filename.lower()
+    if filename.endswith(".csv"):
+        ndjson = False
+    elif filename.endswith((".ndjson", ".jsonl")):
+        ndjson = True
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only CSV and NDJSON files are allowed",
+        )
+
+    parsed = parse_customer_import(file.file, ndjson)
+    if parsed.error_count:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={
+                "message": f"Import file has {parsed.error_count} invalid rows",
+                "errors": [error._asdict() for error in parsed.errors],
+            },
+        )
+    if parsed.contracts == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Import file has no rows",
+        )
+
+    try:
+        errors = stage_customer_import(session, parsed)
+        if errors:
+            session.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail={
+                    "message": f"Import file has {len(errors)} conflicting rows",
+                    "errors": [
+                        error._asdict() for error in errors[:MAX_REPORTED_ERRORS]
+                    ],
+                },
+            )
+        merge_customer_import(session)
+        # existing customers could have a cached missing active contract
+        for customer_id in parsed.existing_customer_ids:
+            invalidate_customer(session, customer_id)
+        session.commit()
+    except IntegrityError as e:
+        # concurrent writes are still caught by constraints
+        session.rollback()
+        raise_constraint_error(e)
+
+    return CustomerImportResponse(
+        customers_created=parsed.customers, contracts_created=parsed.contracts
     )
+
+
+@router.get("/search", response_model=list[CustomerSearchResult])
+def customers_search(
+    q: str = Query(min_length=MIN_QUERY_LENGTH, max_length=200),
+    limit: int = Query(default=20, ge=1, le=100),
+    session: Session = Depends(get_db_readonly),
+):
+    return search_customers(session, q, limit)
+
+
+@router.get("/{customer_id}", response_model=CustomerDetailResponse)
+def customer_details(customer_id: int, session: Session = Depends(get_db_readonly)):
+    customer_item = get_customer(session, customer_id)
     if not customer_item:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Customer not found"
         )
 
-    active_contract = (
-        session.query(CustomerContract)
-        .filter(CustomerContract.customer_id == customer_id)
-        .filter(CustomerContract.termination_date == None)
-        .first()
-    )
+    active_contract = get_active_contract(session, customer_id)
     if active_contract:
         customer_item.active_contract = active_contract
 
     return customer_item
 
 
-@router.put("/{customer_id}")
+@router.get("/{customer_id}/consumption", response_model=ConsumptionSeriesResponse)
+def customer_consumption(
+    customer_id: int,
+    start_at: AwareDatetime = Query(alias="from"),
+    end_at: AwareDatetime = Query(alias="to"),
+    bucket: ConsumptionBucket = ConsumptionBucket.HOUR,
+    max_points: int | None = Query(default=None, ge=3, le=10_000),
+    session: Session = Depends(get_db_readonly),
+):
+    # range start is included and end excluded
+    if start_at >= end_at:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Range start must be before its end",
+        )
+    if series_bucket_count(start_at, end_at, bucket) > MAX_SERIES_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range has more than {MAX_SERIES_BUCKETS} buckets, use larger buckets",
+        )
+    if not get_customer(session, customer_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Customer not found"
+        )
+
+    series = consumption_series(
+        session, customer_id, start_at, end_at, bucket, max_points
+    )
+    return ConsumptionSeriesResponse(
+        customer_id=customer_id,
+        bucket=bucket,
+        timestamps=series.timestamps,
+        consumption_kwh=series.consumption_kwh,
+        buckets=series.buckets,
+        downsampled=len(series.timestamps) < series.buckets,
+    )
+
+
+@router.put("/{customer_id}", response_model=CustomerResponse)
 def update_customer(
     customer_id: int, data: CustomerUpdate, session: Session = Depends(get_db)
 ):
-    db_item = (
-        session.query(ElectricityCustomer)
-        .filter(ElectricityCustomer.id == customer_id)
-        .first()
-    )
+    db_item = session.scalars(
+        update(ElectricityCustomer)
+        .where(ElectricityCustomer.id == customer_id)
+        .values(
+            fullname=data.fullname,
+            email=data.email,
+            tax_code=data.tax_code,
+            zip_name=data.zip_name,
+            zip_code=data.zip_code,
+            street_address=data.street_address,
+        )
+        .returning(ElectricityCustomer)
+    ).first()
     if not db_item:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Customer not found"
         )
-    db_item.fullname = data.fullname
-    db_item.email = data.email
-    db_item.tax_code = data.tax_code
-    db_item.zip_name = data.zip_name
-    db_item.zip_code = data.zip_code
-    db_item.street_address = data.street_address
+    invalidate_customer(session, customer_id)
 
     session.commit()
-    session.refresh(db_item)
     return db_item
 
 
@@ -110,138 +249,118 @@ def delete_customer(customer_id: int, session: Session = Depends(get_db)):
         )
 
     session.delete(db_item)
+    invalidate_customer(session, customer_id)
     session.commit()
 
 
-@router.post("/{customer_id}/electricity_contract", status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/{customer_id}/electricity_contract",
+    status_code=status.HTTP_201_CREATED,
+    response_model=CustomerContractResponse,
+)
 def create_customer_contract(
     customer_id: int,
     data: CustomerContractCreate,
     session: Session = Depends(get_db),
 ):
-    customer_item = (
-        session.query(ElectricityCustomer)
-        .filter(ElectricityCustomer.id == customer_id)
-        .first()
-    )
-    if not customer_item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Customer not found"
-        )
-
-    active_contract = (
-        session.query(CustomerContract)
-        .filter(CustomerContract.customer_id == customer_id)
-        .filter(CustomerContract.termination_date == None)
-        .first()
-    )
-    if active_contract:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Active contract for customer already exists",
-        )
-
-    existing_contract_number = (
-        session.query(CustomerContract)
-        .filter(CustomerContract.contract_number == data.contract_number)
-        .first()
-    )
-    if existing_contract_number:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Contract number already exits. Contract number must be unique over all users",
-        )
-
-    db_item = CustomerContract(
-        customer_id=customer_id,
-        provider_id=data.provider_id,
-        customer_type=data.customer_type,
-        contract_number=data.contract_number,
-        energy_meter_number=data.energy_meter_number,
-        package_name=data.package_name,
-    )
-
-    session.add(db_item)
-    session.commit()
-    session.refresh(db_item)
+    # missing customer, active contract and used contract number are reported by constraints
+    try:
+        db_item = session.scalars(
+            insert(CustomerContract)
+            .values(
+                customer_id=customer_id,
+                provider_id=data.provider_id,
+                customer_type=data.customer_type,
+                contract_number=data.contract_number,
+                energy_meter_number=data.energy_meter_number,
+                package_name=data.package_name,
+            )
+            .returning(CustomerContract)
+        ).one()
+        invalidate_contract(session, db_item)
+        session.commit()
+    except IntegrityError as e:
+        session.rollback()
+        raise_constraint_error(e)
     return db_item
 
 
-@router.put("/{customer_id}/electricity_contract/{contract_id}")
+@router.put(
+    "/{customer_id}/electricity_contract/{contract_id}",
+    response_model=CustomerContractResponse,
+)
 def update_customer_contract(
     customer_id: int,
     contract_id: int,
     data: CustomerContractUpdate,
     session: Session = Depends(get_db),
 ):
-    customer_item = (
-        session.query(ElectricityCustomer)
-        .filter(ElectricityCustomer.id == customer_id)
-        .first()
-    )
-    if not customer_item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Customer not found"
-        )
-
-    db_item = (
-        session.query(CustomerContract)
-        .filter(CustomerContract.id == contract_id)
-        .first()
-    )
-    if not db_item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Customer contract not found"
-        )
-
-    existing_contract_number = (
-        session.query(CustomerContract)
-        .filter(CustomerContract.contract_number == data.contract_number)
-        .filter(CustomerContract.id != data.customer_id)
-        .first()
-    )
-    if existing_contract_number:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Contract number already exits. Contract number must be unique over all users",
-        )
-
-    db_item.customer_id = customer_id
-    db_item.provider_id = data.provider_id
-    db_item.customer_type = data.customer_type
-    db_item.contract_number = data.contract_number
-    db_item.energy_meter_number = data.energy_meter_number
-    db_item.package_name = data.customer_typackage_namepe
-
-    session.commit()
-    session.refresh(db_item)
+    # contract could be moved to a different customer, previous row gives its customer
+    previous = aliased(CustomerContract)
+    try:
+        row = session.execute(
+            update(CustomerContract)
+            .where(CustomerContract.id == contract_id)
+            .where(previous.id == CustomerContract.id)
+            .values(
+                customer_id=customer_id,
+                provider_id=data.provider_id,
+                customer_type=data.customer_type,
+                contract_number=data.contract_number,
+                energy_meter_number=data.energy_meter_number,
+                package_name=data.package_name,
+            )
+            .returning(CustomerContract, previous.customer_id)
+        ).first()
+        if not row:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Customer contract not found",
+            )
+        db_item, previous_customer_id = row
+        invalidate_contract(session, db_item)
+        if previous_customer_id != customer_id:
+            invalidate_customer(session, previous_customer_id)
+        session.commit()
+    except IntegrityError as e:
+        session.rollback()
+        raise_constraint_error(e)
     return db_item
 
 
-@router.post("/{customer_id}/electricity_contract/{contract_id}/terminate")
+@router.post(
+    "/{customer_id}/electricity_contract/{contract_id}/terminate",
+    response_model=CustomerContractResponse,
+)
 def terminate_customer_contract(
     customer_id: int,
     contract_id: int,
     session: Session = Depends(get_db),
 ):
-    db_item = (
-        session.query(CustomerContract)
-        .filter(CustomerContract.id == contract_id)
-        .first()
-    )
+    db_item = session.scalars(
+        update(CustomerContract)
+        .where(CustomerContract.id == contract_id)
+        .where(CustomerContract.termination_date == None)
+        .values(termination_date=datetime.now())
+        .returning(CustomerContract)
+    ).first()
     if not db_item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Customer contract not found"
+        # only failed requests read the contract again, to tell the reason
+        terminated = session.scalar(
+            select(CustomerContract.termination_date != None).where(
+                CustomerContract.id == contract_id
+            )
         )
-
-    if db_item.termination_date is not None:
+        if terminated is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Customer contract not found",
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Contract already terminated",
         )
-
-    db_item.termination_date = datetime.now()
+    invalidate_contract(session, db_item)
 
     session.commit()
-    session.refresh(db_item)
     return db_item
@@ -1,222 +1,289 @@
-from collections import defaultdict
-from datetime import date
 import io
+import os
+from typing import Annotated
 
-from dateutil.relativedelta import relativedelta
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse
-from jinja2 import Environment, FileSystemLoader
-from sqlalchemy import extract, select
-from sqlalchemy.orm import Session, joinedload, selectinload
-from weasyprint import HTML
-
-from app.database.models.configuration import SeasonDayType
-from app.database.models.customer import ElectricityCustomer, CustomerContract
-from app.database.models.invoice import ElectricityInvoice, ElectricityInvoiceItem
-from app.database.models.measurement import ElectricityUsage
-from app.database.session import get_db
-from app.schema.invoice import CreateInvoice
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database.cache import get_active_contract, get_customer
+from app.database.models.document import DocumentStatus, InvoiceDocument
+from app.database.models.invoice import ElectricityInvoice
+from app.database.session import get_db, get_db_readonly
+from app.schema.invoice import (
+    CreateInvoice,
+    InvoiceCorrectionResponse,
+    InvoiceDetailResponse,
+    InvoiceDocumentResponse,
+    InvoiceResponse,
+)
+from app.utils.document import (
+    documents_storage_path,
+    invoice_document_filename,
+    invoice_document_storage_name,
+    invoice_render_data,
+    render_invoice_pdf,
+)
+from app.utils.constraints import raise_constraint_error
+from app.utils.document_queue import enqueue_document, find_document
+from app.utils.invoice_corrections import (
+    clear_dirty_windows,
+    find_corrected_invoices,
+    recompute_corrected_invoices,
+)
 from app.utils.invoice import (
-    calculate_measurements_total_usage,
-    calculate_measurements_time_block_usage,
+    UnpricedMeasurementsError,
+    build_invoice,
+    find_period_invoice,
+    load_invoices_with_details,
+    lock_invoice_period,
 )
-from app.utils.serialization import orm_object_to_dict_exclude_default
 
 router = APIRouter(
     prefix="/invoices",
     tags=["Electricity Invoices"],
 )
 
+# inline renders documents inside the API process,
+# queue leaves rendering to workers started with app.cli.document_worker
+pdf_render_mode = os.getenv("PDF_RENDER_MODE", "inline").lower()
+# inline rendering only reads, while queued documents are written by the API
+get_document_db = get_db if pdf_render_mode == "queue" else get_db_readonly
+
 
-@router.get("/")
-def all_invoices(session: Session = Depends(get_db)):
+@router.get("/", response_model=list[InvoiceResponse])
+def all_invoices(session: Session = Depends(get_db_readonly)):
     return session.execute(select(ElectricityInvoice)).scalars().all()
 
 
-@router.post("", status_code=status.HTTP_201_CREATED)
+@router.post("", status_code=status.HTTP_201_CREATED, response_model=InvoiceResponse)
 def create_invoice_record(
     data: CreateInvoice,
+    response: Response,
+    idempotency_key: Annotated[str | None, Header()] = None,
     session: Session = Depends(get_db),
 ):
-    customer = (
-        session.query(ElectricityCustomer)
-        .filter(ElectricityCustomer.id == data.customer_id)
-        .first()
-    )
+    # retried request, invoice was already created, nothing is recalculated
+    if idempotency_key:
+        invoice = (
+            session.query(ElectricityInvoice)
+            .filter(ElectricityInvoice.idempotency_key == idempotency_key)
+            .first()
+        )
+        if invoice:
+            response.status_code = status.HTTP_200_OK
+            return invoice
+
+    customer = get_customer(session, data.customer_id)
     if not customer:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Customer not found"
         )
 
-    customer_contract = (
-        session.query(CustomerContract)
-        .options(joinedload(CustomerContract.provider, innerjoin=True))
-        .filter(CustomerContract.customer_id == data.customer_id)
-        .filter(CustomerContract.termination_date == None)
-        .first()
-    )
+    customer_contract = get_active_contract(session, data.customer_id)
     if not customer_contract:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Customer does not have an active contract",
         )
 
-    count = (
-        session.query(ElectricityUsage)
-        .filter(
-            extract("year", ElectricityUsage.measured_at) == data.year,
-            extract("month", ElectricityUsage.measured_at) == data.month,
-        )
-        .count()
+    # concurrent duplicate requests wait for the first one and then return its invoice
+    period_start, service_date = data.invoice_period
+    lock_invoice_period(session, customer_contract.id)
+    invoice = find_period_invoice(
+        session, customer_contract.id, period_start, service_date
     )
-    if count == 0:
+    if invoice:
+        same_period = (
+            invoice.period_start.date() == period_start
+            and invoice.service_date.date() == service_date
+        )
+        if not same_period:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Invoice for an overlapping period already exists",
+            )
+        if idempotency_key and invoice.idempotency_key != idempotency_key:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Invoice for the selected period already exists",
+            )
+        response.status_code = status.HTTP_200_OK
+        return invoice
+
+    clear_dirty_windows(session, data.customer_id, period_start, service_date)
+    try:
+        invoice = build_invoice(session, customer_contract, data)
+    except UnpricedMeasurementsError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"{e.count} measurements of the period have no price and no price schedule",
+        )
+    # usage is read once, period without measurements has no time blocks
+    if not invoice.usage_profile["time_blocks"]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No invoice records found for the selected time range",
         )
+    invoice.idempotency_key = idempotency_key
 
-    total_price, total_consumption = calculate_measurements_total_usage(
-        session, data.year, data.month, customer.id
-    )
-    timeblock_usage = calculate_measurements_time_block_usage(
-        session, data.year, data.month, customer.id
-    )
+    # invoice and its items are inserted with RETURNING, session does not expire them
+    session.add(invoice)
+    try:
+        session.commit()
+    except IntegrityError as e:
+        session.rollback()
+        raise_constraint_error(e)
+    return invoice
 
-    issued_date = date.today()
-    due_date = issued_date + relativedelta(days=data.days_payment_due)
-    start_date = date(data.year, data.month, 1)
-    service_date = start_date + relativedelta(months=1) - relativedelta(days=1)
-
-    base_amount = total_price
-    tax_amount = total_price * 0.22
-    total_amount = base_amount + tax_amount
-
-    invoice = ElectricityInvoice(
-        contract_id=customer_contract.id,
-        payment_reason=data.payment_reason,
-        receiver_reference=data.receiver_reference,
-        invoice_number=data.invoice_number,
-        location_issued=data.location_issued,
-        invoice_code=data.invoice_code,
-        receiver_IBAN=customer_contract.provider.iban_number,
-        due_date=issued_date,
-        issued_date=due_date,
-        service_date=service_date,
-        base_amount=base_amount,
-        tax_amount=tax_amount,
-        total_amount=total_amount,
-        total_quantity=total_consumption,
-    )
 
-    session.add(invoice)
-    session.flush()
-
-    for item in timeblock_usage:
-        invoice_item = ElectricityInvoiceItem(
-            electricity_invoice_id=invoice.id,
-            name="Časovni block " + str(item["time_block"]),
-            unit="kWh",
-            quantity=item["consumption"],
-            amount=item["price"],
-            date_from=item["start_date"],
-            date_to=item["end_date"],
-        )
-        session.add(invoice_item)
+@router.get("/corrections", response_model=list[InvoiceCorrectionResponse])
+def corrected_invoices(
+    limit: Annotated[int | None, Query(gt=0)] = None,
+    session: Session = Depends(get_db_readonly),
+):
+    # invoices with measurements changed after they were calculated
+    return find_corrected_invoices(session, limit)
+
 
+@router.post("/corrections", response_model=list[InvoiceDetailResponse])
+def recompute_invoice_corrections(
+    limit: Annotated[int, Query(gt=0, le=1000)] = 100,
+    session: Session = Depends(get_db),
+):
+    # only a batch of invoices is corrected, request is repeated until list is empty
+    try:
+        invoices = recompute_corrected_invoices(session, limit)
+    except UnpricedMeasurementsError as e:
+        session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "message": f"{e.count} measurements have no price and no price schedule",
+                "invoice_ids": e.invoice_ids,
+            },
+        )
     session.commit()
-    session.refresh(invoice)
-    return invoice
+    return invoices
 
 
-@router.get("/{invoice_id}")
+@router.get("/{invoice_id}", response_model=InvoiceDetailResponse)
 def get_invoice_details(
     invoice_id: int,
-    session: Session = Depends(get_db),
+    session: Session = Depends(get_db_readonly),
 ):
-    invoice = (
-        session.query(ElectricityInvoice)
-        .options(selectinload(ElectricityInvoice.items))
-        .filter(ElectricityInvoice.id == invoice_id)
-        .first()
-    )
+    invoice = load_invoices_with_details(session, [invoice_id]).get(invoice_id)
     if not invoice:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invoice not found"
         )
+    return invoice
+
 
-    customer_contract = (
-        session.query(CustomerContract)
-        .options(
-            joinedload(CustomerContract.provider), joinedload(CustomerContract.customer)
+def _render_document_inline(invoice: ElectricityInvoice):
+    customer_contract = invoice.customer_contract
+    if not customer_contract:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Customer contract for invoice does not exists",
         )
-        .filter(CustomerContract.id == invoice.contract_id)
-        .first()
+
+    pdf_buffer = io.BytesIO(
+        render_invoice_pdf(invoice_render_data(invoice, customer_contract))
     )
-    if customer_contract:
-        invoice.customer_contract = customer_contract
 
-    return invoice
+    filename = invoice_document_filename(invoice)
+    return StreamingResponse(
+        pdf_buffer,
+        media_type="application/pdf",
+        headers={"Content-Disposition": "attachment; filename=" + filename},
+    )
 
 
-@router.post("/{invoice_id}/document")
-def create_invoice_pdf_document(
-    invoice_id: int,
-    session: Session = Depends(get_db),
+def _queued_document_response(
+    session: Session, invoice: ElectricityInvoice, document: InvoiceDocument
 ):
-    environment = Environment(loader=FileSystemLoader("templates"))
-    report = environment.get_template("electricity_invoice.html")
+    if document.status == DocumentStatus.DONE:
+        path = documents_storage_path / document.document_path
+        if path.exists():
+            return FileResponse(
+                path,
+                media_type="application/pdf",
+                filename=invoice_document_filename(invoice),
+            )
+        # shared storage was cleared, document is rendered again
+        document = enqueue_document(session, invoice.id, rerender=True)
+        session.commit()
 
-    invoice = (
-        session.query(ElectricityInvoice)
-        .options(selectinload(ElectricityInvoice.items))
-        .filter(ElectricityInvoice.id == invoice_id)
-        .first()
+    if document.status == DocumentStatus.FAILED:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Document rendering failed: " + (document.error or ""),
+        )
+
+    # document is not rendered yet, client polls the location
+    return ORJSONResponse(
+        InvoiceDocumentResponse.model_validate(document).model_dump(mode="json"),
+        status_code=status.HTTP_202_ACCEPTED,
+        headers={"Location": router.prefix + f"/{invoice.id}/document"},
     )
+
+
+def _document_invoice(session: Session, invoice_id: int) -> ElectricityInvoice:
+    # items and contract are only needed when document is rendered by the API
+    if pdf_render_mode != "queue":
+        invoice = load_invoices_with_details(session, [invoice_id]).get(invoice_id)
+    else:
+        invoice = (
+            session.query(ElectricityInvoice)
+            .filter(ElectricityInvoice.id == invoice_id)
+            .first()
+        )
     if not invoice:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invoice not found"
         )
+    return invoice
 
-    customer_contract = (
-        session.query(CustomerContract)
-        .options(
-            joinedload(CustomerContract.provider, innerjoin=True),
-            joinedload(CustomerContract.customer, innerjoin=True),
-        )
-        .filter(CustomerContract.id == invoice.contract_id)
-        .first()
-    )
-    if not customer_contract:
+
+@router.post(
+    "/{invoice_id}/document",
+    responses={status.HTTP_202_ACCEPTED: {"model": InvoiceDocumentResponse}},
+)
+def create_invoice_pdf_document(
+    invoice_id: int,
+    session: Session = Depends(get_document_db),
+):
+    invoice = _document_invoice(session, invoice_id)
+    if pdf_render_mode != "queue":
+        return _render_document_inline(invoice)
+
+    document = enqueue_document(session, invoice.id)
+    session.commit()
+    return _queued_document_response(session, invoice, document)
+
+
+@router.get(
+    "/{invoice_id}/document",
+    responses={status.HTTP_202_ACCEPTED: {"model": InvoiceDocumentResponse}},
+)
+def get_invoice_pdf_document(
+    invoice_id: int,
+    session: Session = Depends(get_document_db),
+):
+    invoice = _document_invoice(session, invoice_id)
+    if pdf_render_mode != "queue":
+        return _render_document_inline(invoice)
+
+    document = find_document(session, invoice.id)
+    if not document:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Customer contract for invoice does not exists",
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document for invoice was not requested",
         )
-
-    invoice_template_data = orm_object_to_dict_exclude_default(invoice, ["contract_id"])
-    invoice_template_data["invoice_items"] = [
-        orm_object_to_dict_exclude_default(item) for item in invoice.items
-    ]
-
-    render_data = {
-        "invoice": invoice_template_data,
-        "contract": orm_object_to_dict_exclude_default(
-            customer_contract, ["customer_id", "provider_id", "termination_date"]
-        ),
-        "provider": orm_object_to_dict_exclude_default(customer_contract.provider),
-        "customer": orm_object_to_dict_exclude_default(customer_contract.customer),
-    }
-
-    pdf_buffer = io.BytesIO()
-    HTML(string=report.render(render_data)).write_pdf(pdf_buffer)
-    pdf_buffer.seek(0)
-
-    filename = "Racun_" + invoice.invoice_number + ".pdf"
-    # Step 3: Return as StreamingResponse
-    return StreamingResponse(
-        pdf_buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": "attachment; filename=" + filename},
-    )
+    return _queued_document_response(session, invoice, document)
 
 
 @router.delete("/{invoice_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -233,3 +300,8 @@ def delete_invoice(invoice_id: int, session: Session = Depends(get_db)):
 
     session.delete(db_item)
     session.commit()
+
+    # render job is removed by the database, stored document is removed here
+    (documents_storage_path / invoice_document_storage_name(invoice_id)).unlink(
+        missing_ok=True
+    )
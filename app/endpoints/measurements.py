@@ -1,23 +1,44 @@
 from datetime import datetime
-from io import StringIO
-import re
 from typing import Optional
 
 from fastapi import APIRouter, Depends, File, HTTPException, status, UploadFile
-import pandas as pd
-from sqlalchemy import extract, func, select
+import psycopg2
+from sqlalchemy import extract, func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+import structlog
 
-from app.database.models.customer import ElectricityCustomer
-from app.database.session import get_db
+from app.database.cache import get_active_contract, get_customer
+from app.database.session import get_db, get_db_readonly
 from app.database.models.measurement import ElectricityUsage
 from app.schema.custom_type import MonthType, YearType
 from app.schema.measurement import (
+    MeasurementBulkDeleteRequest,
+    MeasurementBulkDeleteResponse,
     MeasurementDeleteRequests,
     MeasurementCreateResponse,
     MeasurementDeleteResponse,
     MeasurementStatsResponse,
 )
+from app.utils.constraints import raise_constraint_error
+from app.utils.invoice import count_unpriced_measurements, load_block_levels
+from app.utils.invoice_corrections import mark_dirty_windows
+from app.utils.measurement_csv import (
+    DECOMPRESSION_ERRORS,
+    MAX_DECOMPRESSED_SIZE,
+    MEASUREMENT_COPY_COLUMNS,
+    MEASUREMENT_FILENAME,
+    DecompressedSizeError,
+    decompressed_stream,
+    parse_measurements_csv,
+)
+from app.utils.measurement_removal import (
+    delete_measurements,
+    drop_covered_chunks,
+    timescaledb_available,
+)
+
+log = structlog.get_logger()
 
 router = APIRouter(
     prefix="/measurements",
@@ -30,87 +51,139 @@ def upload_csv(
     file: UploadFile = File(...),
     session: Session = Depends(get_db),
 ):
-    if not file.filename.endswith(".csv"):
+    filename = file.filename.lower()
+    if not filename.endswith((".csv", ".csv.gz", ".csv.zst")):
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Only CSV files are allowed"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only CSV files are allowed, optionally compressed with gzip or zstd",
         )
 
-    regex_customer_id = re.search(r"-(\d+)\.csv$", file.filename.lower())
+    regex_customer_id = MEASUREMENT_FILENAME.search(filename)
     if not regex_customer_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Filename has no information about supplier id, this should be in form -id.csv",
         )
 
-    customer_id = regex_customer_id.group(1)
-    db_item = (
-        session.query(ElectricityCustomer)
-        .filter(ElectricityCustomer.id == customer_id)
-        .first()
-    )
-    if not db_item:
+    customer_id = int(regex_customer_id.group(1))
+    if not get_customer(session, customer_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Customer not found"
         )
 
-    sql_columns = [
-        "customer_id",
-        "measured_at",
-        "consumption_kwh",
-        "price_per_kwh",
-        "created_at",
-        "updated_at",
-    ]
-    df = pd.read_csv(file.file, sep=";", decimal=",")
-    df = df.rename(
-        columns={
-            df.columns[0]: sql_columns[1],
-            df.columns[1]: sql_columns[2],
-            df.columns[2]: sql_columns[3],
-        }
+    parsed = parse_measurements_csv(
+        decompressed_stream(file.file, regex_customer_id.group(2)),
+        customer_id,
+        load_block_levels(session),
     )
-    df["customer_id"] = customer_id
-    df["created_at"] = datetime.now()
-    df["updated_at"] = df["created_at"]
-    df = df[sql_columns]
-
-    buffer = StringIO()
-    df.to_csv(buffer, index=False, header=False, sep=";")
-    buffer.seek(0)
-
-    connection = session.connection().connection
-    cursor = connection.cursor()
+    # prices of files without a price column come from price schedules of the contract,
+    # invoices check prices again with the contract they are calculated for
+    contract = None
+    if not parsed.has_prices:
+        contract = get_active_contract(session, customer_id)
+        if not contract:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Customer has no active contract, prices can not be resolved",
+            )
 
+    unpriced = 0
+    cursor = session.connection().connection.cursor()
     try:
-        # Execute COPY FROM using psycopg2
-        cursor.copy_from(buffer, "measurements_electricity_usage", sep=";")
-        # Commit the transaction
-        connection.commit()
-        return MeasurementCreateResponse(records_added=len(df))
-    except Exception as e:
-        connection.rollback()
+        # rows are parsed while COPY reads them, nothing is stored unless all are valid
+        cursor.copy_expert(
+            "COPY measurements_electricity_usage ({}) FROM STDIN".format(
+                ", ".join(MEASUREMENT_COPY_COLUMNS)
+            ),
+            parsed,
+        )
+        if parsed.failure is not None:
+            raise parsed.failure
+        if parsed.error_count:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail={
+                    "message": f"CSV file has {parsed.error_count} invalid rows",
+                    "errors": [error._asdict() for error in parsed.errors],
+                },
+            )
+        if parsed.records == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="CSV file has no measurements",
+            )
+
+        if contract:
+            unpriced = count_unpriced_measurements(
+                session, contract, parsed.first_measured_at, parsed.last_measured_at
+            )
+        if unpriced:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"No price schedule for {unpriced} measurements of the contract package",
+            )
+        # invoices of changed months can be corrected
+        mark_dirty_windows(
+            session, customer_id, parsed.first_measured_at, parsed.last_measured_at
+        )
+        session.commit()
+    except HTTPException:
+        session.rollback()
+        raise
+    except DecompressedSizeError:
+        session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Decompressed file is larger than {MAX_DECOMPRESSED_SIZE // (1024 * 1024)} MB",
+        )
+    except DECOMPRESSION_ERRORS:
+        session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Compressed file is corrupted or incomplete",
+        )
+    except (IntegrityError, psycopg2.IntegrityError) as e:
+        session.rollback()
+        raise_constraint_error(e)
+    except Exception:
+        session.rollback()
+        # errors of the database and driver are not returned to clients
+        log.exception("Measurements upload failed", customer_id=customer_id)
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="str(e)"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Measurements could not be stored",
         )
     finally:
         cursor.close()
 
+    return MeasurementCreateResponse(records_added=parsed.records)
+
 
 @router.get("/stats")
 def customer_id(
     customer_id: Optional[int] = None,
     month: Optional[MonthType] = None,
     year: Optional[YearType] = None,
-    session: Session = Depends(get_db),
+    session: Session = Depends(get_db_readonly),
 ):
-    query = session.query(func.count(ElectricityUsage.measured_at))
+    query = session.query(
+        ElectricityUsage.block_level, func.count(ElectricityUsage.measured_at)
+    ).group_by(ElectricityUsage.block_level)
     if customer_id:
         query = query.filter(ElectricityUsage.customer_id == customer_id)
     if month:
         query = query.filter(extract("month", ElectricityUsage.measured_at) == month)
     if year:
         query = query.filter(extract("year", ElectricityUsage.measured_at) == year)
-    return MeasurementStatsResponse(records_count=query.scalar())
+
+    # levels were resolved at upload, so counts are grouped by a stored column
+    counts = query.all()
+    return MeasurementStatsResponse(
+        records_count=sum(count for _, count in counts),
+        records_by_block_level=dict(
+            sorted((level, count) for level, count in counts if level is not None)
+        ),
+    )
 
 
 # POST is used since DELETE with a body is not universally supported by all clients and proxies
@@ -118,12 +191,42 @@ def customer_id(
 def remove_measurements(
     data: MeasurementDeleteRequests, session: Session = Depends(get_db)
 ):
-    query = (
-        session.query(ElectricityUsage)
-        .filter(ElectricityUsage.customer_id == data.customer_id)
-        .filter(extract("month", ElectricityUsage.measured_at) == data.month)
-        .filter(extract("year", ElectricityUsage.measured_at) == data.year)
+    # month is deleted as a time range, so only its chunks are scanned,
+    # bounds without timezone are in database timezone, same as extract() was
+    start_at = datetime(data.year, data.month, 1)
+    end_at = (
+        start_at.replace(month=data.month + 1)
+        if data.month < 12
+        else start_at.replace(year=data.year + 1, month=1)
+    )
+    records_removed = delete_measurements(
+        session, start_at, end_at, customer_ids=[data.customer_id]
     )
-    records_removed = query.delete(synchronize_session=False)
     session.commit()
     return MeasurementDeleteResponse(records_removed=records_removed)
+
+
+@router.post("/bulk-remove")
+def bulk_remove_measurements(
+    data: MeasurementBulkDeleteRequest, session: Session = Depends(get_db)
+):
+    records_removed, chunks_dropped = 0, 0
+    drop_chunks = data.all_customers and timescaledb_available(session)
+    for measurement_range in data.ranges:
+        if drop_chunks:
+            dropped, records = drop_covered_chunks(
+                session, measurement_range.start, measurement_range.end
+            )
+            chunks_dropped += dropped
+            records_removed += records
+        # rows of partially covered chunks are deleted
+        records_removed += delete_measurements(
+            session,
+            measurement_range.start,
+            measurement_range.end,
+            customer_ids=data.customer_ids,
+        )
+    session.commit()
+    return MeasurementBulkDeleteResponse(
+        records_removed=records_removed, chunks_dropped=chunks_dropped
+    )
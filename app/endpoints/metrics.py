@@ -0,0 +1,15 @@
+from anyio.to_thread import current_default_thread_limiter
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.utils.scheduling import metrics_text
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(
+        metrics_text(current_default_thread_limiter()),
+        media_type="text/plain; version=0.0.4",
+    )
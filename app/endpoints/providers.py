@@ -1,10 +1,21 @@
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import insert, or_, select, update
 from sqlalchemy.orm import Session
 
-from app.database.session import get_db
-from app.database.models.customer import ElectricityProvider
-from app.schema.provider import ProviderCreate, ProviderUpdate
+from app.database.cache import invalidate_provider
+from app.database.session import get_db, get_db_readonly
+from app.database.models.customer import ElectricityProvider, PriceSchedule
+from app.schema.provider import (
+    PriceScheduleCreate,
+    PriceScheduleResponse,
+    ProviderCreate,
+    ProviderResponse,
+    ProviderUpdate,
+)
+from app.utils.invoice import count_schedule_priced_measurements
+from app.utils.invoice_corrections import mark_price_schedule_windows
 
 router = APIRouter(
     prefix="/providers",
@@ -12,53 +23,57 @@ router = APIRouter(
 )
 
 
-@router.get("/")
-def all_providers(session: Session = Depends(get_db)):
+@router.get("/", response_model=list[ProviderResponse])
+def all_providers(session: Session = Depends(get_db_readonly)):
     return session.execute(select(ElectricityProvider)).scalars().all()
 
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=ProviderResponse)
 def create_provider(data: ProviderCreate, session: Session = Depends(get_db)):
-    db_item = ElectricityProvider(
-        full_title=data.full_title,
-        email=data.email,
-        webpage=str(data.webpage),
-        tax_code=data.tax_code,
-        iban_number=data.iban_number,
-        street_address=data.street_address,
-        zip_code=data.zip_code,
-        zip_name=data.zip_name,
-    )
-    session.add(db_item)
+    db_item = session.scalars(
+        insert(ElectricityProvider)
+        .values(
+            full_title=data.full_title,
+            email=data.email,
+            webpage=str(data.webpage),
+            tax_code=data.tax_code,
+            iban_number=data.iban_number,
+            street_address=data.street_address,
+            zip_code=data.zip_code,
+            zip_name=data.zip_name,
+        )
+        .returning(ElectricityProvider)
+    ).one()
     session.commit()
-    session.refresh(db_item)
     return db_item
 
 
-@router.put("/{provider_id}")
+@router.put("/{provider_id}", response_model=ProviderResponse)
 def update_provider(
     provider_id: int, data: ProviderUpdate, session: Session = Depends(get_db)
 ):
-    db_item = (
-        session.query(ElectricityProvider)
-        .filter(ElectricityProvider.id == provider_id)
-        .first()
-    )
+    db_item = session.scalars(
+        update(ElectricityProvider)
+        .where(ElectricityProvider.id == provider_id)
+        .values(
+            full_title=data.full_title,
+            email=data.email,
+            webpage=str(data.webpage),
+            tax_code=data.tax_code,
+            iban_number=data.iban_number,
+            street_address=data.street_address,
+            zip_code=data.zip_code,
+            zip_name=data.zip_name,
+        )
+        .returning(ElectricityProvider)
+    ).first()
     if not db_item:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Provider not found"
         )
-    db_item.full_title = data.full_title
-    db_item.email = data.email
-    db_item.webpage = str(data.webpage)
-    db_item.tax_code = data.tax_code
-    db_item.iban_number = data.iban_number
-    db_item.street_address = data.street_address
-    db_item.zip_code = data.zip_code
-    db_item.zip_name = data.zip_name
+    invalidate_provider(session, provider_id)
 
     session.commit()
-    session.refresh(db_item)
     return db_item
 
 
@@ -74,5 +89,121 @@ def delete_provider(provider_id: int, session: Session = Depends(get_db)):
             status_code=status.HTTP_404_NOT_FOUND, detail="Provider not found"
         )
 
+    session.delete(db_item)
+    invalidate_provider(session, provider_id)
+    session.commit()
+
+
+@router.get(
+    "/{provider_id}/price-schedules", response_model=list[PriceScheduleResponse]
+)
+def provider_price_schedules(
+    provider_id: int,
+    package_name: Optional[str] = None,
+    session: Session = Depends(get_db_readonly),
+):
+    query = session.query(PriceSchedule).filter(
+        PriceSchedule.provider_id == provider_id
+    )
+    if package_name:
+        query = query.filter(PriceSchedule.package_name == package_name)
+    return query.order_by(
+        PriceSchedule.package_name, PriceSchedule.valid_from, PriceSchedule.block_level
+    ).all()
+
+
+@router.post(
+    "/{provider_id}/price-schedules",
+    status_code=status.HTTP_201_CREATED,
+    response_model=list[PriceScheduleResponse],
+)
+def create_price_schedule(
+    provider_id: int, data: PriceScheduleCreate, session: Session = Depends(get_db)
+):
+    # provider row is locked, so concurrent schedules can not overlap
+    provider = (
+        session.query(ElectricityProvider)
+        .filter(ElectricityProvider.id == provider_id)
+        .with_for_update()
+        .first()
+    )
+    if not provider:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Provider not found"
+        )
+
+    # a measurement is priced by at most one schedule of the package and level
+    levels = [price.block_level for price in data.prices]
+    overlapping = (
+        session.query(PriceSchedule)
+        .filter(PriceSchedule.provider_id == provider_id)
+        .filter(PriceSchedule.package_name == data.package_name)
+        .filter(PriceSchedule.block_level.in_(levels))
+        .filter(
+            or_(
+                PriceSchedule.valid_to.is_(None),
+                PriceSchedule.valid_to > data.valid_from,
+            )
+        )
+    )
+    if data.valid_to is not None:
+        overlapping = overlapping.filter(PriceSchedule.valid_from < data.valid_to)
+    if overlapping.first():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Price schedule for an overlapping period already exists",
+        )
+
+    schedules = session.scalars(
+        insert(PriceSchedule).returning(PriceSchedule),
+        [
+            {
+                "provider_id": provider_id,
+                "package_name": data.package_name,
+                "block_level": price.block_level,
+                "price_per_kwh": price.price_per_kwh,
+                "valid_from": data.valid_from,
+                "valid_to": data.valid_to,
+            }
+            for price in data.prices
+        ],
+    ).all()
+    # invoices already created for the period are corrected with new prices
+    mark_price_schedule_windows(
+        session, provider_id, data.package_name, data.valid_from, data.valid_to
+    )
+    session.commit()
+    return schedules
+
+
+@router.delete(
+    "/{provider_id}/price-schedules/{schedule_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+def delete_price_schedule(
+    provider_id: int, schedule_id: int, session: Session = Depends(get_db)
+):
+    db_item = (
+        session.query(PriceSchedule)
+        .filter(PriceSchedule.id == schedule_id)
+        .filter(PriceSchedule.provider_id == provider_id)
+        .first()
+    )
+    if not db_item:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Price schedule not found"
+        )
+
+    # stored measurements without their own price would be invoiced for free
+    priced = count_schedule_priced_measurements(session, db_item)
+    if priced:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Price schedule is the only price of {priced} stored measurements",
+        )
+
+    mark_price_schedule_windows(
+        session, provider_id, db_item.package_name, db_item.valid_from, db_item.valid_to
+    )
     session.delete(db_item)
     session.commit()
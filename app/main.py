@@ -1,17 +1,44 @@
+from contextlib import asynccontextmanager
+
+from anyio.to_thread import current_default_thread_limiter
 from fastapi import APIRouter, FastAPI
+from fastapi.responses import ORJSONResponse
 
+from .database.cache import start_invalidation_listener
+from .database.session import last_write_middleware
+from .endpoints.admin import router as router_admin
 from .endpoints.customers import router as router_customers
 from .endpoints.invoices import router as router_invoices
 from .endpoints.measurements import router as router_measurements
+from .endpoints.metrics import router as router_metrics
 from .endpoints.providers import router as router_providers
+from .utils.profiling import profiling_middleware
+from .utils.scheduling import scheduling_middleware, thread_pool_size
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_invalidation_listener()
+    # sync endpoints run in this pool, heavy lanes can not take all of its threads
+    current_default_thread_limiter().total_tokens = thread_pool_size()
+    yield
 
 
-app = FastAPI()
+# orjson is used for all responses, response models are validated by pydantic
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+# samples requests for admin profiling endpoints and ?profile=1
+app.middleware("http")(profiling_middleware)
+# concurrency limits of heavy routes, requests over the limit get 429
+app.middleware("http")(scheduling_middleware)
+# read-only endpoints of clients with recent writes read from the primary
+app.middleware("http")(last_write_middleware)
 
 router = APIRouter()
+router.include_router(router_admin)
 router.include_router(router_customers)
 router.include_router(router_invoices)
 router.include_router(router_measurements)
+router.include_router(router_metrics)
 router.include_router(router_providers)
 
 app.include_router(router)
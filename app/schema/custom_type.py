@@ -1,6 +1,7 @@
+from decimal import Decimal
 from typing import Annotated
 
-from pydantic import AfterValidator
+from pydantic import AfterValidator, PlainSerializer
 
 
 def validate_four_digit_zip(value: int) -> int:
@@ -28,3 +29,13 @@ def validate_year(value: int) -> int:
 
 
 YearType = Annotated[int, AfterValidator(validate_year)]
+
+
+# amounts are exact decimals, in JSON they stay numbers instead of strings
+MoneyAmount = Annotated[
+    Decimal, PlainSerializer(float, return_type=float, when_used="json")
+]
+
+EnergyQuantity = Annotated[
+    Decimal, PlainSerializer(float, return_type=float, when_used="json")
+]
@@ -1,4 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict, EmailStr
 
 from app.database.models.customer import CustomerType
 from app.schema.custom_type import ZipCode
@@ -36,3 +38,49 @@ class CustomerContractUpdate(BaseModel):
     contract_number: str
     energy_meter_number: str
     package_name: str
+
+
+class CustomerResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    fullname: str
+    email: str
+    tax_code: str
+    street_address: str
+    zip_code: int
+    zip_name: str
+    created_at: datetime
+    updated_at: datetime
+
+
+class CustomerContractResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    provider_id: int
+    customer_id: int
+    customer_type: CustomerType
+    contract_number: str
+    energy_meter_number: str
+    package_name: str
+    termination_date: datetime | None
+    created_at: datetime
+    updated_at: datetime
+
+
+class CustomerDetailResponse(CustomerResponse):
+    active_contract: CustomerContractResponse | None = None
+
+
+class CustomerSearchResult(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    customer: CustomerResponse
+    # best word similarity of the query to any searched field, from 0 to 1
+    score: float
+
+
+class CustomerImportResponse(BaseModel):
+    customers_created: int
+    contracts_created: int
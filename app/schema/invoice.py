@@ -1,15 +1,123 @@
-from app.schema.custom_type import MonthType, YearType
+from datetime import date, datetime
+from typing import Self
 
-from pydantic import BaseModel
+from dateutil.relativedelta import relativedelta
+
+from app.database.models.document import DocumentStatus
+from app.schema.custom_type import EnergyQuantity, MoneyAmount, MonthType, YearType
+from app.schema.customer import CustomerContractResponse, CustomerResponse
+from app.schema.provider import ProviderResponse
+
+from pydantic import BaseModel, ConfigDict, model_validator
 
 
 class CreateInvoice(BaseModel):
     customer_id: int
-    month: MonthType
-    year: YearType
+    # invoiced period is either a calendar month or period_start - period_end
+    month: MonthType | None = None
+    year: YearType | None = None
+    period_start: date | None = None
+    # last day of the period is included
+    period_end: date | None = None
     payment_reason: str
     receiver_reference: str
     invoice_number: str
     location_issued: str
     invoice_code: str = "OTHR"
     days_payment_due: int = 15
+
+    @model_validator(mode="after")
+    def check_period(self) -> Self:
+        calendar_month = self.month is not None or self.year is not None
+        period = self.period_start is not None or self.period_end is not None
+        if calendar_month == period:
+            raise ValueError(
+                "Either month and year or period_start and period_end must be set"
+            )
+        if calendar_month and (self.month is None or self.year is None):
+            raise ValueError("Both month and year must be set")
+        if period:
+            if self.period_start is None or self.period_end is None:
+                raise ValueError("Both period_start and period_end must be set")
+            if self.period_start > self.period_end:
+                raise ValueError("period_start must not be after period_end")
+            if self.period_end >= self.period_start + relativedelta(years=1):
+                raise ValueError("Invoice period can be at most one year long")
+        return self
+
+    @property
+    def invoice_period(self) -> tuple[date, date]:
+        if self.period_start is not None:
+            return self.period_start, self.period_end
+        start_date = date(self.year, self.month, 1)
+        return start_date, start_date + relativedelta(months=1, days=-1)
+
+
+class InvoiceItemResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    electricity_invoice_id: int
+    name: str
+    unit: str
+    quantity: EnergyQuantity
+    amount: MoneyAmount
+    date_from: datetime
+    date_to: datetime
+    created_at: datetime
+    updated_at: datetime
+
+
+class InvoiceResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    contract_id: int
+    invoice_number: str
+    issued_date: datetime
+    period_start: datetime
+    service_date: datetime
+    location_issued: str
+    due_date: datetime
+    invoice_code: str
+    payment_reason: str
+    receiver_IBAN: str
+    receiver_reference: str
+    base_amount: MoneyAmount
+    tax_amount: MoneyAmount
+    total_amount: MoneyAmount
+    total_quantity: EnergyQuantity
+    idempotency_key: str | None
+    created_at: datetime
+    updated_at: datetime
+
+
+class InvoiceContractResponse(CustomerContractResponse):
+    provider: ProviderResponse
+    customer: CustomerResponse
+
+
+class InvoiceDetailResponse(InvoiceResponse):
+    items: list[InvoiceItemResponse]
+    customer_contract: InvoiceContractResponse | None = None
+
+
+class InvoiceDocumentResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    electricity_invoice_id: int
+    status: DocumentStatus
+    attempts: int
+    error: str | None
+    created_at: datetime
+    updated_at: datetime
+
+
+class InvoiceCorrectionResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    invoice_id: int
+    contract_id: int
+    customer_id: int
+    month: date
+    marked_at: datetime
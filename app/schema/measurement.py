@@ -1,6 +1,10 @@
-from app.schema.custom_type import MonthType, YearType
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Self
+
+from pydantic import AwareDatetime, BaseModel, Field, model_validator
 
-from pydantic import BaseModel
+from app.schema.custom_type import MonthType, YearType
 
 
 class MeasurementDeleteRequests(BaseModel):
@@ -9,8 +13,34 @@ class MeasurementDeleteRequests(BaseModel):
     year: YearType
 
 
+class MeasurementRange(BaseModel):
+    # start is included and end excluded
+    start: AwareDatetime
+    end: AwareDatetime
+
+    @model_validator(mode="after")
+    def check_range(self) -> Self:
+        if self.start >= self.end:
+            raise ValueError("Range start must be before its end")
+        return self
+
+
+class MeasurementBulkDeleteRequest(BaseModel):
+    customer_ids: list[int] | None = Field(default=None, min_length=1)
+    # removal for every customer has to be requested explicitly
+    all_customers: bool = False
+    ranges: list[MeasurementRange] = Field(min_length=1)
+
+    @model_validator(mode="after")
+    def check_customers(self) -> Self:
+        if self.all_customers == (self.customer_ids is not None):
+            raise ValueError("Either customer_ids or all_customers must be set")
+        return self
+
+
 class MeasurementStatsResponse(BaseModel):
     records_count: int
+    records_by_block_level: dict[int, int] = {}
 
 
 class MeasurementCreateResponse(BaseModel):
@@ -19,3 +49,49 @@ class MeasurementCreateResponse(BaseModel):
 
 class MeasurementDeleteResponse(BaseModel):
     records_removed: int
+
+
+class MeasurementBulkDeleteResponse(BaseModel):
+    # rows of dropped chunks are estimated from table statistics
+    records_removed: int
+    chunks_dropped: int
+
+
+class ConsumptionBucket(Enum):
+    QUARTER_HOUR = "15min"
+    HOUR = "hour"
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+    @property
+    def interval(self) -> str:
+        return {
+            "15min": "15 minutes",
+            "hour": "1 hour",
+            "day": "1 day",
+            "week": "1 week",
+            "month": "1 month",
+        }[self.value]
+
+    @property
+    def shortest_duration(self) -> timedelta:
+        # local days can be 23 hours long, months 28 days
+        return {
+            "15min": timedelta(minutes=15),
+            "hour": timedelta(hours=1),
+            "day": timedelta(hours=23),
+            "week": timedelta(days=7) - timedelta(hours=1),
+            "month": timedelta(days=28) - timedelta(hours=1),
+        }[self.value]
+
+
+class ConsumptionSeriesResponse(BaseModel):
+    # columnar series, values of a bucket are at the same index
+    customer_id: int
+    bucket: ConsumptionBucket
+    timestamps: list[datetime]
+    consumption_kwh: list[float]
+    # buckets with measurements, more than returned points when downsampled
+    buckets: int
+    downsampled: bool
@@ -1,6 +1,9 @@
-from pydantic import BaseModel, EmailStr, HttpUrl
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Self
+
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, HttpUrl, model_validator
 
-from app.database.models.customer import CustomerType
 from app.schema.custom_type import ZipCode
 
 
@@ -24,3 +27,55 @@ class ProviderUpdate(BaseModel):
     street_address: str
     zip_code: ZipCode
     zip_name: str
+
+
+class ProviderResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    full_title: str
+    email: str
+    webpage: str
+    tax_code: str
+    iban_number: str
+    street_address: str
+    zip_code: int
+    zip_name: str
+    created_at: datetime
+    updated_at: datetime
+
+
+class PriceScheduleLevel(BaseModel):
+    block_level: int = Field(ge=1, le=5)
+    price_per_kwh: Decimal = Field(ge=0, max_digits=10, decimal_places=6)
+
+
+class PriceScheduleCreate(BaseModel):
+    package_name: str
+    # valid_from is included and valid_to excluded, without valid_to prices stay valid
+    valid_from: date
+    valid_to: date | None = None
+    prices: list[PriceScheduleLevel] = Field(min_length=1)
+
+    @model_validator(mode="after")
+    def check_schedule(self) -> Self:
+        if self.valid_to is not None and self.valid_from >= self.valid_to:
+            raise ValueError("valid_from must be before valid_to")
+        levels = [price.block_level for price in self.prices]
+        if len(levels) != len(set(levels)):
+            raise ValueError("Each block level can have only one price")
+        return self
+
+
+class PriceScheduleResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    provider_id: int
+    package_name: str
+    block_level: int
+    price_per_kwh: Decimal
+    valid_from: date
+    valid_to: date | None
+    created_at: datetime
+    updated_at: datetime
@@ -0,0 +1,31 @@
+"""
+Access to admin endpoints, requests send the value of ADMIN_TOKEN
+in the X-Admin-Token header. Without ADMIN_TOKEN admin endpoints are disabled.
+"""
+
+import os
+import secrets
+from typing import Annotated
+
+from fastapi import Header, HTTPException, status
+
+__all__ = ["admin_token_valid", "require_admin"]
+
+admin_token = os.getenv("ADMIN_TOKEN", "")
+
+
+def admin_token_valid(token: str | None) -> bool:
+    if not admin_token or not token:
+        return False
+    return secrets.compare_digest(token.encode(), admin_token.encode())
+
+
+def require_admin(x_admin_token: Annotated[str | None, Header()] = None):
+    if not admin_token:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Admin endpoints are disabled"
+        )
+    if not admin_token_valid(x_admin_token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin token"
+        )
@@ -0,0 +1,61 @@
+"""
+Conflicts of writes are detected by database constraints instead of checks before them,
+violated constraints are mapped to API errors by their names.
+"""
+
+from fastapi import HTTPException, status
+import psycopg2
+from sqlalchemy.exc import IntegrityError
+
+__all__ = ["CONSTRAINT_ERRORS", "raise_constraint_error"]
+
+CONTRACT_NUMBER_EXISTS = (
+    "Contract number already exits. Contract number must be unique over all users"
+)
+
+CONSTRAINT_ERRORS = {
+    "electricity_customers_contracts_contract_number_key": (
+        status.HTTP_400_BAD_REQUEST,
+        CONTRACT_NUMBER_EXISTS,
+    ),
+    "electricity_customers_contracts_active_customer_key": (
+        status.HTTP_400_BAD_REQUEST,
+        "Active contract for customer already exists",
+    ),
+    "electricity_customers_contracts_customer_id_fkey": (
+        status.HTTP_404_NOT_FOUND,
+        "Customer not found",
+    ),
+    "electricity_customers_contracts_provider_id_fkey": (
+        status.HTTP_404_NOT_FOUND,
+        "Provider not found",
+    ),
+    "electricity_invoices_idempotency_key_key": (
+        status.HTTP_409_CONFLICT,
+        "Idempotency-Key was already used for a different invoice",
+    ),
+    "electricity_invoices_contract_service_date_key": (
+        status.HTTP_409_CONFLICT,
+        "Invoice for the selected period already exists",
+    ),
+    # measurements are copied with the driver, duplicates in the file are found here too
+    "measurements_electricity_usage_pkey": (
+        status.HTTP_409_CONFLICT,
+        "Measurements for some timestamps already exist or are repeated in the file",
+    ),
+    "measurements_electricity_usage_customer_id_fkey": (
+        status.HTTP_404_NOT_FOUND,
+        "Customer not found",
+    ),
+}
+
+
+def raise_constraint_error(error: IntegrityError | psycopg2.IntegrityError):
+    # errors of unknown constraints are raised unchanged,
+    # errors of the driver come from statements executed on its cursor
+    driver_error = getattr(error, "orig", error)
+    constraint = getattr(getattr(driver_error, "diag", None), "constraint_name", None)
+    if constraint not in CONSTRAINT_ERRORS:
+        raise error
+    status_code, detail = CONSTRAINT_ERRORS[constraint]
+    raise HTTPException(status_code=status_code, detail=detail) from error
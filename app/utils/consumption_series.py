@@ -0,0 +1,89 @@
+"""
+Consumption of a customer summed into time buckets, for consumption charts.
+
+Buckets are aligned in local time with TimescaleDB time_bucket, so days and months
+start at local midnight. Only chunks of the requested range are read,
+through the primary key on customer and time, and the number of buckets is limited,
+long series can additionally be downsampled to the points a chart can show.
+"""
+
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database.models.measurement import LOCAL_TIMEZONE
+from app.schema.measurement import ConsumptionBucket
+from app.utils.downsampling import lttb_indices
+
+__all__ = [
+    "MAX_SERIES_BUCKETS",
+    "ConsumptionSeries",
+    "consumption_series",
+    "series_bucket_count",
+]
+
+# buckets that are summed by the database, before any downsampling
+MAX_SERIES_BUCKETS = 50_000
+
+# weeks start on monday, origin of time_bucket is a monday
+CONSUMPTION_SERIES = text(f"""
+    SELECT time_bucket(CAST(:bucket_width AS interval), eem.measured_at, '{LOCAL_TIMEZONE}')
+            AS bucket_start,
+        sum(eem.consumption_kwh) AS consumption_kwh
+    FROM measurements_electricity_usage eem
+    WHERE eem.customer_id = :customer_id
+    AND eem.measured_at >= :start_at
+    AND eem.measured_at < :end_at
+    GROUP BY bucket_start
+    ORDER BY bucket_start
+""")
+
+
+class ConsumptionSeries(NamedTuple):
+    timestamps: list[datetime]
+    consumption_kwh: list[float]
+    # buckets with measurements, before downsampling
+    buckets: int
+
+
+def series_bucket_count(
+    start_at: datetime, end_at: datetime, bucket: ConsumptionBucket
+) -> int:
+    # upper bound of buckets in the range, partial buckets on both ends included
+    return (end_at - start_at) // bucket.shortest_duration + 2
+
+
+def consumption_series(
+    session: Session,
+    customer_id: int,
+    start_at: datetime,
+    end_at: datetime,
+    bucket: ConsumptionBucket,
+    max_points: int | None = None,
+) -> ConsumptionSeries:
+    """
+    Buckets without measurements are left out. With max_points,
+    longer series are downsampled with LTTB to max_points buckets.
+    """
+    rows = session.execute(
+        CONSUMPTION_SERIES,
+        {
+            "bucket_width": bucket.interval,
+            "customer_id": customer_id,
+            "start_at": start_at,
+            "end_at": end_at,
+        },
+    ).all()
+    timestamps = [row.bucket_start for row in rows]
+    consumption = [row.consumption_kwh for row in rows]
+
+    if max_points is not None and len(rows) > max_points:
+        indices = lttb_indices(
+            [timestamp.timestamp() for timestamp in timestamps], consumption, max_points
+        )
+        timestamps = [timestamps[index] for index in indices]
+        consumption = [consumption[index] for index in indices]
+
+    return ConsumptionSeries(timestamps, consumption, len(rows))
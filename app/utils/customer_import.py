@@ -0,0 +1,291 @@
+"""
+Bulk import of customers with their contracts, for onboarding of whole portfolios.
+
+Rows are validated in memory with the same schemas as single requests,
+then loaded with COPY into a staging table. Duplicate contract numbers,
+missing providers and customers, and existing active contracts are found
+with set-wise queries on the staging table, valid files are merged in a few
+INSERT ... SELECT statements, so the cost does not grow with requests per row.
+"""
+
+import csv
+import io
+import json
+from typing import BinaryIO, NamedTuple
+
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.schema.customer import CustomerContractCreate, CustomerCreate
+
+__all__ = [
+    "IMPORT_COLUMNS",
+    "MAX_REPORTED_ERRORS",
+    "CustomerImportError",
+    "ParsedCustomerImport",
+    "merge_customer_import",
+    "parse_customer_import",
+    "stage_customer_import",
+]
+
+# rows have fields of CustomerCreate and CustomerContractCreate,
+# rows with customer_id add a contract to an existing customer
+CUSTOMER_FIELDS = list(CustomerCreate.model_fields)
+CONTRACT_FIELDS = list(CustomerContractCreate.model_fields)
+IMPORT_COLUMNS = ["customer_id", *CUSTOMER_FIELDS, *CONTRACT_FIELDS]
+
+CSV_SEPARATOR = ";"
+# only first errors are returned, the whole file is still validated
+MAX_REPORTED_ERRORS = 100
+
+STAGING_TABLE = """
+    CREATE TEMPORARY TABLE import_customer_contracts (
+        line integer NOT NULL,
+        customer_id integer,
+        new_customer boolean NOT NULL,
+        fullname text,
+        email text,
+        tax_code text,
+        street_address text,
+        zip_code integer,
+        zip_name text,
+        provider_id integer NOT NULL,
+        customer_type text NOT NULL,
+        contract_number text NOT NULL,
+        energy_meter_number text NOT NULL,
+        package_name text NOT NULL
+    ) ON COMMIT DROP
+"""
+STAGING_COLUMNS = (
+    "line",
+    "customer_id",
+    "new_customer",
+    *CUSTOMER_FIELDS,
+    *CONTRACT_FIELDS,
+)
+
+# each check returns line and error of conflicting rows
+STAGING_CHECKS = [
+    """
+    SELECT s.line, 'Contract number ' || s.contract_number || ' already exists'
+    FROM import_customer_contracts s
+    JOIN electricity_customers_contracts c ON c.contract_number = s.contract_number
+    """,
+    """
+    SELECT s.line, 'Provider ' || s.provider_id || ' not found'
+    FROM import_customer_contracts s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM electricity_providers p WHERE p.id = s.provider_id
+    )
+    """,
+    """
+    SELECT s.line, 'Customer ' || s.customer_id || ' not found'
+    FROM import_customer_contracts s
+    WHERE NOT s.new_customer AND NOT EXISTS (
+        SELECT 1 FROM electricity_customers ec WHERE ec.id = s.customer_id
+    )
+    """,
+    """
+    SELECT s.line, 'Active contract for customer ' || s.customer_id || ' already exists'
+    FROM import_customer_contracts s
+    JOIN electricity_customers_contracts c ON c.customer_id = s.customer_id
+        AND c.termination_date IS NULL
+    WHERE NOT s.new_customer
+    """,
+]
+
+# ids of new customers are taken from the sequence before the merge,
+# so their contracts are inserted by the same statement
+MERGE_STATEMENTS = [
+    """
+    UPDATE import_customer_contracts
+    SET customer_id = nextval(pg_get_serial_sequence('electricity_customers', 'id'))
+    WHERE new_customer
+    """,
+    """
+    INSERT INTO electricity_customers (
+        id, fullname, email, tax_code, street_address, zip_code, zip_name,
+        created_at, updated_at
+    )
+    SELECT customer_id, fullname, email, tax_code, street_address, zip_code, zip_name,
+        LOCALTIMESTAMP, LOCALTIMESTAMP
+    FROM import_customer_contracts
+    WHERE new_customer
+    ORDER BY line
+    """,
+    """
+    INSERT INTO electricity_customers_contracts (
+        provider_id, customer_id, customer_type, contract_number,
+        energy_meter_number, package_name, created_at, updated_at
+    )
+    SELECT provider_id, customer_id,
+        customer_type::electricity_customers_contracts_type, contract_number,
+        energy_meter_number, package_name, LOCALTIMESTAMP, LOCALTIMESTAMP
+    FROM import_customer_contracts
+    ORDER BY line
+    """,
+]
+
+
+class CustomerImportError(NamedTuple):
+    line: int
+    error: str
+
+
+class ParsedCustomerImport:
+    def __init__(self):
+        # rows in CSV format of postgres COPY command
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.customers = 0
+        self.contracts = 0
+        self.errors: list[CustomerImportError] = []
+        self.error_count = 0
+        # existing customers that get a contract, their cached entries are invalidated
+        self.existing_customer_ids: set[int] = set()
+
+    def add_error(self, line: int, error: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(CustomerImportError(line, error))
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        ".".join(str(part) for part in detail["loc"]) + ": " + detail["msg"]
+        for detail in error.errors()
+    )
+
+
+def _csv_rows(stream: BinaryIO):
+    lines = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(lines, delimiter=CSV_SEPARATOR)
+    for row in reader:
+        # header is on line 1, rows with line breaks inside values are not expected
+        yield reader.line_num, row
+
+
+def _ndjson_rows(stream: BinaryIO):
+    for line_number, raw_line in enumerate(stream, start=1):
+        line = raw_line.decode("utf-8-sig" if line_number == 1 else "utf-8").strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            yield line_number, None
+            continue
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def parse_customer_import(stream: BinaryIO, ndjson: bool) -> ParsedCustomerImport:
+    """
+    Validates rows of a CSV file with semicolons and a header, or of an NDJSON file,
+    with CustomerCreate and CustomerContractCreate, and converts them for COPY.
+    Contract numbers and existing customers can appear only once in the file.
+    """
+    parsed = ParsedCustomerImport()
+    seen_contract_numbers = {}
+    seen_customer_ids = {}
+
+    try:
+        for line_number, row in (_ndjson_rows if ndjson else _csv_rows)(stream):
+            if row is None:
+                parsed.add_error(line_number, "Line is not a JSON object")
+                continue
+            # empty CSV values are missing values
+            row = {key: value for key, value in row.items() if value not in ("", None)}
+
+            customer_id = row.get("customer_id")
+            try:
+                customer_id = int(customer_id) if customer_id is not None else None
+            except ValueError:
+                parsed.add_error(line_number, f"Invalid customer_id '{customer_id}'")
+                continue
+
+            try:
+                customer = (
+                    CustomerCreate.model_validate(row) if customer_id is None else None
+                )
+                contract = CustomerContractCreate.model_validate(row)
+            except ValidationError as e:
+                parsed.add_error(line_number, _validation_message(e))
+                continue
+
+            if contract.contract_number in seen_contract_numbers:
+                parsed.add_error(
+                    line_number,
+                    f"Duplicate contract number '{contract.contract_number}', "
+                    f"first on line {seen_contract_numbers[contract.contract_number]}",
+                )
+                continue
+            seen_contract_numbers[contract.contract_number] = line_number
+            if customer_id is not None:
+                # customer can have only one active contract
+                if customer_id in seen_customer_ids:
+                    parsed.add_error(
+                        line_number,
+                        f"Duplicate customer_id {customer_id}, "
+                        f"first on line {seen_customer_ids[customer_id]}",
+                    )
+                    continue
+                seen_customer_ids[customer_id] = line_number
+
+            # rows are only written while the file is valid, they are discarded otherwise
+            if parsed.error_count == 0:
+                customer_values = (
+                    [getattr(customer, field) for field in CUSTOMER_FIELDS]
+                    if customer
+                    else [None] * len(CUSTOMER_FIELDS)
+                )
+                parsed.writer.writerow(
+                    [
+                        line_number,
+                        customer_id,
+                        customer_id is None,
+                        *customer_values,
+                        contract.provider_id,
+                        contract.customer_type.name,
+                        contract.contract_number,
+                        contract.energy_meter_number,
+                        contract.package_name,
+                    ]
+                )
+            parsed.contracts += 1
+            if customer_id is None:
+                parsed.customers += 1
+            else:
+                parsed.existing_customer_ids.add(customer_id)
+    except (UnicodeDecodeError, csv.Error) as e:
+        parsed.add_error(0, f"File can not be read: {e}")
+
+    parsed.buffer.seek(0)
+    return parsed
+
+
+def stage_customer_import(
+    session: Session, parsed: ParsedCustomerImport
+) -> list[CustomerImportError]:
+    """
+    Loads parsed rows into a staging table, which is dropped on commit,
+    returns rows that conflict with existing data.
+    """
+    session.execute(text(STAGING_TABLE))
+    with session.connection().connection.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY import_customer_contracts ({}) FROM STDIN WITH (FORMAT csv)".format(
+                ", ".join(STAGING_COLUMNS)
+            ),
+            parsed.buffer,
+        )
+
+    errors = session.execute(
+        text(" UNION ALL ".join(STAGING_CHECKS) + " ORDER BY 1")
+    ).all()
+    return [CustomerImportError(line, error) for line, error in errors]
+
+
+def merge_customer_import(session: Session):
+    for statement in MERGE_STATEMENTS:
+        session.execute(text(statement))
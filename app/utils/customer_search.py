@@ -0,0 +1,73 @@
+"""
+Customer search by name, email, tax code, contract number or energy meter number.
+
+Columns have trigram GIN indexes, both the word similarity operator, which finds
+misspelled names, and ILIKE for fragments of codes and numbers are answered
+from the indexes, so the cost depends on matching rows and not on all customers.
+"""
+
+from sqlalchemy import Float, Integer, select, text
+from sqlalchemy.orm import aliased, Session
+
+from app.database.models.customer import ElectricityCustomer
+
+__all__ = [
+    "MIN_QUERY_LENGTH",
+    "search_customers",
+]
+
+# shorter queries have no trigrams and would scan all rows
+MIN_QUERY_LENGTH = 3
+
+CUSTOMER_COLUMNS = ("fullname", "email", "tax_code")
+CONTRACT_COLUMNS = ("contract_number", "energy_meter_number")
+
+
+def _match_query(table: str, customer_id: str, columns: tuple[str, ...]) -> str:
+    # score is the best word similarity of the query to any of the columns
+    score = ", ".join(f"word_similarity(:query, {column})" for column in columns)
+    condition = " OR ".join(
+        f":query <% {column} OR {column} ILIKE :pattern" for column in columns
+    )
+    return f"""
+    SELECT {customer_id} AS customer_id, GREATEST({score}) AS score
+    FROM {table}
+    WHERE {condition}
+    """
+
+
+# customer matches through any of its contracts, also terminated ones
+SEARCH_MATCHES = f"""
+    SELECT customer_id, max(score) AS score
+    FROM (
+        {_match_query("electricity_customers", "id", CUSTOMER_COLUMNS)}
+        UNION ALL
+        {_match_query("electricity_customers_contracts", "customer_id", CONTRACT_COLUMNS)}
+    ) matches
+    GROUP BY customer_id
+    ORDER BY score DESC, customer_id
+    LIMIT :limit
+"""
+
+
+def _like_pattern(query: str) -> str:
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def search_customers(session: Session, query: str, limit: int):
+    """
+    Returns rows with customer and score, best matches first.
+    """
+    ranked = (
+        text(SEARCH_MATCHES)
+        .bindparams(query=query, pattern=_like_pattern(query), limit=limit)
+        .columns(customer_id=Integer, score=Float)
+        .subquery("ranked")
+    )
+    customer = aliased(ElectricityCustomer, name="customer")
+    return session.execute(
+        select(customer, ranked.c.score)
+        .join(ranked, ranked.c.customer_id == customer.id)
+        .order_by(ranked.c.score.desc(), customer.id)
+    ).all()
@@ -0,0 +1,165 @@
+from datetime import date, timedelta
+import io
+import math
+import os
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader
+
+from app.database.models.customer import CustomerContract
+from app.database.models.invoice import ElectricityInvoice
+from app.utils.invoice import demand_items, energy_items
+from app.utils.serialization import orm_object_to_dict_exclude_default
+
+__all__ = [
+    "documents_storage_path",
+    "invoice_document_filename",
+    "invoice_document_storage_name",
+    "invoice_render_data",
+    "render_invoice_pdf",
+    "usage_chart",
+    "write_document",
+]
+
+# shared directory where the document worker stores rendered documents
+documents_storage_path = Path(os.getenv("DOCUMENTS_STORAGE_PATH", "documents"))
+
+# template environment is shared, so templates are compiled only once per process
+environment = Environment(loader=FileSystemLoader("templates"))
+
+
+def invoice_document_filename(invoice: ElectricityInvoice) -> str:
+    return "Racun_" + invoice.invoice_number + ".pdf"
+
+
+def invoice_document_storage_name(invoice_id: int) -> str:
+    # path inside documents_storage_path, invoice number can contain any characters
+    return f"invoices/{invoice_id}.pdf"
+
+
+def invoice_render_data(
+    invoice: ElectricityInvoice, customer_contract: CustomerContract
+) -> dict:
+    invoice_template_data = orm_object_to_dict_exclude_default(invoice, ["contract_id"])
+    invoice_template_data["invoice_items"] = [
+        orm_object_to_dict_exclude_default(item) for item in energy_items(invoice.items)
+    ]
+    invoice_template_data["demand_items"] = [
+        orm_object_to_dict_exclude_default(item) for item in demand_items(invoice.items)
+    ]
+
+    return {
+        "invoice": invoice_template_data,
+        "contract": orm_object_to_dict_exclude_default(
+            customer_contract, ["customer_id", "provider_id", "termination_date"]
+        ),
+        "provider": orm_object_to_dict_exclude_default(customer_contract.provider),
+        "customer": orm_object_to_dict_exclude_default(customer_contract.customer),
+        "usage_chart": usage_chart(invoice.usage_profile),
+    }
+
+
+# time block 1 has the highest price
+TIME_BLOCK_COLORS = {
+    1: "#c0392b",
+    2: "#e67e22",
+    3: "#f1c40f",
+    4: "#27ae60",
+    5: "#2980b9",
+}
+CHART_WIDTH = 680
+CHART_HEIGHT = 200
+CHART_MARGIN_LEFT = 40
+CHART_MARGIN_BOTTOM = 20
+
+
+def usage_chart(profile: dict | None) -> dict | None:
+    """
+    Geometry of stacked daily consumption bars, template draws it as inline SVG.
+    Profile is stored with the invoice, see app.utils.invoice.usage_profile.
+    """
+    if not profile or not profile["days"]:
+        return None
+
+    days = profile["days"]
+    max_value = max(sum(day) for day in days)
+    if max_value <= 0:
+        return None
+    # axis ends with a round value
+    magnitude = 10 ** math.floor(math.log10(max_value))
+    axis_max = math.ceil(max_value / magnitude) * magnitude
+
+    plot_height = CHART_HEIGHT - CHART_MARGIN_BOTTOM
+    slot = (CHART_WIDTH - CHART_MARGIN_LEFT) / len(days)
+    bar_width = max(slot * 0.8, 1)
+    date_from = date.fromisoformat(profile["date_from"])
+
+    bars, labels = [], []
+    for index, day in enumerate(days):
+        x = CHART_MARGIN_LEFT + index * slot + (slot - bar_width) / 2
+        y = plot_height
+        for time_block, value in zip(profile["time_blocks"], day):
+            height = value / axis_max * plot_height
+            y -= height
+            bars.append(
+                {
+                    "x": round(x, 2),
+                    "y": round(y, 2),
+                    "width": round(bar_width, 2),
+                    "height": round(height, 2),
+                    "color": TIME_BLOCK_COLORS.get(time_block, "#7f8c8d"),
+                }
+            )
+        # longer periods only have labels at the start of each month
+        day_date = date_from + timedelta(days=index)
+        if len(days) <= 31:
+            label = day_date.day
+        elif index == 0 or day_date.day == 1:
+            label = f"{day_date.day}.{day_date.month}."
+        else:
+            continue
+        labels.append({"x": round(x + bar_width / 2, 2), "text": label})
+
+    ticks = [
+        {
+            "y": round(plot_height - plot_height * step / 4, 2),
+            "text": f"{axis_max * step / 4:g}",
+        }
+        for step in range(5)
+    ]
+    legend = [
+        {
+            "time_block": time_block,
+            "color": TIME_BLOCK_COLORS.get(time_block, "#7f8c8d"),
+        }
+        for time_block in profile["time_blocks"]
+    ]
+    return {
+        "width": CHART_WIDTH,
+        "height": CHART_HEIGHT,
+        "plot_left": CHART_MARGIN_LEFT,
+        "plot_bottom": plot_height,
+        "bars": bars,
+        "labels": labels,
+        "ticks": ticks,
+        "legend": legend,
+    }
+
+
+def render_invoice_pdf(render_data: dict) -> bytes:
+    # weasyprint loads pango and cairo, it is imported only when a document is rendered
+    from weasyprint import HTML
+
+    report = environment.get_template("electricity_invoice.html")
+
+    pdf_buffer = io.BytesIO()
+    HTML(string=report.render(render_data)).write_pdf(pdf_buffer)
+    return pdf_buffer.getvalue()
+
+
+def write_document(path: Path, content: bytes):
+    # write to temporary file first, so a crash never leaves a partial document
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".pdf.part")
+    tmp_path.write_bytes(content)
+    tmp_path.replace(path)
@@ -0,0 +1,118 @@
+"""
+Postgres backed queue of invoice document render jobs.
+
+API enqueues a job for an invoice, workers started with `python -m app.cli.document_worker`
+claim pending jobs with FOR UPDATE SKIP LOCKED, so any number of workers can
+consume the queue without rendering the same document twice.
+"""
+
+from datetime import timedelta
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.database.models.document import DocumentStatus, InvoiceDocument
+
+__all__ = [
+    "claim_document",
+    "complete_document",
+    "enqueue_document",
+    "fail_document",
+    "find_document",
+]
+
+
+def find_document(session: Session, invoice_id: int) -> InvoiceDocument | None:
+    return session.execute(
+        select(InvoiceDocument).filter(
+            InvoiceDocument.electricity_invoice_id == invoice_id
+        )
+    ).scalar_one_or_none()
+
+
+def enqueue_document(
+    session: Session, invoice_id: int, rerender: bool = False
+) -> InvoiceDocument:
+    """
+    Creates a render job for the invoice, an existing job is returned as it is.
+    Failed jobs are queued again, done jobs only when rerender is set.
+    """
+    requeue_statuses = [DocumentStatus.FAILED]
+    if rerender:
+        requeue_statuses.append(DocumentStatus.DONE)
+
+    statement = (
+        insert(InvoiceDocument)
+        .values(electricity_invoice_id=invoice_id, status=DocumentStatus.PENDING)
+        .on_conflict_do_update(
+            index_elements=[InvoiceDocument.electricity_invoice_id],
+            set_={
+                "status": DocumentStatus.PENDING,
+                "attempts": 0,
+                "error": None,
+                "updated_at": func.now(),
+            },
+            where=InvoiceDocument.status.in_(requeue_statuses),
+        )
+        .returning(InvoiceDocument)
+    )
+    document = session.execute(
+        statement, execution_options={"populate_existing": True}
+    ).scalar_one_or_none()
+
+    # conflicting row was not updated, job is already queued or done
+    if document is None:
+        document = find_document(session, invoice_id)
+    return document
+
+
+def claim_document(session: Session, stale_after: timedelta) -> InvoiceDocument | None:
+    """
+    Marks the oldest pending job as running and returns it.
+    Running jobs not updated for stale_after belong to a crashed worker and are claimed again.
+    Caller commits the transaction, so other workers see the job as running.
+    """
+    claimable = (
+        select(InvoiceDocument.id)
+        .filter(
+            or_(
+                InvoiceDocument.status == DocumentStatus.PENDING,
+                (InvoiceDocument.status == DocumentStatus.RUNNING)
+                & (InvoiceDocument.updated_at < func.now() - stale_after),
+            )
+        )
+        .order_by(InvoiceDocument.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    statement = (
+        update(InvoiceDocument)
+        .filter(InvoiceDocument.id == claimable)
+        .values(
+            status=DocumentStatus.RUNNING,
+            attempts=InvoiceDocument.attempts + 1,
+            updated_at=func.now(),
+        )
+        .returning(InvoiceDocument)
+    )
+    return session.execute(
+        statement, execution_options={"populate_existing": True}
+    ).scalar_one_or_none()
+
+
+def complete_document(document: InvoiceDocument, path: str):
+    document.status = DocumentStatus.DONE
+    document.document_path = path
+    document.error = None
+
+
+def fail_document(document: InvoiceDocument, error: str, max_attempts: int):
+    # job is retried by the next free worker, until attempts are used up
+    document.status = (
+        DocumentStatus.FAILED
+        if document.attempts >= max_attempts
+        else DocumentStatus.PENDING
+    )
+    document.error = error
@@ -0,0 +1,55 @@
+"""
+Largest-Triangle-Three-Buckets downsampling of time series for charts.
+
+Points are split into buckets of equal size, from each bucket the point that forms
+the largest triangle with the previously selected point and the average of the next
+bucket is kept. Peaks and dips stay visible, unlike with averaging or every n-th point.
+"""
+
+from typing import Sequence
+
+__all__ = ["lttb_indices"]
+
+
+def lttb_indices(x: Sequence[float], y: Sequence[float], max_points: int) -> list[int]:
+    """
+    Returns indices of at most max_points points to keep, in order,
+    first and last points are always kept. x values must be increasing.
+    """
+    count = len(x)
+    if max_points >= count or max_points < 3:
+        return list(range(count))
+
+    # first and last points are not part of any bucket,
+    # bounds are integer divisions, so the last bucket ends right before the last point
+    buckets = max_points - 2
+    inner = count - 2
+    selected = [0]
+    previous = 0
+    for bucket in range(buckets):
+        start = bucket * inner // buckets + 1
+        end = (bucket + 1) * inner // buckets + 1
+
+        # average of the next bucket, for the last bucket this is the last point
+        next_start = end
+        next_end = min((bucket + 2) * inner // buckets + 1, count)
+        next_count = next_end - next_start
+        average_x = sum(x[next_start:next_end]) / next_count
+        average_y = sum(y[next_start:next_end]) / next_count
+
+        previous_x = x[previous]
+        previous_y = y[previous]
+        largest_area = -1.0
+        for index in range(start, end):
+            # double area of the triangle, only used for comparison
+            area = abs(
+                (previous_x - average_x) * (y[index] - previous_y)
+                - (previous_x - x[index]) * (average_y - previous_y)
+            )
+            if area > largest_area:
+                largest_area = area
+                previous = index
+        selected.append(previous)
+
+    selected.append(count - 1)
+    return selected
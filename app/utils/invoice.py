@@ -1,170 +1,550 @@
+from bisect import bisect_right
 from collections import defaultdict
-from datetime import date
-import io
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import NamedTuple
 
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import bindparam, text
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session, joinedload
 
-from app.database.models.configuration import SeasonDayType
+from app.database.models.configuration import (
+    ElectricitySeason,
+    HourlyBlockLevel,
+    SeasonDayType,
+)
+from app.database.models.customer import (
+    CustomerContract,
+    CustomerType,
+    PriceSchedule,
+)
+from app.database.models.invoice import ElectricityInvoice, ElectricityInvoiceItem
+from app.database.models.measurement import MeasurementDayType
+from app.schema.invoice import CreateInvoice
+from app.utils.money import (
+    CENT,
+    FIXED_POINT_CONSUMPTION,
+    FIXED_POINT_SCALE,
+    TAX_RATE,
+    WATT,
+    WATT_HOUR,
+    allocate_rounded,
+    fixed_point_price,
+    from_fixed_point,
+    round_half_up,
+)
 
 __all__ = [
-    "calculate_measurements_total_usage",
-    "calculate_measurements_time_block_usage",
+    "MEASUREMENT_DEMAND",
+    "MEASUREMENT_PRICE",
+    "PEAK_DEMAND_CUSTOMER_TYPES",
+    "PEAK_DEMAND_ITEM_PREFIX",
+    "PEAK_DEMAND_UNIT",
+    "PRICE_SCHEDULE_JOIN",
+    "UNPRICED_MEASUREMENT",
+    "DailyUsage",
+    "SeasonSegment",
+    "UnpricedMeasurementsError",
+    "build_invoice",
+    "calculate_measurements_daily_usage",
+    "count_schedule_priced_measurements",
+    "count_unpriced_measurements",
+    "demand_items",
+    "energy_items",
+    "find_period_invoice",
+    "invoice_service_date",
+    "load_block_levels",
+    "load_invoices_with_details",
+    "load_season_months",
+    "lock_invoice_period",
+    "peak_demand",
+    "season_month_numbers",
+    "season_segment_peaks",
+    "season_segment_totals",
+    "season_segments",
+    "time_block_totals",
+    "usage_profile",
 ]
 
+# measurements without their own price are priced by the price schedule
+# of the contract package, for the local day and time block level of the measurement,
+# provider_id and package_name are SQL expressions of the contract
+PRICE_SCHEDULE_JOIN = """
+    LEFT JOIN electricity_price_schedules ps ON eem.price_per_kwh IS NULL
+        AND ps.provider_id = {provider_id}
+        AND ps.package_name = {package_name}
+        AND ps.block_level = eem.block_level
+        AND ps.valid_from <= eem.measured_at::date
+        AND (ps.valid_to IS NULL OR ps.valid_to > eem.measured_at::date)
+"""
+MEASUREMENT_PRICE = fixed_point_price("COALESCE(eem.price_per_kwh, ps.price_per_kwh)")
+CONTRACT_PRICE_SCHEDULE_JOIN = PRICE_SCHEDULE_JOIN.format(
+    provider_id=":provider_id", package_name=":package_name"
+)
+# measurement with neither its own price nor a price schedule, it can not be invoiced
+UNPRICED_MEASUREMENT = "eem.price_per_kwh IS NULL AND ps.id IS NULL"
 
-def calculate_measurements_total_usage(
-    session: Session, year: int, month: int, customer_id: int
-):
-    start_date = date(year, month, 1)
-    end_date = start_date + relativedelta(months=1)
-
-    # Raw SQL query with named parameters
-    query = text("""
-        SELECT 
-            COALESCE(SUM(eem.consumption_kwh * eem.price_per_kwh), 0) AS total_price,
-            COALESCE(SUM(eem.consumption_kwh), 0) AS total_consumption
-        FROM measurements_electricity_usage eem
-        WHERE eem.customer_id = :customer_id
-        AND eem.measured_at >= :start_date
-        AND eem.measured_at < :end_date
-    """)
+# contracts with peak demand items on invoices
+PEAK_DEMAND_CUSTOMER_TYPES = frozenset({CustomerType.BUSINESS, CustomerType.MUNICIPIAL})
+PEAK_DEMAND_ITEM_PREFIX = "Konična moč - "
+PEAK_DEMAND_UNIT = "kW"
 
-    # Execute with parameters
-    result = session.execute(
-        query,
-        {"customer_id": customer_id, "start_date": start_date, "end_date": end_date},
-    ).fetchone()
+# average power of a measurement in kW, over the time since the previous measurement
+# of the window named measurements, the first one uses the time until the next one,
+# longer gaps than an hour are missing measurements and not a lower power
+MEASUREMENT_DEMAND = """
+    eem.consumption_kwh * 3600 / EXTRACT(EPOCH FROM LEAST(
+        COALESCE(
+            eem.measured_at - lag(eem.measured_at) OVER measurements,
+            lead(eem.measured_at) OVER measurements - eem.measured_at,
+            INTERVAL '15 minutes'
+        ),
+        INTERVAL '1 hour'
+    ))
+"""
 
-    # Access results
-    total_price = result.total_price
-    total_consumption = result.total_consumption
 
-    return total_price, total_consumption
+class DailyUsage(NamedTuple):
+    day: date
+    time_block: int
+    price: Decimal
+    consumption: Decimal
+    # highest average power in kW, only for contracts with peak demand
+    peak_demand: Decimal | None = None
 
 
-def calculate_measurements_time_block_usage(
-    session: Session, year: int, month: int, customer_id: int
-):
-    workday_blocks_with_hours = defaultdict(list)
-    offday_blocks_with_hours = defaultdict(list)
+class UnpricedMeasurementsError(ValueError):
+    """Measurements of the invoiced period have no price and no price schedule."""
 
-    query = text("""
-        SELECT l.level, l.hour, l.day_type
-        FROM config_electricity_seasons s
-        JOIN config_hourly_block_levels l on s.id = l.electricity_season_id
-        WHERE  (s.crosses_calendar_year = FALSE AND s.start_month <= :month AND  s.end_month  >= :month )
-        OR (s.crosses_calendar_year = TRUE AND ( s.start_month <= :month AND  s.end_month  >= :month ) )
-        ORDER BY l.day_type, l.level, l.hour
-    """)
+    def __init__(self, count: int, invoice_ids: list[int] | None = None):
+        super().__init__(f"{count} measurements have no price")
+        self.count = count
+        self.invoice_ids = invoice_ids or []
 
-    result = session.execute(
-        query,
-        {
-            "month": month,
-        },
-    ).all()
 
-    for row in result:
-        level, hour, day_type = row
-        if day_type == SeasonDayType.WORKDAY.name:
-            workday_blocks_with_hours[level].append(hour)
-        elif day_type == SeasonDayType.OFFDAY.name:
-            offday_blocks_with_hours[level].append(hour)
+class SeasonSegment(NamedTuple):
+    # part of the invoiced period inside one season, both days are included
+    season_id: int | None
+    date_from: date
+    date_to: date
 
-    union_keys = set(workday_blocks_with_hours.keys()) | set(
-        offday_blocks_with_hours.keys()
-    )
-    possible_time_blocks = sorted(list(union_keys))
 
+def invoice_service_date(year: int, month: int) -> date:
+    # service date is the last day of the invoiced month
     start_date = date(year, month, 1)
-    end_date = start_date + relativedelta(months=1)
+    return start_date + relativedelta(months=1) - relativedelta(days=1)
 
-    # this is final date of the range
-    final_date_measurements = end_date - relativedelta(days=1)
 
-    timeblock_usage = []
+def lock_invoice_period(session: Session, contract_id: int):
+    """
+    Transaction level lock for invoices of a contract.
+    Invoice periods of a contract must not overlap, so concurrent requests
+    for any period of the contract wait here, until the first one commits.
+    """
+    session.execute(select(func.pg_advisory_xact_lock(contract_id, 0)))
+
+
+def find_period_invoice(
+    session: Session, contract_id: int, period_start: date, period_end: date
+) -> ElectricityInvoice | None:
+    # invoice of the contract which overlaps the period
+    return (
+        session.query(ElectricityInvoice)
+        .filter(ElectricityInvoice.contract_id == contract_id)
+        .filter(ElectricityInvoice.service_date >= period_start)
+        .filter(ElectricityInvoice.period_start <= period_end)
+        .order_by(ElectricityInvoice.period_start)
+        .first()
+    )
 
-    for time_block in possible_time_blocks:
-        price_sum, consumption_sum = 0.0, 0.0
 
-        if time_block in workday_blocks_with_hours:
-            price, consumption = _calculate_time_block(
-                session,
-                start_date,
-                end_date,
-                customer_id,
-                workday_blocks_with_hours[time_block],
-                SeasonDayType.WORKDAY,
+def load_invoices_with_details(
+    session: Session, invoice_ids: list[int]
+) -> dict[int, ElectricityInvoice]:
+    """
+    Invoices with items, contract, provider and customer, loaded in a single statement,
+    used for invoice details and document data of any number of invoices.
+    """
+    invoices = (
+        session.execute(
+            select(ElectricityInvoice)
+            .options(
+                joinedload(ElectricityInvoice.items),
+                joinedload(ElectricityInvoice.customer_contract).options(
+                    joinedload(CustomerContract.provider, innerjoin=True),
+                    joinedload(CustomerContract.customer, innerjoin=True),
+                ),
             )
-            price_sum += price
-            consumption_sum += consumption
-
-        if time_block in offday_blocks_with_hours:
-            price, consumption = _calculate_time_block(
-                session,
-                start_date,
-                end_date,
-                customer_id,
-                offday_blocks_with_hours[time_block],
-                SeasonDayType.OFFDAY,
+            .filter(ElectricityInvoice.id.in_(invoice_ids))
+        )
+        .unique()
+        .scalars()
+    )
+    return {invoice.id: invoice for invoice in invoices}
+
+
+def season_month_numbers(start_month: int, end_month: int) -> list[int]:
+    # months from start to end month, both included,
+    # seasons crossing calendar year wrap around december
+    months = [start_month]
+    while months[-1] != end_month:
+        months.append(months[-1] % 12 + 1)
+    return months
+
+
+def load_season_months(session: Session) -> dict[int, int]:
+    # season id for each month
+    return {
+        month: season.id
+        for season in session.query(ElectricitySeason)
+        for month in season_month_numbers(season.start_month, season.end_month)
+    }
+
+
+def load_block_levels(session: Session) -> dict[tuple, int]:
+    """
+    Level of time block for month, day type and hour of a measurement.
+    National holidays are currently ignored in the calculation for offdays.
+    """
+    season_months = load_season_months(session)
+    day_types = {
+        SeasonDayType.WORKDAY: MeasurementDayType.WORKDAY,
+        SeasonDayType.OFFDAY: MeasurementDayType.OFFDAY,
+    }
+    block_levels = {}
+    for block_level in session.query(HourlyBlockLevel):
+        for month, season_id in season_months.items():
+            if season_id == block_level.electricity_season_id:
+                key = (month, day_types[block_level.day_type], block_level.hour)
+                block_levels[key] = block_level.level
+    return block_levels
+
+
+def season_segments(
+    season_months: dict[int, int], date_from: date, date_to: date
+) -> list[SeasonSegment]:
+    """
+    Splits the period into parts with the same season,
+    seasons change only at the start of a month.
+    """
+    segments = []
+    month_start = date_from.replace(day=1)
+    while month_start <= date_to:
+        season_id = season_months.get(month_start.month)
+        segment_from = max(month_start, date_from)
+        segment_to = min(month_start + relativedelta(months=1, days=-1), date_to)
+        if segments and segments[-1].season_id == season_id:
+            segments[-1] = segments[-1]._replace(date_to=segment_to)
+        else:
+            segments.append(SeasonSegment(season_id, segment_from, segment_to))
+        month_start += relativedelta(months=1)
+    return segments
+
+
+def build_invoice(
+    session: Session, customer_contract: CustomerContract, data: CreateInvoice
+) -> ElectricityInvoice:
+    """
+    Calculates usage for the selected period and returns an invoice with its items.
+    Measurements of the whole period are read once, items are calculated per
+    time block and season segment of the period.
+    Invoice is not added to the session, this is left to the caller.
+    """
+    start_date, service_date = data.invoice_period
+    daily_usage = calculate_measurements_daily_usage(
+        session, start_date, service_date, customer_contract
+    )
+    segments = season_segments(load_season_months(session), start_date, service_date)
+    # it could be possible that price is 0 for time block, but consumption should still be present
+    timeblock_usage = [
+        (segment, time_block, price, consumption)
+        for (segment, time_block), (price, consumption) in season_segment_totals(
+            daily_usage, segments
+        ).items()
+        if consumption > 0
+    ]
+
+    issued_date = date.today()
+    due_date = issued_date + relativedelta(days=data.days_payment_due)
+
+    # totals are sums over all time blocks of the period
+    total_price = sum((usage.price for usage in daily_usage), Decimal(0))
+    total_consumption = sum((usage.consumption for usage in daily_usage), Decimal(0))
+    base_amount = round_half_up(total_price)
+    tax_amount = round_half_up(base_amount * TAX_RATE)
+    total_amount = base_amount + tax_amount
+
+    # items are rounded together, so their sum matches the invoice totals
+    item_quantities = allocate_rounded(
+        [consumption for _, _, _, consumption in timeblock_usage], WATT_HOUR
+    )
+    item_amounts = allocate_rounded([price for _, _, price, _ in timeblock_usage], CENT)
+
+    invoice = ElectricityInvoice(
+        contract_id=customer_contract.id,
+        payment_reason=data.payment_reason,
+        receiver_reference=data.receiver_reference,
+        invoice_number=data.invoice_number,
+        location_issued=data.location_issued,
+        invoice_code=data.invoice_code,
+        receiver_IBAN=customer_contract.provider.iban_number,
+        issued_date=issued_date,
+        due_date=due_date,
+        period_start=start_date,
+        service_date=service_date,
+        base_amount=base_amount,
+        tax_amount=tax_amount,
+        total_amount=total_amount,
+        total_quantity=round_half_up(total_consumption, WATT_HOUR),
+        usage_profile=usage_profile(daily_usage, start_date, service_date),
+    )
+
+    for (segment, time_block, _, _), quantity, amount in zip(
+        timeblock_usage, item_quantities, item_amounts
+    ):
+        invoice.items.append(
+            ElectricityInvoiceItem(
+                name="Časovni block " + str(time_block),
+                unit="kWh",
+                time_block=time_block,
+                quantity=quantity,
+                amount=amount,
+                date_from=segment.date_from,
+                date_to=segment.date_to,
             )
-            price_sum += price
-            consumption_sum += consumption
-
-        # it could be possible that price is 0 fro time block, but consumtion should still be present
-        if consumption_sum > 0:
-            timeblock_usage.append(
-                {
-                    "time_block": time_block,
-                    "consumption": consumption_sum,
-                    "price": price_sum,
-                    "start_date": start_date,
-                    "end_date": final_date_measurements,
-                }
+        )
+
+    # peak demand items only show power, they are not priced
+    for (segment, time_block), peak in season_segment_peaks(
+        daily_usage, segments
+    ).items():
+        invoice.items.append(
+            ElectricityInvoiceItem(
+                name=PEAK_DEMAND_ITEM_PREFIX + "Časovni block " + str(time_block),
+                unit=PEAK_DEMAND_UNIT,
+                time_block=time_block,
+                quantity=peak,
+                amount=Decimal(0),
+                date_from=segment.date_from,
+                date_to=segment.date_to,
             )
+        )
+
+    return invoice
+
+
+def energy_items(items: list[ElectricityInvoiceItem]) -> list[ElectricityInvoiceItem]:
+    # consumption items and their corrections, quantities add up to total_quantity
+    return [item for item in items if item.unit != PEAK_DEMAND_UNIT]
+
+
+def demand_items(items: list[ElectricityInvoiceItem]) -> list[ElectricityInvoiceItem]:
+    # peak demand in kW, not part of invoiced quantity or amounts
+    return [item for item in items if item.unit == PEAK_DEMAND_UNIT]
+
+
+def _contract_parameters(customer_contract: CustomerContract) -> dict:
+    return {
+        "customer_id": customer_contract.customer_id,
+        "provider_id": customer_contract.provider_id,
+        "package_name": customer_contract.package_name,
+    }
 
-    return timeblock_usage
 
+def peak_demand(value) -> Decimal | None:
+    return None if value is None else round_half_up(value, WATT)
 
-def _calculate_time_block(
+
+def calculate_measurements_daily_usage(
     session: Session,
-    start_date: date,
-    end_date: date,
-    customer_id: int,
-    hours: list,
-    day_type: SeasonDayType,
-):
-    query_string = """
-    SELECT COALESCE(SUM(eem.consumption_kwh * eem.price_per_kwh), 0) as total_price,
-        COALESCE(SUM(eem.consumption_kwh), 0) as total_consumption
-        FROM measurements_electricity_usage eem 
-        WHERE  eem.customer_id = :customer_id
-        AND  eem.measured_at >= DATE :start_date
-        AND eem.measured_at < DATE :end_date
-        AND EXTRACT(HOUR FROM eem.measured_at) IN :hours
-    """
-
-    # national holidays are currently ignored in the calculation for offdays
-    if day_type == SeasonDayType.OFFDAY:
-        query_string += " AND EXTRACT(DOW FROM eem.measured_at) IN (0, 6) "
-
-    elif day_type == SeasonDayType.WORKDAY:
-        query_string += " AND EXTRACT(DOW FROM eem.measured_at) BETWEEN 1 AND 5"
-
-    query = text(query_string).bindparams(bindparam("hours", expanding=True))
+    date_from: date,
+    date_to: date,
+    customer_contract: CustomerContract,
+) -> list[DailyUsage]:
+    """
+    Usage per day and time block in a single query over the whole period,
+    invoice items, totals and usage profile are all calculated from it.
+    Prices are resolved from price schedules of the contract package.
+    Peak demand of contracts that need it is taken in the same pass,
+    from power of consecutive measurements.
+    Raises UnpricedMeasurementsError when a measurement has no price.
+    """
+    demand = (
+        MEASUREMENT_DEMAND
+        if customer_contract.customer_type in PEAK_DEMAND_CUSTOMER_TYPES
+        else "NULL::double precision"
+    )
+    # power is calculated before measurements outside of time blocks are left out
+    query = text(f"""
+        SELECT eem.measured_at::date AS day, eem.block_level AS time_block,
+            SUM({MEASUREMENT_PRICE}) AS price,
+            SUM({FIXED_POINT_CONSUMPTION}) AS consumption,
+            MAX(eem.demand) AS peak_demand,
+            COUNT(*) FILTER (WHERE {UNPRICED_MEASUREMENT}) AS unpriced
+        FROM (
+            SELECT eem.*, {demand} AS demand
+            FROM measurements_electricity_usage eem
+            WHERE eem.customer_id = :customer_id
+            AND eem.measured_at >= :start_date
+            AND eem.measured_at < :end_date
+            WINDOW measurements AS (ORDER BY eem.measured_at)
+        ) eem
+        {CONTRACT_PRICE_SCHEDULE_JOIN}
+        WHERE eem.block_level IS NOT NULL
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    """)
 
     result = session.execute(
         query,
         {
-            "customer_id": customer_id,
-            "start_date": start_date,
-            "end_date": end_date,
-            "hours": hours,
+            **_contract_parameters(customer_contract),
+            "start_date": date_from,
+            "end_date": date_to + timedelta(days=1),
+        },
+    ).all()
+    # unpriced energy would be invoiced for free
+    unpriced = sum(row.unpriced for row in result)
+    if unpriced:
+        raise UnpricedMeasurementsError(unpriced)
+    return [
+        DailyUsage(
+            row.day,
+            row.time_block,
+            from_fixed_point(row.price, 2 * FIXED_POINT_SCALE),
+            from_fixed_point(row.consumption),
+            peak_demand(row.peak_demand),
+        )
+        for row in result
+    ]
+
+
+def count_unpriced_measurements(
+    session: Session,
+    customer_contract: CustomerContract,
+    first: datetime,
+    last: datetime,
+) -> int:
+    # measurements between first and last, which have no price of their own or in schedules
+    return session.execute(
+        text(f"""
+            SELECT count(*)
+            FROM measurements_electricity_usage eem
+            {CONTRACT_PRICE_SCHEDULE_JOIN}
+            WHERE eem.customer_id = :customer_id
+            AND eem.measured_at >= :first
+            AND eem.measured_at <= :last
+            AND eem.block_level IS NOT NULL
+            AND {UNPRICED_MEASUREMENT}
+        """),
+        {**_contract_parameters(customer_contract), "first": first, "last": last},
+    ).scalar_one()
+
+
+def count_schedule_priced_measurements(
+    session: Session, schedule: PriceSchedule
+) -> int:
+    """
+    Stored measurements without their own price, of customers with contracts
+    of the schedule package, which are priced only by the given schedule.
+    """
+    return session.execute(
+        text(f"""
+            SELECT count(*)
+            FROM measurements_electricity_usage eem
+            {CONTRACT_PRICE_SCHEDULE_JOIN}
+                AND ps.id <> :schedule_id
+            WHERE eem.customer_id IN (
+                SELECT c.customer_id
+                FROM electricity_customers_contracts c
+                WHERE c.provider_id = :provider_id
+                AND c.package_name = :package_name
+            )
+            AND eem.measured_at >= CAST(:valid_from AS date)
+            AND (CAST(:valid_to AS date) IS NULL
+                OR eem.measured_at < CAST(:valid_to AS date))
+            AND eem.block_level = :block_level
+            AND {UNPRICED_MEASUREMENT}
+        """),
+        {
+            "schedule_id": schedule.id,
+            "provider_id": schedule.provider_id,
+            "package_name": schedule.package_name,
+            "block_level": schedule.block_level,
+            "valid_from": schedule.valid_from,
+            "valid_to": schedule.valid_to,
         },
-    ).fetchone()
+    ).scalar_one()
+
+
+def time_block_totals(daily_usage: list[DailyUsage]) -> dict[int, tuple]:
+    # price and consumption per time block, ordered by level
+    totals = defaultdict(lambda: (Decimal(0), Decimal(0)))
+    for usage in daily_usage:
+        price, consumption = totals[usage.time_block]
+        totals[usage.time_block] = (
+            price + usage.price,
+            consumption + usage.consumption,
+        )
+    return dict(sorted(totals.items()))
+
+
+def season_segment_totals(
+    daily_usage: list[DailyUsage], segments: list[SeasonSegment]
+) -> dict[tuple[SeasonSegment, int], tuple]:
+    # price and consumption per season segment and time block, ordered by both
+    segment_starts = [segment.date_from for segment in segments]
+    totals = defaultdict(lambda: (Decimal(0), Decimal(0)))
+    for usage in daily_usage:
+        segment = segments[bisect_right(segment_starts, usage.day) - 1]
+        price, consumption = totals[(segment, usage.time_block)]
+        totals[(segment, usage.time_block)] = (
+            price + usage.price,
+            consumption + usage.consumption,
+        )
+    return dict(
+        sorted(totals.items(), key=lambda item: (item[0][0].date_from, item[0][1]))
+    )
+
+
+def season_segment_peaks(
+    daily_usage: list[DailyUsage], segments: list[SeasonSegment]
+) -> dict[tuple[SeasonSegment, int], Decimal]:
+    # highest peak demand per season segment and time block, ordered by both
+    segment_starts = [segment.date_from for segment in segments]
+    peaks = {}
+    for usage in daily_usage:
+        if usage.peak_demand is None:
+            continue
+        segment = segments[bisect_right(segment_starts, usage.day) - 1]
+        key = (segment, usage.time_block)
+        peaks[key] = max(peaks.get(key, usage.peak_demand), usage.peak_demand)
+    return dict(
+        sorted(peaks.items(), key=lambda item: (item[0][0].date_from, item[0][1]))
+    )
+
+
+def usage_profile(
+    daily_usage: list[DailyUsage], date_from: date, date_to: date
+) -> dict:
+    """
+    Compact consumption per day and time block, stored with the invoice,
+    so documents are rendered without reading measurements.
+    days[i][j] is consumption in kWh on date_from + i days in time_blocks[j].
+    """
+    time_blocks = sorted({usage.time_block for usage in daily_usage})
+    block_index = {time_block: index for index, time_block in enumerate(time_blocks)}
+
+    days = [[0.0] * len(time_blocks) for _ in range((date_to - date_from).days + 1)]
+    for usage in daily_usage:
+        day_index = (usage.day - date_from).days
+        if 0 <= day_index < len(days):
+            days[day_index][block_index[usage.time_block]] = float(
+                round_half_up(usage.consumption, WATT_HOUR)
+            )
 
-    total_price = result.total_price
-    total_consumption = result.total_consumption
-    return total_price, total_consumption
+    return {
+        "date_from": date_from.isoformat(),
+        "time_blocks": time_blocks,
+        "days": days,
+    }
@@ -0,0 +1,388 @@
+"""
+Change tracking of measurements and corrections of already created invoices.
+
+Every write to measurements marks the changed customer months as dirty windows.
+Invoices overlapping a dirty window are recalculated in batches, differences to
+already invoiced items are added as correction items per time block,
+so the original items stay unchanged.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import bindparam, delete, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.types import Date, Integer
+
+from app.database.models.document import InvoiceDocument
+from app.database.models.invoice import ElectricityInvoice, ElectricityInvoiceItem
+from app.database.models.measurement import MeasurementDirtyWindow
+from app.utils.invoice import (
+    MEASUREMENT_DEMAND,
+    MEASUREMENT_PRICE,
+    PEAK_DEMAND_CUSTOMER_TYPES,
+    PEAK_DEMAND_ITEM_PREFIX,
+    PEAK_DEMAND_UNIT,
+    PRICE_SCHEDULE_JOIN,
+    UNPRICED_MEASUREMENT,
+    DailyUsage,
+    SeasonSegment,
+    UnpricedMeasurementsError,
+    load_season_months,
+    peak_demand,
+    season_segment_peaks,
+    season_segment_totals,
+    season_segments,
+    usage_profile,
+)
+from app.utils.money import (
+    CENT,
+    FIXED_POINT_CONSUMPTION,
+    FIXED_POINT_SCALE,
+    TAX_RATE,
+    WATT_HOUR,
+    allocate_rounded,
+    from_fixed_point,
+    round_half_up,
+)
+
+__all__ = [
+    "CORRECTION_ITEM_PREFIX",
+    "clear_dirty_windows",
+    "find_corrected_invoices",
+    "mark_dirty_windows",
+    "mark_price_schedule_windows",
+    "recompute_corrected_invoices",
+]
+
+CORRECTION_ITEM_PREFIX = "Popravek - "
+
+# invoices are matched to dirty windows by customer and months of their period
+WINDOW_INVOICES = """
+    JOIN electricity_customers_contracts c ON c.customer_id = w.customer_id
+    JOIN electricity_invoices i ON i.contract_id = c.id
+        AND i.service_date >= w.month
+        AND i.period_start < w.month + INTERVAL '1 month'
+"""
+
+CORRECTED_INVOICES = f"""
+    SELECT w.customer_id, w.month, w.marked_at, i.id AS invoice_id, i.contract_id
+    FROM measurements_dirty_windows w
+    {WINDOW_INVOICES}
+    ORDER BY w.marked_at, i.id
+"""
+
+# windows of the batch are locked and removed, all invoices of a window are in the same batch,
+# invoice with several changed months is returned once for each of them
+CLAIM_BATCH = text(f"""
+    WITH windows AS (
+        SELECT w.customer_id, w.month
+        FROM measurements_dirty_windows w
+        WHERE EXISTS (
+            SELECT 1
+            FROM electricity_customers_contracts c
+            JOIN electricity_invoices i ON i.contract_id = c.id
+            WHERE c.customer_id = w.customer_id
+                AND i.service_date >= w.month
+                AND i.period_start < w.month + INTERVAL '1 month'
+        )
+        ORDER BY w.marked_at
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    ),
+    claimed AS (
+        DELETE FROM measurements_dirty_windows d
+        USING windows
+        WHERE d.customer_id = windows.customer_id AND d.month = windows.month
+        RETURNING d.customer_id, d.month, d.marked_at
+    )
+    SELECT w.customer_id, w.month, w.marked_at, i.id AS invoice_id, i.contract_id,
+        i.period_start::date AS period_start, i.service_date::date AS service_date
+    FROM claimed w
+    {WINDOW_INVOICES}
+    ORDER BY i.id
+""")
+
+# usage per day and time block over whole periods of all invoices in the batch,
+# prices are resolved from price schedules of the invoiced contract,
+# peak demand of contracts that need it is taken in the same pass
+PEAK_DEMAND_TYPES = ", ".join(
+    sorted(f"'{customer_type.name}'" for customer_type in PEAK_DEMAND_CUSTOMER_TYPES)
+)
+BATCH_USAGE = text(f"""
+    SELECT eem.invoice_id, eem.measured_at::date AS day, eem.block_level AS time_block,
+        SUM({MEASUREMENT_PRICE}) AS price,
+        SUM({FIXED_POINT_CONSUMPTION}) AS consumption,
+        MAX(eem.demand) AS peak_demand,
+        COUNT(*) FILTER (WHERE {UNPRICED_MEASUREMENT}) AS unpriced
+    FROM (
+        SELECT b.invoice_id, c.provider_id, c.package_name, eem.*,
+            CASE WHEN c.customer_type IN ({PEAK_DEMAND_TYPES})
+                THEN {MEASUREMENT_DEMAND} END AS demand
+        FROM unnest(:invoice_ids, :contract_ids, :period_starts, :period_ends)
+            AS b(invoice_id, contract_id, period_start, period_end)
+        JOIN electricity_customers_contracts c ON c.id = b.contract_id
+        JOIN measurements_electricity_usage eem ON eem.customer_id = c.customer_id
+            AND eem.measured_at >= b.period_start
+            AND eem.measured_at < b.period_end + INTERVAL '1 day'
+        WINDOW measurements AS (PARTITION BY b.invoice_id ORDER BY eem.measured_at)
+    ) eem
+    {PRICE_SCHEDULE_JOIN.format(provider_id="eem.provider_id", package_name="eem.package_name")}
+    WHERE eem.block_level IS NOT NULL
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+""").bindparams(
+    bindparam("invoice_ids", type_=ARRAY(Integer)),
+    bindparam("contract_ids", type_=ARRAY(Integer)),
+    bindparam("period_starts", type_=ARRAY(Date)),
+    bindparam("period_ends", type_=ARRAY(Date)),
+)
+
+
+def mark_dirty_windows(
+    session: Session, customer_id: int, first: datetime | date, last: datetime | date
+):
+    """
+    Marks all months between first and last measurement as changed.
+    Months are calculated by the database, same as in invoice calculation.
+    """
+    session.execute(
+        text("""
+            INSERT INTO measurements_dirty_windows (customer_id, month)
+            SELECT :customer_id, month::date
+            FROM generate_series(
+                date_trunc('month', CAST(:first AS timestamptz)),
+                date_trunc('month', CAST(:last AS timestamptz)),
+                INTERVAL '1 month'
+            ) AS month
+            ON CONFLICT (customer_id, month) DO UPDATE SET marked_at = now()
+        """),
+        {"customer_id": customer_id, "first": first, "last": last},
+    )
+
+
+def mark_price_schedule_windows(
+    session: Session,
+    provider_id: int,
+    package_name: str,
+    valid_from: date,
+    valid_to: date | None,
+):
+    """
+    Marks invoiced months of contracts with the package, which are inside
+    the validity of a changed price schedule, so that their invoices are corrected.
+    """
+    session.execute(
+        text("""
+            INSERT INTO measurements_dirty_windows (customer_id, month)
+            SELECT DISTINCT c.customer_id, month::date
+            FROM electricity_customers_contracts c
+            JOIN electricity_invoices i ON i.contract_id = c.id
+            CROSS JOIN LATERAL generate_series(
+                date_trunc('month', GREATEST(i.period_start, CAST(:valid_from AS date))),
+                date_trunc('month', LEAST(
+                    i.service_date,
+                    COALESCE(CAST(:valid_to AS date) - 1, i.service_date)
+                )),
+                INTERVAL '1 month'
+            ) AS month
+            WHERE c.provider_id = :provider_id
+            AND c.package_name = :package_name
+            AND i.service_date >= CAST(:valid_from AS date)
+            AND (CAST(:valid_to AS date) IS NULL OR i.period_start < CAST(:valid_to AS date))
+            ON CONFLICT (customer_id, month) DO UPDATE SET marked_at = now()
+        """),
+        {
+            "provider_id": provider_id,
+            "package_name": package_name,
+            "valid_from": valid_from,
+            "valid_to": valid_to,
+        },
+    )
+
+
+def clear_dirty_windows(
+    session: Session, customer_id: int, period_start: date, period_end: date
+):
+    """
+    Called before an invoice is calculated, newly calculated invoice already includes
+    all measurements of months in its period. Changes committed later mark them again.
+    """
+    session.execute(
+        delete(MeasurementDirtyWindow).filter(
+            MeasurementDirtyWindow.customer_id == customer_id,
+            MeasurementDirtyWindow.month >= period_start.replace(day=1),
+            MeasurementDirtyWindow.month <= period_end,
+        )
+    )
+
+
+def find_corrected_invoices(session: Session, limit: int | None = None) -> list:
+    query = CORRECTED_INVOICES
+    if limit:
+        query += " LIMIT :limit"
+    return session.execute(text(query), {"limit": limit}).all()
+
+
+def recompute_corrected_invoices(
+    session: Session, limit: int
+) -> list[ElectricityInvoice]:
+    """
+    Recalculates invoices of a batch of dirty windows.
+    Windows are removed before recalculation, so changes committed in the meantime
+    mark them again. Caller commits the transaction.
+    Raises UnpricedMeasurementsError when measurements of any invoice have no price.
+    """
+    affected = session.execute(CLAIM_BATCH, {"limit": limit}).all()
+    if not affected:
+        return []
+
+    # whole period is recalculated once, even when several of its months changed
+    periods = {row.invoice_id: row for row in affected}
+    rows = session.execute(
+        BATCH_USAGE,
+        {
+            "invoice_ids": list(periods),
+            "contract_ids": [row.contract_id for row in periods.values()],
+            "period_starts": [row.period_start for row in periods.values()],
+            "period_ends": [row.service_date for row in periods.values()],
+        },
+    ).all()
+    # unpriced energy would be credited, batch is left for when prices exist
+    unpriced = defaultdict(int)
+    for row in rows:
+        if row.unpriced:
+            unpriced[row.invoice_id] += row.unpriced
+    if unpriced:
+        raise UnpricedMeasurementsError(sum(unpriced.values()), sorted(unpriced))
+
+    daily_usage = defaultdict(list)
+    for row in rows:
+        daily_usage[row.invoice_id].append(
+            DailyUsage(
+                row.day,
+                row.time_block,
+                from_fixed_point(row.price, 2 * FIXED_POINT_SCALE),
+                from_fixed_point(row.consumption),
+                peak_demand(row.peak_demand),
+            )
+        )
+
+    invoices = (
+        session.execute(
+            select(ElectricityInvoice)
+            .options(selectinload(ElectricityInvoice.items))
+            .filter(ElectricityInvoice.id.in_(list(periods)))
+            .order_by(ElectricityInvoice.id)
+        )
+        .scalars()
+        .all()
+    )
+    season_months = load_season_months(session)
+    for invoice in invoices:
+        _apply_corrections(invoice, daily_usage[invoice.id], season_months)
+
+    # documents rendered before the correction are outdated
+    session.execute(
+        delete(InvoiceDocument).filter(
+            InvoiceDocument.electricity_invoice_id.in_([i.id for i in invoices])
+        )
+    )
+    return invoices
+
+
+def _apply_corrections(
+    invoice: ElectricityInvoice,
+    daily_usage: list[DailyUsage],
+    season_months: dict[int, int],
+):
+    period_start = invoice.period_start.date()
+    service_date = invoice.service_date.date()
+    segments = season_segments(season_months, period_start, service_date)
+
+    # invoiced items are matched to season segments by their first day
+    segment_by_start = {segment.date_from: segment for segment in segments}
+    invoiced = defaultdict(lambda: (Decimal(0), Decimal(0)))
+    # peak demand with its corrections, per segment and time block
+    invoiced_peaks = defaultdict(Decimal)
+    for item in invoice.items:
+        if item.time_block is not None:
+            item_from = item.date_from.date()
+            segment = segment_by_start.get(item_from) or SeasonSegment(
+                None, item_from, item.date_to.date()
+            )
+            if item.unit == PEAK_DEMAND_UNIT:
+                invoiced_peaks[(segment, item.time_block)] += item.quantity
+                continue
+            amount, quantity = invoiced[(segment, item.time_block)]
+            invoiced[(segment, item.time_block)] = (
+                amount + item.amount,
+                quantity + item.quantity,
+            )
+
+    totals = season_segment_totals(daily_usage, segments)
+    # blocks that are no longer present are credited in full
+    keys = sorted(
+        totals.keys() | invoiced.keys(), key=lambda key: (key[0].date_from, key[1])
+    )
+    prices = [totals.get(key, (0, 0))[0] for key in keys]
+    consumptions = [totals.get(key, (0, 0))[1] for key in keys]
+
+    # blocks are rounded together, same as when invoice was created
+    amounts = allocate_rounded(prices, CENT)
+    quantities = allocate_rounded(consumptions, WATT_HOUR)
+
+    for (segment, time_block), amount, quantity in zip(keys, amounts, quantities):
+        invoiced_amount, invoiced_quantity = invoiced[(segment, time_block)]
+        amount_delta = amount - invoiced_amount
+        quantity_delta = quantity - invoiced_quantity
+        if amount_delta == 0 and quantity_delta == 0:
+            continue
+
+        # positive values are debit and negative credit items,
+        # corrections cover the same period as invoiced items
+        invoice.items.append(
+            ElectricityInvoiceItem(
+                name=CORRECTION_ITEM_PREFIX + "Časovni block " + str(time_block),
+                unit="kWh",
+                time_block=time_block,
+                quantity=quantity_delta,
+                amount=amount_delta,
+                date_from=segment.date_from,
+                date_to=segment.date_to,
+            )
+        )
+
+    # peaks are not priced, changed peaks get an item with the difference
+    peaks = season_segment_peaks(daily_usage, segments)
+    for segment, time_block in sorted(
+        peaks.keys() | invoiced_peaks.keys(), key=lambda key: (key[0].date_from, key[1])
+    ):
+        peak_delta = (
+            peaks.get((segment, time_block), Decimal(0))
+            - invoiced_peaks[(segment, time_block)]
+        )
+        if peak_delta == 0:
+            continue
+        invoice.items.append(
+            ElectricityInvoiceItem(
+                name=CORRECTION_ITEM_PREFIX
+                + PEAK_DEMAND_ITEM_PREFIX
+                + "Časovni block "
+                + str(time_block),
+                unit=PEAK_DEMAND_UNIT,
+                time_block=time_block,
+                quantity=peak_delta,
+                amount=Decimal(0),
+                date_from=segment.date_from,
+                date_to=segment.date_to,
+            )
+        )
+
+    invoice.base_amount = round_half_up(sum(prices, Decimal(0)))
+    invoice.tax_amount = round_half_up(invoice.base_amount * TAX_RATE)
+    invoice.total_amount = invoice.base_amount + invoice.tax_amount
+    invoice.total_quantity = round_half_up(sum(consumptions, Decimal(0)), WATT_HOUR)
+    invoice.usage_profile = usage_profile(daily_usage, period_start, service_date)
@@ -0,0 +1,364 @@
+from datetime import UTC, datetime
+import gzip
+import io
+import math
+import os
+import re
+from typing import BinaryIO, Iterator, NamedTuple
+from zoneinfo import ZoneInfo
+import zlib
+
+import zstandard
+
+from app.database.models.measurement import LOCAL_TIMEZONE, MeasurementDayType
+
+__all__ = [
+    "DECOMPRESSION_ERRORS",
+    "MAX_DECOMPRESSED_SIZE",
+    "MEASUREMENT_COPY_COLUMNS",
+    "MEASUREMENT_FILENAME",
+    "DecompressedSizeError",
+    "MeasurementCsvError",
+    "ParsedMeasurements",
+    "SizeLimitedStream",
+    "ZstdFrames",
+    "decompressed_stream",
+    "parse_measurements_csv",
+]
+
+# customer id follows the last '-', file can be compressed with gzip or zstd
+MEASUREMENT_FILENAME = re.compile(r"-(\d+)\.csv(\.gz|\.zst)?$")
+# raised while lines are read from corrupted or truncated compressed files
+DECOMPRESSION_ERRORS = (EOFError, OSError, zlib.error, zstandard.ZstdError)
+# compressed files can expand far beyond the size of the request
+MAX_DECOMPRESSED_SIZE = (
+    int(os.getenv("MAX_DECOMPRESSED_UPLOAD_MB", "256")) * 1024 * 1024
+)
+
+# columns written by parser, created_at and updated_at use database defaults
+MEASUREMENT_COPY_COLUMNS = (
+    "customer_id",
+    "measured_at",
+    "consumption_kwh",
+    "price_per_kwh",
+    "local_hour",
+    "day_type",
+    "block_level",
+)
+
+CSV_SEPARATOR = ";"
+# price column is optional, without it prices are resolved from price schedules
+CSV_COLUMNS_WITHOUT_PRICE = 2
+CSV_COLUMNS = 3
+# only first errors are returned, the whole file is still validated
+MAX_REPORTED_ERRORS = 100
+# value of missing price or block level in COPY text format
+COPY_NULL = b"\\N"
+
+local_timezone = ZoneInfo(LOCAL_TIMEZONE)
+
+
+class MeasurementCsvError(NamedTuple):
+    line: int
+    error: str
+
+
+class ParsedMeasurements(io.RawIOBase):
+    """
+    Rows of the file in the text format of postgres COPY command, converted while
+    COPY reads them, so only the current row and line are held in memory.
+    Errors, record count and range of timestamps are complete once all rows are read.
+    Errors of the input stream end the rows and are kept in failure,
+    through COPY they would only be reported as a cancelled statement.
+    """
+
+    def __init__(self):
+        self.records = 0
+        self.errors: list[MeasurementCsvError] = []
+        self.error_count = 0
+        # false when the file has no price column
+        self.has_prices = True
+        # range of valid timestamps, used to mark changed months
+        self.first_measured_at: datetime | None = None
+        self.last_measured_at: datetime | None = None
+        self.failure: Exception | None = None
+        self._rows: Iterator[bytes] = iter(())
+        self._row = b""
+
+    def add_error(self, line: int, error: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(MeasurementCsvError(line, error))
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        size = 0
+        while size < len(target):
+            if not self._row:
+                row = self._next_row()
+                if row is None:
+                    break
+                self._row = row
+                continue
+            chunk = self._row[: len(target) - size]
+            target[size : size + len(chunk)] = chunk
+            size += len(chunk)
+            self._row = self._row[len(chunk) :]
+        return size
+
+    def _next_row(self) -> bytes | None:
+        try:
+            return next(self._rows, None)
+        except (DecompressedSizeError, *DECOMPRESSION_ERRORS) as e:
+            self.failure = e
+            self._rows = iter(())
+            return None
+
+
+class DecompressedSizeError(Exception):
+    """Decompressed content of an upload is larger than the allowed size."""
+
+
+class ZstdFrames(io.RawIOBase):
+    """
+    Decompressed data of consecutive zstd frames, read in small chunks of input.
+    Unlike stream readers of zstandard, an incomplete last frame is an error,
+    so truncated uploads are not stored partially.
+    """
+
+    read_size = 16 * 1024
+    # a zstd block decompresses to at most 128 KiB from as little as 4 bytes,
+    # input is decompressed in slices, so output of one slice is at most 8 MiB
+    slice_size = 256
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._frame = None
+        self._data = memoryview(b"")
+        self._position = 0
+        self._pending = memoryview(b"")
+        self._offset = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        while self._offset == len(self._pending):
+            if self._position == len(self._data):
+                self._data = memoryview(self._stream.read(self.read_size))
+                self._position = 0
+                if not self._data:
+                    if self._frame is not None and not self._frame.eof:
+                        raise zstandard.ZstdError("zstd frame is incomplete")
+                    return 0
+
+            if self._frame is None or self._frame.eof:
+                self._frame = self._decompressor.decompressobj()
+            data = self._data[self._position : self._position + self.slice_size]
+            self._pending = memoryview(self._frame.decompress(data))
+            self._offset = 0
+            self._position += len(data)
+            # slice can end one frame and start the next one
+            if self._frame.eof:
+                self._position -= len(self._frame.unused_data)
+
+        size = min(len(target), len(self._pending) - self._offset)
+        target[:size] = self._pending[self._offset : self._offset + size]
+        self._offset += size
+        return size
+
+
+class SizeLimitedStream(io.RawIOBase):
+    """Decompressed stream, which raises DecompressedSizeError after max_size bytes."""
+
+    def __init__(self, stream: BinaryIO, max_size: int):
+        self._stream = stream
+        self._max_size = max_size
+        self._size = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        size = self._stream.readinto(target)
+        self._size += size
+        if self._size > self._max_size:
+            raise DecompressedSizeError(
+                f"Decompressed file is larger than {self._max_size} bytes"
+            )
+        return size
+
+
+def decompressed_stream(
+    stream: BinaryIO, extension: str | None, max_size: int | None = None
+) -> BinaryIO:
+    """
+    Returns a stream of decompressed lines for extension .gz or .zst,
+    files are decompressed while they are parsed and never held whole in memory.
+    Decompressed content is limited to max_size bytes, by default MAX_DECOMPRESSED_SIZE.
+    """
+    if extension == ".gz":
+        decompressed = gzip.GzipFile(fileobj=stream, mode="rb")
+    elif extension == ".zst":
+        decompressed = ZstdFrames(stream)
+    else:
+        return stream
+    return io.BufferedReader(
+        SizeLimitedStream(decompressed, max_size or MAX_DECOMPRESSED_SIZE)
+    )
+
+
+def _parse_decimal(value: str) -> float:
+    # decimal comma is used in exported files
+    number = float(value.replace(",", "."))
+    if not math.isfinite(number):
+        raise ValueError
+    return number
+
+
+def parse_measurements_csv(
+    stream: BinaryIO, customer_id: int, block_levels: dict[tuple, int]
+) -> ParsedMeasurements:
+    """
+    Validates measurements in a single pass and converts them for COPY,
+    rows are converted while the returned file is read, only the header is read here.
+    File has a header line, followed by rows: measured_at;consumption_kwh;price_per_kwh
+    Price column can be left out, number of columns is given by the header.
+    Timestamps are in ISO 8601 format and numbers can use decimal comma,
+    timestamps without offset are in local time. Hour repeated when summer time ends
+    has no offset to tell its occurrences apart, its second occurrence is recognized
+    by following the first one in the file.
+    Local hour, day type and time block level are resolved for every row,
+    block_levels maps (month, day type, hour) to level, see load_block_levels.
+    Duplicate timestamps are not detected, they are rejected by the primary key
+    of measurements, together with timestamps that are already stored.
+    """
+    parsed = ParsedMeasurements()
+    parsed._rows = _copy_rows(parsed, stream, customer_id, block_levels)
+    # rows stop after the header, so it is known whether prices are in the file
+    parsed._row = parsed._next_row() or b""
+    return parsed
+
+
+def _copy_rows(
+    parsed: ParsedMeasurements,
+    stream: BinaryIO,
+    customer_id: int,
+    block_levels: dict[tuple, int],
+) -> Iterator[bytes]:
+    first_timestamp = last_timestamp = previous_timestamp = None
+    customer_value = str(customer_id).encode()
+    columns = CSV_COLUMNS
+
+    for line_number, raw_line in enumerate(stream, start=1):
+        try:
+            line = raw_line.decode("utf-8-sig" if line_number == 1 else "utf-8")
+        except UnicodeDecodeError:
+            parsed.add_error(line_number, "Line is not valid UTF-8")
+            continue
+
+        line = line.strip()
+        if not line:
+            continue
+
+        values = [value.strip().strip('"') for value in line.split(CSV_SEPARATOR)]
+        # first line is header
+        if line_number == 1:
+            if len(values) == CSV_COLUMNS_WITHOUT_PRICE:
+                columns = CSV_COLUMNS_WITHOUT_PRICE
+                parsed.has_prices = False
+            elif len(values) != CSV_COLUMNS:
+                parsed.add_error(
+                    line_number,
+                    f"Expected {CSV_COLUMNS_WITHOUT_PRICE} or {CSV_COLUMNS} columns, "
+                    f"found {len(values)}",
+                )
+            yield b""
+            continue
+
+        if len(values) != columns:
+            parsed.add_error(
+                line_number,
+                f"Expected {columns} columns, found {len(values)}",
+            )
+            continue
+
+        try:
+            measured_at = datetime.fromisoformat(values[0])
+        except ValueError:
+            parsed.add_error(line_number, f"Invalid timestamp '{values[0]}'")
+            continue
+        if measured_at.tzinfo is None:
+            local_time = measured_at.replace(tzinfo=local_timezone)
+            # times skipped when summer time starts do not exist
+            if local_time.astimezone(UTC).astimezone(local_timezone) != local_time:
+                parsed.add_error(
+                    line_number, f"Invalid timestamp '{values[0]}' in local time"
+                )
+                continue
+            # local time of the repeated hour, after a later or the same instant
+            # of the file, is its second occurrence
+            repeated_time = local_time.replace(fold=1)
+            if (
+                repeated_time.utcoffset() != local_time.utcoffset()
+                and previous_timestamp is not None
+                and previous_timestamp >= local_time.timestamp()
+            ):
+                local_time = repeated_time
+            measured_at = local_time
+
+        # timestamps with different offsets are compared as instants
+        timestamp = previous_timestamp = measured_at.timestamp()
+
+        try:
+            consumption = _parse_decimal(values[1])
+        except ValueError:
+            parsed.add_error(line_number, f"Invalid consumption '{values[1]}'")
+            continue
+        if consumption < 0:
+            parsed.add_error(line_number, f"Negative consumption '{values[1]}'")
+            continue
+
+        price = None
+        if parsed.has_prices:
+            try:
+                price = _parse_decimal(values[2])
+            except ValueError:
+                parsed.add_error(line_number, f"Invalid price '{values[2]}'")
+                continue
+
+        parsed.records += 1
+        if first_timestamp is None or timestamp < first_timestamp:
+            first_timestamp, parsed.first_measured_at = timestamp, measured_at
+        if last_timestamp is None or timestamp > last_timestamp:
+            last_timestamp, parsed.last_measured_at = timestamp, measured_at
+
+        # rows are only written while the file is valid, copied rows of
+        # invalid files are rolled back
+        if parsed.error_count == 0:
+            local_time = measured_at.astimezone(local_timezone)
+            day_type = (
+                MeasurementDayType.OFFDAY
+                if local_time.weekday() >= 5
+                else MeasurementDayType.WORKDAY
+            )
+            block_level = block_levels.get(
+                (local_time.month, day_type, local_time.hour)
+            )
+            yield (
+                b"\t".join(
+                    (
+                        customer_value,
+                        measured_at.isoformat().encode(),
+                        repr(consumption).encode(),
+                        repr(price).encode() if price is not None else COPY_NULL,
+                        str(local_time.hour).encode(),
+                        str(day_type.value).encode(),
+                        str(block_level).encode() if block_level else COPY_NULL,
+                    )
+                )
+                + b"\n"
+            )
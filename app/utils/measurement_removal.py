@@ -0,0 +1,124 @@
+"""
+Removal of measurements by time range, for one, many or all customers.
+
+Rows are deleted with range predicates on measured_at, so TimescaleDB only touches
+chunks overlapping the range. When all customers are selected, chunks completely
+inside the range are dropped instead of deleting their rows one by one.
+Changed months are marked as dirty windows in the same statement.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+from sqlalchemy.types import Integer
+
+__all__ = [
+    "delete_measurements",
+    "drop_covered_chunks",
+    "timescaledb_available",
+]
+
+HYPERTABLE = "measurements_electricity_usage"
+
+# deleted rows stay in the database, only the count is returned
+DELETE_RANGE = """
+    WITH deleted AS (
+        DELETE FROM measurements_electricity_usage eem
+        WHERE eem.measured_at >= :start_at
+        AND eem.measured_at < :end_at
+        {customer_filter}
+        RETURNING eem.customer_id, date_trunc('month', eem.measured_at)::date AS month
+    ),
+    windows AS (
+        INSERT INTO measurements_dirty_windows (customer_id, month)
+        SELECT DISTINCT customer_id, month FROM deleted
+        ON CONFLICT (customer_id, month) DO UPDATE SET marked_at = now()
+    )
+    SELECT count(*) FROM deleted
+"""
+
+DELETE_CUSTOMERS_RANGE = text(
+    DELETE_RANGE.format(customer_filter="AND eem.customer_id = ANY(:customer_ids)")
+).bindparams(bindparam("customer_ids", type_=ARRAY(Integer)))
+
+DELETE_ALL_CUSTOMERS_RANGE = text(DELETE_RANGE.format(customer_filter=""))
+
+# same chunks as drop_chunks with the range, rows are estimated from statistics
+# of each chunk, so chunks are not scanned before they are dropped
+COVERED_CHUNKS = text(f"""
+    SELECT count(*) AS chunks,
+        coalesce(sum(greatest(approximate_row_count(chunk), 0)), 0) AS records
+    FROM show_chunks('{HYPERTABLE}',
+        older_than => CAST(:end_at AS timestamptz),
+        newer_than => CAST(:start_at AS timestamptz)) AS chunk
+""")
+
+# measurements of dropped chunks are not known, all invoiced customers are marked
+MARK_INVOICED_WINDOWS = text("""
+    INSERT INTO measurements_dirty_windows (customer_id, month)
+    SELECT DISTINCT c.customer_id, m.month::date
+    FROM generate_series(
+        date_trunc('month', CAST(:start_at AS timestamptz)),
+        date_trunc('month', CAST(:end_at AS timestamptz) - INTERVAL '1 microsecond'),
+        INTERVAL '1 month'
+    ) AS m(month)
+    JOIN electricity_invoices i ON i.service_date >= m.month
+        AND i.period_start < m.month + INTERVAL '1 month'
+    JOIN electricity_customers_contracts c ON c.id = i.contract_id
+    ON CONFLICT (customer_id, month) DO UPDATE SET marked_at = now()
+""")
+
+
+def timescaledb_available(session: Session) -> bool:
+    return session.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'timescaledb')")
+    ).scalar()
+
+
+def drop_covered_chunks(
+    session: Session, start_at: datetime, end_at: datetime
+) -> tuple[int, int]:
+    """
+    Drops chunks of all customers that are completely inside the range.
+    Returns number of dropped chunks and an estimate of their records,
+    rows outside of them are left for delete_measurements.
+    """
+    covered = session.execute(
+        COVERED_CHUNKS, {"start_at": start_at, "end_at": end_at}
+    ).one()
+    if not covered.chunks:
+        return 0, 0
+
+    session.execute(MARK_INVOICED_WINDOWS, {"start_at": start_at, "end_at": end_at})
+    dropped = session.execute(
+        text(
+            f"SELECT count(*) FROM drop_chunks('{HYPERTABLE}', "
+            "older_than => CAST(:end_at AS timestamptz), "
+            "newer_than => CAST(:start_at AS timestamptz))"
+        ),
+        {"start_at": start_at, "end_at": end_at},
+    ).scalar()
+    return dropped, int(covered.records)
+
+
+def delete_measurements(
+    session: Session,
+    start_at: datetime,
+    end_at: datetime,
+    customer_ids: list[int] | None = None,
+) -> int:
+    """
+    Deletes measurements inside [start_at, end_at) and returns their count,
+    customer_ids None selects all customers. Caller commits the transaction.
+    """
+    if customer_ids is None:
+        return session.execute(
+            DELETE_ALL_CUSTOMERS_RANGE, {"start_at": start_at, "end_at": end_at}
+        ).scalar()
+
+    return session.execute(
+        DELETE_CUSTOMERS_RANGE,
+        {"start_at": start_at, "end_at": end_at, "customer_ids": customer_ids},
+    ).scalar()
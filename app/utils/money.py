@@ -0,0 +1,98 @@
+"""
+Fixed point arithmetic for invoice amounts and quantities.
+
+Amounts are stored as NUMERIC in cents and quantities in Wh precision.
+Measurements are double precision, the database sums them as integers in fixed point,
+SUM of bigint is an exact NUMERIC, so no amount passes through floats.
+"""
+
+from decimal import ROUND_FLOOR, ROUND_HALF_UP, Decimal
+from typing import Sequence
+
+__all__ = [
+    "CENT",
+    "FIXED_POINT_CONSUMPTION",
+    "FIXED_POINT_PRICE",
+    "FIXED_POINT_SCALE",
+    "TAX_RATE",
+    "WATT",
+    "WATT_HOUR",
+    "allocate_rounded",
+    "fixed_point_price",
+    "from_fixed_point",
+    "round_half_up",
+    "to_decimal",
+]
+
+CENT = Decimal("0.01")
+# quantities in kWh are stored with 3 decimals
+WATT_HOUR = Decimal("0.001")
+# peak demand in kW is stored with 3 decimals
+WATT = Decimal("0.001")
+# DDV
+TAX_RATE = Decimal("0.22")
+
+# measurements are converted to integers of 10^-6 kWh and 10^-6 EUR/kWh,
+# casting every row to NUMERIC is an order of magnitude slower
+FIXED_POINT_SCALE = 6
+FIXED_POINT_CONSUMPTION = "round(eem.consumption_kwh * 1e6)::bigint"
+
+
+def fixed_point_price(price: str = "eem.price_per_kwh") -> str:
+    # price is an SQL expression, for example a price resolved from price schedules
+    return f"round(eem.consumption_kwh * 1e6)::bigint * round({price} * 1e6)::bigint"
+
+
+FIXED_POINT_PRICE = fixed_point_price()
+
+
+def to_decimal(value) -> Decimal:
+    if isinstance(value, Decimal):
+        return value
+    # float is converted through its shortest representation, so 0.1 stays 0.1
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def from_fixed_point(value, scale: int = FIXED_POINT_SCALE) -> Decimal:
+    # price sums are products of two fixed point values and use double scale
+    return Decimal(value).scaleb(-scale)
+
+
+def round_half_up(value, quantum: Decimal = CENT) -> Decimal:
+    return to_decimal(value).quantize(quantum, rounding=ROUND_HALF_UP)
+
+
+def allocate_rounded(
+    values: Sequence, quantum: Decimal = CENT, total=None
+) -> list[Decimal]:
+    """
+    Rounds all values to quantum at once, so that rounded values add up exactly
+    to the rounded total, which is the sum of values if not given.
+    Values are rounded down and remaining units are given to values with the
+    largest remainders (largest remainder method).
+    """
+    if not values:
+        return []
+
+    exact = [to_decimal(value) for value in values]
+    if total is None:
+        total = sum(exact, Decimal(0))
+
+    # calculation is done in integer units of quantum
+    scaled = [value / quantum for value in exact]
+    units = [int(value.to_integral_value(rounding=ROUND_FLOOR)) for value in scaled]
+    missing_units = int(round_half_up(total, quantum) / quantum) - sum(units)
+
+    # with a given total units can also be taken away, from the smallest remainders
+    step = 1 if missing_units >= 0 else -1
+    order = sorted(
+        range(len(units)),
+        key=lambda index: scaled[index] - units[index],
+        reverse=step > 0,
+    )
+    for position in range(abs(missing_units)):
+        units[order[position % len(order)]] += step
+
+    return [Decimal(value) * quantum for value in units]
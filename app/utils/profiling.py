@@ -0,0 +1,222 @@
+"""
+Sampling profiler for running API processes, output is in collapsed stack format,
+which is read by flamegraph.pl, speedscope and similar tools.
+
+A background thread samples stacks of all threads with sys._current_frames(),
+only while at least one profile is collected. Request profiles keep only stacks
+of threads executing the endpoint of the request, so concurrent requests
+to other routes are not included.
+"""
+
+import asyncio
+from collections import Counter
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+
+from app.utils.admin import admin_token_valid
+
+__all__ = [
+    "Profile",
+    "RouteProfiling",
+    "profile_route",
+    "profiling_middleware",
+    "sampler",
+]
+
+# value of true allows ?profile=1 on any request, together with the admin token
+profiling_enabled = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+sampling_interval = float(os.getenv("PROFILING_INTERVAL_MS", "5")) / 1000
+
+# threads blocked inside these modules are waiting for work, not doing it
+IDLE_MODULES = {"threading.py", "selectors.py", "queue.py"}
+
+
+def _frame_name(code) -> str:
+    path = Path(code.co_filename)
+    return f"{code.co_qualname} ({path.parent.name}/{path.name}:{code.co_firstlineno})"
+
+
+class Profile:
+    # sampled stacks of busy threads, stored as tuples of code objects from the root
+
+    def __init__(self):
+        self.samples = 0
+        self.stacks = Counter()
+
+    def add(self, frames: dict):
+        self.samples += 1
+        for frame in frames.values():
+            if frame.f_code.co_filename.rsplit("/", 1)[-1] in IDLE_MODULES:
+                continue
+
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            # names are formatted only once, when the profile is returned
+            self.stacks[tuple(reversed(codes))] += 1
+
+    def containing(self, code) -> "Profile":
+        # only stacks that pass through the code, for example an endpoint function
+        profile = Profile()
+        profile.samples = self.samples
+        profile.stacks = Counter(
+            {stack: count for stack, count in self.stacks.items() if code in stack}
+        )
+        return profile
+
+    def merge(self, other: "Profile"):
+        self.samples += other.samples
+        self.stacks.update(other.stacks)
+
+    def collapsed(self) -> str:
+        return "".join(
+            ";".join(_frame_name(code) for code in stack) + f" {count}\n"
+            for stack, count in self.stacks.most_common()
+        )
+
+
+class StackSampler:
+    """
+    Single sampling thread per process, started when the first profile
+    is subscribed and stopped after the last one is removed.
+    Profiles are not changed after unsubscribe returns, so they can be read
+    without the sampler.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._profiles: set[Profile] = set()
+        self._lock = threading.Lock()
+        # held while a sample is added to profiles
+        self._sample_lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, profile: Profile):
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="stack-sampler", daemon=True
+                )
+                self._thread.start()
+
+    def unsubscribe(self, profile: Profile):
+        with self._lock:
+            self._profiles.discard(profile)
+        # sample taken before the profile was removed can still be adding to it
+        with self._sample_lock:
+            pass
+
+    def _run(self):
+        own_thread = threading.get_ident()
+        while True:
+            with self._sample_lock:
+                with self._lock:
+                    if not self._profiles:
+                        self._thread = None
+                        return
+                    profiles = list(self._profiles)
+
+                frames = sys._current_frames()
+                frames.pop(own_thread, None)
+                for profile in profiles:
+                    profile.add(frames)
+                del frames
+            time.sleep(self.interval)
+
+
+sampler = StackSampler(sampling_interval)
+
+
+class RouteProfiling:
+    # profiles of the next requests to a route, merged into one
+    def __init__(self, path: str, method: str | None, requests: int):
+        self.path = path
+        self.method = method
+        self.requests = requests
+        self.profiled = 0
+        self.profile = Profile()
+        self.finished = asyncio.Event()
+
+    def matches(self, path: str, method: str) -> bool:
+        if self.profiled >= self.requests or path != self.path:
+            return False
+        return self.method is None or self.method == method
+
+    def add(self, profile: Profile):
+        self.profile.merge(profile)
+        self.profiled += 1
+        if self.profiled >= self.requests:
+            self.finished.set()
+
+
+# route profilings waiting for requests, accessed only from the event loop
+_route_profilings: list[RouteProfiling] = []
+
+
+async def profile_route(
+    path: str, method: str | None, requests: int, timeout: float
+) -> RouteProfiling:
+    """
+    Waits until the given number of requests to the route were profiled,
+    after timeout requests profiled until then are returned.
+    """
+    route_profiling = RouteProfiling(path, method, requests)
+    _route_profilings.append(route_profiling)
+    try:
+        await asyncio.wait_for(route_profiling.finished.wait(), timeout)
+    except TimeoutError:
+        pass
+    finally:
+        _route_profilings.remove(route_profiling)
+    return route_profiling
+
+
+async def profiling_middleware(request: Request, call_next):
+    per_request = (
+        profiling_enabled
+        and request.query_params.get("profile") == "1"
+        and admin_token_valid(request.headers.get("x-admin-token"))
+    )
+    if not per_request and not _route_profilings:
+        return await call_next(request)
+
+    profile = Profile()
+    sampler.subscribe(profile)
+    try:
+        response = await call_next(request)
+        if per_request:
+            # original response is replaced by the profile
+            async for _ in response.body_iterator:
+                pass
+    finally:
+        sampler.unsubscribe(profile)
+
+    # route is known after the request was routed,
+    # only threads that were running its endpoint are kept
+    route = request.scope.get("route")
+    endpoint = request.scope.get("endpoint")
+    if endpoint is not None:
+        profile = profile.containing(endpoint.__code__)
+
+    if route is not None:
+        for route_profiling in _route_profilings:
+            if route_profiling.matches(route.path, request.method):
+                route_profiling.add(profile)
+
+    if per_request:
+        return PlainTextResponse(
+            profile.collapsed(),
+            headers={
+                "X-Profile-Samples": str(profile.samples),
+                "X-Profiled-Status": str(response.status_code),
+            },
+        )
+    return response
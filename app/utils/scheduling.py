@@ -0,0 +1,218 @@
+"""
+Concurrency limits for heavy endpoints, so they can not take all workers of the API.
+
+CSV uploads and imports, invoice calculation and PDF documents are heavy routes, each group
+has its own lane with a limited number of running requests and a bounded queue.
+Requests above the queue size are rejected with 429 and Retry-After.
+Other routes are light, thread pool has capacity reserved for them
+on top of all heavy lanes, so interactive endpoints stay responsive
+while batches are running. Counters are exported at /metrics.
+"""
+
+import asyncio
+import math
+import os
+import re
+import time
+
+from fastapi import Request, status
+from fastapi.responses import ORJSONResponse
+
+__all__ = [
+    "Lane",
+    "lanes",
+    "light_lane",
+    "metrics_text",
+    "scheduling_middleware",
+    "select_lane",
+    "thread_pool_size",
+]
+
+scheduling_enabled = os.getenv("SCHEDULING_ENABLED", "true").lower() == "true"
+# seconds a request waits in the queue of a lane, before it is rejected
+queue_timeout = float(os.getenv("LANE_QUEUE_TIMEOUT", "30"))
+# threads of the pool that are available only to light routes
+light_reserved_threads = int(os.getenv("LIGHT_RESERVED_THREADS", "16"))
+
+
+class Lane:
+    def __init__(
+        self,
+        name: str,
+        routes: list[tuple[str, str]] = (),
+        concurrency: int | None = None,
+        queue_size: int = 0,
+    ):
+        self.name = name
+        # method and path pattern of routes in this lane
+        self.routes = [(method, re.compile(pattern)) for method, pattern in routes]
+        # lane without concurrency is not limited, only measured
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self._semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.duration_sum = 0.0
+        self.duration_count = 0
+
+    def matches(self, method: str, path: str) -> bool:
+        return any(
+            method == route_method and pattern.fullmatch(path)
+            for route_method, pattern in self.routes
+        )
+
+    def retry_after(self) -> int:
+        # time until the queue ahead of a new request is expected to be processed
+        average = self.duration_sum / self.duration_count if self.duration_count else 1
+        return max(1, math.ceil(average * (self.waiting + 1) / self.concurrency))
+
+    async def acquire(self, timeout: float) -> bool:
+        if self._semaphore is not None:
+            if self._semaphore.locked() and self.waiting >= self.queue_size:
+                self.rejected += 1
+                return False
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+            except TimeoutError:
+                self.timed_out += 1
+                return False
+            finally:
+                self.waiting -= 1
+
+        self.active += 1
+        self.admitted += 1
+        return True
+
+    def release(self, duration: float):
+        self.active -= 1
+        self.duration_sum += duration
+        self.duration_count += 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+
+def _lane_from_env(name: str, routes: list, concurrency: int, queue_size: int) -> Lane:
+    prefix = f"LANE_{name.upper()}_"
+    return Lane(
+        name,
+        routes,
+        concurrency=int(os.getenv(prefix + "CONCURRENCY", str(concurrency))),
+        queue_size=int(os.getenv(prefix + "QUEUE", str(queue_size))),
+    )
+
+
+lanes = [
+    _lane_from_env(
+        "upload",
+        [
+            ("POST", r"/measurements/upload-csv"),
+            ("POST", r"/measurements/bulk-remove"),
+            ("POST", r"/customers/import"),
+        ],
+        concurrency=2,
+        queue_size=8,
+    ),
+    _lane_from_env(
+        "invoices",
+        [("POST", r"/invoices/?"), ("POST", r"/invoices/corrections")],
+        concurrency=4,
+        queue_size=16,
+    ),
+    _lane_from_env(
+        "documents",
+        [("GET", r"/invoices/\d+/document"), ("POST", r"/invoices/\d+/document")],
+        concurrency=2,
+        queue_size=16,
+    ),
+]
+light_lane = Lane("light")
+
+
+def select_lane(method: str, path: str) -> Lane:
+    for lane in lanes:
+        if lane.matches(method, path):
+            return lane
+    return light_lane
+
+
+def thread_pool_size() -> int:
+    # every heavy lane can use all of its threads and light routes still have their own
+    return sum(lane.concurrency for lane in lanes) + light_reserved_threads
+
+
+async def scheduling_middleware(request: Request, call_next):
+    if not scheduling_enabled or request.url.path == "/metrics":
+        return await call_next(request)
+
+    lane = select_lane(request.method, request.url.path)
+    if not await lane.acquire(queue_timeout):
+        return ORJSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={"detail": f"Too many {lane.name} requests, retry later"},
+            headers={"Retry-After": str(lane.retry_after())},
+        )
+
+    started = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        lane.release(time.perf_counter() - started)
+
+
+def metrics_text(thread_limiter=None) -> str:
+    # Prometheus text exposition format
+    metrics = [
+        ("lane_active_requests", "gauge", "Requests running in the lane", "active"),
+        ("lane_waiting_requests", "gauge", "Requests waiting in the queue", "waiting"),
+        ("lane_admitted_total", "counter", "Requests admitted to run", "admitted"),
+        (
+            "lane_rejected_total",
+            "counter",
+            "Requests rejected with full queue",
+            "rejected",
+        ),
+        (
+            "lane_timed_out_total",
+            "counter",
+            "Requests rejected after waiting",
+            "timed_out",
+        ),
+        ("lane_duration_seconds_sum", "counter", "Time spent running", "duration_sum"),
+        (
+            "lane_duration_seconds_count",
+            "counter",
+            "Finished requests",
+            "duration_count",
+        ),
+    ]
+    all_lanes = [*lanes, light_lane]
+    lines = []
+    for name, metric_type, description, attribute in metrics:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for lane in all_lanes:
+            lines.append(f'{name}{{lane="{lane.name}"}} {getattr(lane, attribute)}')
+
+    lines.append("# HELP lane_concurrency_limit Requests that can run at the same time")
+    lines.append("# TYPE lane_concurrency_limit gauge")
+    for lane in lanes:
+        lines.append(f'lane_concurrency_limit{{lane="{lane.name}"}} {lane.concurrency}')
+    lines.append("# HELP lane_queue_limit Requests that can wait in the queue")
+    lines.append("# TYPE lane_queue_limit gauge")
+    for lane in lanes:
+        lines.append(f'lane_queue_limit{{lane="{lane.name}"}} {lane.queue_size}')
+
+    if thread_limiter is not None:
+        lines.append("# HELP thread_pool_threads Threads for sync endpoints")
+        lines.append("# TYPE thread_pool_threads gauge")
+        lines.append(f"thread_pool_threads {thread_limiter.total_tokens}")
+        lines.append("# HELP thread_pool_busy_threads Threads running sync endpoints")
+        lines.append("# TYPE thread_pool_busy_threads gauge")
+        lines.append(f"thread_pool_busy_threads {thread_limiter.borrowed_tokens}")
+    return "\n".join(lines) + "\n"
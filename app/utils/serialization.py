@@ -1,3 +1,7 @@
+from functools import cache
+from operator import attrgetter
+
+
 def orm_object_to_dict_exclude_default(obj, exclude_fields=None):
     exclude_default = ["id", "created_at", "updated_at"]
     if exclude_fields:
@@ -6,10 +10,21 @@ def orm_object_to_dict_exclude_default(obj, exclude_fields=None):
 
 
 def orm_object_to_dict(obj, exclude_fields=None):
-    exclude_fields = exclude_fields or set()
+    names, getter = _column_accessor(type(obj), frozenset(exclude_fields or ()))
+    return dict(zip(names, getter(obj)))
+
+
+@cache
+def _column_accessor(model, exclude_fields: frozenset):
+    # column names are resolved once per model and excluded fields,
+    # values of all columns are then read with a single attrgetter call
     # Relationships aren’t part of __table__.columns, so they’re already excluded by default.
-    return {
-        column.name: getattr(obj, column.name)
-        for column in obj.__table__.columns
+    names = tuple(
+        column.name
+        for column in model.__table__.columns
         if column.name not in exclude_fields
-    }
+    )
+    getter = attrgetter(*names)
+    if len(names) == 1:
+        return names, lambda obj: (getter(obj),)
+    return names, getter
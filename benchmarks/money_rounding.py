@@ -0,0 +1,165 @@
+"""
+Compares invoice amount calculation with floats and with fixed point decimals.
+
+Python part calculates totals, tax and item lines for generated invoices, the same
+way as build_invoice does. With --database, monthly sums are also calculated by
+the database over existing measurements, priced like on invoices: in double precision,
+with every row cast to NUMERIC and with fixed point integers, as build_invoice does.
+
+Usage:
+    python -m benchmarks.money_rounding --invoices 100000
+    python -m benchmarks.money_rounding --database --repeat 20
+"""
+
+import argparse
+from decimal import Decimal
+import random
+import time
+
+from app.utils.invoice import (
+    MEASUREMENT_PRICE,
+    PRICE_SCHEDULE_JOIN,
+    UNPRICED_MEASUREMENT,
+)
+from app.utils.money import (
+    CENT,
+    FIXED_POINT_CONSUMPTION,
+    TAX_RATE,
+    WATT_HOUR,
+    allocate_rounded,
+    round_half_up,
+)
+
+# measurements without their own price are priced by the schedule of the active contract,
+# as on invoices, measurements without any price or active contract are left out of all variants
+SUMS_QUERY = (
+    """
+    SELECT eem.customer_id, date_trunc('month', eem.measured_at) AS month,
+        SUM({price}), SUM({consumption})
+    FROM measurements_electricity_usage eem
+    JOIN electricity_customers_contracts c ON c.customer_id = eem.customer_id
+        AND c.termination_date IS NULL
+    """
+    + PRICE_SCHEDULE_JOIN.format(
+        provider_id="c.provider_id", package_name="c.package_name"
+    )
+    + f"""
+    WHERE NOT ({UNPRICED_MEASUREMENT})
+    GROUP BY 1, 2
+    """
+)
+PRICE = "COALESCE(eem.price_per_kwh, ps.price_per_kwh)"
+
+DATABASE_SUMS = {
+    "float": SUMS_QUERY.format(
+        price=f"eem.consumption_kwh * {PRICE}",
+        consumption="eem.consumption_kwh",
+    ),
+    "numeric": SUMS_QUERY.format(
+        price=f"eem.consumption_kwh::numeric * ({PRICE})::numeric",
+        consumption="eem.consumption_kwh::numeric",
+    ),
+    "fixed": SUMS_QUERY.format(
+        price=MEASUREMENT_PRICE, consumption=FIXED_POINT_CONSUMPTION
+    ),
+}
+
+
+def generate_invoices(count: int, seed: int) -> list[list[tuple]]:
+    # sums per time block, as returned by the database
+    generator = random.Random(seed)
+    return [
+        [
+            (
+                Decimal(generator.randint(0, 10**9)) / 10**6,
+                Decimal(generator.randint(0, 10**8)) / 10**8,
+            )
+            for _ in range(generator.randint(2, 5))
+        ]
+        for _ in range(count)
+    ]
+
+
+def float_path(invoices: list[list[tuple]]):
+    mismatched, invoiced = 0, 0.0
+    for blocks in invoices:
+        blocks = [(float(consumption), float(price)) for consumption, price in blocks]
+        base_amount = sum(price for _, price in blocks)
+        tax_amount = base_amount * 0.22
+        invoiced += base_amount + tax_amount
+        # items printed with 2 decimals do not always add up to the printed base
+        items = [round(price, 2) for _, price in blocks]
+        if round(sum(items), 2) != round(base_amount, 2):
+            mismatched += 1
+    return mismatched, invoiced
+
+
+def decimal_path(invoices: list[list[tuple]]):
+    mismatched, invoiced = 0, Decimal(0)
+    for blocks in invoices:
+        base_amount = round_half_up(sum(price for _, price in blocks))
+        tax_amount = round_half_up(base_amount * TAX_RATE)
+        invoiced += base_amount + tax_amount
+        # item quantities are allocated as on invoices, floats print them unrounded
+        allocate_rounded([consumption for consumption, _ in blocks], WATT_HOUR)
+        items = allocate_rounded([price for _, price in blocks], CENT)
+        if sum(items) != base_amount:
+            mismatched += 1
+    return mismatched, invoiced
+
+
+def measure(function, *args, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def benchmark_python(args):
+    invoices = generate_invoices(args.invoices, args.seed)
+    for name, function in (("float", float_path), ("decimal", decimal_path)):
+        elapsed, (mismatched, invoiced) = measure(
+            function, invoices, repeat=args.repeat
+        )
+        print(
+            f"{name:>8}: {args.invoices / elapsed:12.0f} invoices/s, "
+            f"{mismatched} invoices where items do not add up to the base amount, "
+            f"{invoiced:.2f} EUR invoiced"
+        )
+
+
+def benchmark_database(args):
+    from sqlalchemy import text
+
+    from app.database.session import engine
+
+    with engine.connect() as connection:
+        for name, query in DATABASE_SUMS.items():
+            elapsed, rows = measure(
+                lambda query=query: connection.execute(text(query)).all(),
+                repeat=args.repeat,
+            )
+            print(f"{name:>8}: {elapsed * 1000:10.1f} ms for {len(rows)} monthly sums")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--invoices", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--database",
+        action="store_true",
+        help="compare sums in the database, set with DATABASE_URI",
+    )
+    args = parser.parse_args(argv)
+
+    benchmark_python(args)
+    if args.database:
+        benchmark_database(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Invoices calculated by build_invoice. Requires a migrated database,
+set with DATABASE_URI, otherwise tests are skipped.
+"""
+
+from datetime import date, timedelta
+import os
+
+from dotenv import load_dotenv
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.database.models.customer import (
+    CustomerContract,
+    CustomerType,
+    ElectricityProvider,
+)
+from app.schema.invoice import CreateInvoice
+from app.utils.invoice import (
+    PEAK_DEMAND_UNIT,
+    build_invoice,
+    demand_items,
+    energy_items,
+)
+
+load_dotenv()
+
+
+@pytest.fixture(scope="module")
+def session():
+    database_uri = os.getenv("DATABASE_URI")
+    if not database_uri or database_uri.startswith("driver://"):
+        pytest.skip("DATABASE_URI is not set")
+
+    # session module creates the engine, so it is imported only with a database
+    from app.database.session import SessionLocal
+
+    session = SessionLocal()
+    try:
+        session.connection()
+    except OperationalError:
+        pytest.skip("database is not reachable")
+
+    yield session
+    session.rollback()
+    session.close()
+
+
+def invoice_data(**fields) -> CreateInvoice:
+    return CreateInvoice(
+        customer_id=0,
+        month=1,
+        year=2025,
+        payment_reason="reason",
+        receiver_reference="reference",
+        invoice_number="1",
+        location_issued="Ljubljana",
+        **fields,
+    )
+
+
+def test_invoice_is_due_after_it_is_issued(session):
+    # contract without measurements
+    contract = CustomerContract(
+        id=0, customer_id=0, provider=ElectricityProvider(iban_number="SI56")
+    )
+
+    invoice = build_invoice(session, contract, invoice_data(days_payment_due=15))
+
+    assert invoice.issued_date == date.today()
+    assert invoice.due_date == date.today() + timedelta(days=15)
+
+
+def test_winter_months_are_invoiced_by_time_block(session):
+    # high season runs from November to February, across the calendar year
+    customer_id = session.execute(
+        text("""
+            INSERT INTO electricity_customers (fullname, email, tax_code,
+                street_address, zip_code, zip_name, created_at, updated_at)
+            VALUES ('Customer', 'winter@test', '1', 'Street', 1000, 'Ljubljana',
+                now(), now())
+            RETURNING id
+        """)
+    ).scalar_one()
+    session.execute(
+        text("""
+            INSERT INTO measurements_electricity_usage (customer_id, measured_at,
+                consumption_kwh, price_per_kwh, local_hour, day_type, block_level)
+            SELECT :customer_id, measured_at, 0.25, 0.1234,
+                extract(hour FROM measured_at), 0, n % 5 + 1
+            FROM generate_series(
+                TIMESTAMPTZ '2025-01-06 00:00+01', TIMESTAMPTZ '2025-01-07 23:45+01',
+                INTERVAL '15 minutes'
+            ) WITH ORDINALITY AS m(measured_at, n)
+        """),
+        {"customer_id": customer_id},
+    )
+    contract = CustomerContract(
+        id=0, customer_id=customer_id, provider=ElectricityProvider(iban_number="SI56")
+    )
+
+    invoice = build_invoice(session, contract, invoice_data())
+
+    assert invoice.items
+    assert sum(item.quantity for item in invoice.items) == invoice.total_quantity
+
+
+def test_energy_items_add_up_to_total_quantity(session):
+    customer_id = session.execute(
+        text("""
+            INSERT INTO electricity_customers (fullname, email, tax_code,
+                street_address, zip_code, zip_name, created_at, updated_at)
+            VALUES ('Customer', 'build@test', '1', 'Street', 1000, 'Ljubljana',
+                now(), now())
+            RETURNING id
+        """)
+    ).scalar_one()
+    # three days of quarter hours with uneven consumption in all time blocks
+    session.execute(
+        text("""
+            INSERT INTO measurements_electricity_usage (customer_id, measured_at,
+                consumption_kwh, price_per_kwh, local_hour, day_type, block_level)
+            SELECT :customer_id, measured_at, 0.1 + (n % 7) * 0.0333,
+                0.1234, extract(hour FROM measured_at), 0, n % 5 + 1
+            FROM generate_series(
+                TIMESTAMPTZ '2025-01-06 00:00+01', TIMESTAMPTZ '2025-01-08 23:45+01',
+                INTERVAL '15 minutes'
+            ) WITH ORDINALITY AS m(measured_at, n)
+        """),
+        {"customer_id": customer_id},
+    )
+    # business contracts also get peak demand items
+    contract = CustomerContract(
+        id=0,
+        customer_id=customer_id,
+        customer_type=CustomerType.BUSINESS,
+        provider=ElectricityProvider(iban_number="SI56"),
+    )
+
+    invoice = build_invoice(session, contract, invoice_data())
+
+    assert demand_items(invoice.items)
+    assert all(item.unit == PEAK_DEMAND_UNIT for item in demand_items(invoice.items))
+    assert sum(item.quantity for item in energy_items(invoice.items)) == (
+        invoice.total_quantity
+    )
+    assert sum(item.amount for item in invoice.items) == invoice.base_amount
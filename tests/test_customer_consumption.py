@@ -0,0 +1,166 @@
+"""
+Consumption series endpoint of customers. Requires a migrated database,
+set with DATABASE_URI, otherwise tests are skipped. Series are summed with
+time_bucket, those tests are skipped without TimescaleDB.
+"""
+
+import os
+
+from dotenv import load_dotenv
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+load_dotenv()
+
+# two local days of quarter hour measurements, 0.25 kWh each, so every hour has 1 kWh
+TEST_DATA = """
+    WITH customer AS (
+        INSERT INTO electricity_customers (fullname, email, tax_code, street_address,
+            zip_code, zip_name, created_at, updated_at)
+        VALUES ('Customer', 'consumption@test', '1', 'Street', 1000, 'Ljubljana',
+            now(), now())
+        RETURNING id
+    )
+    INSERT INTO measurements_electricity_usage (customer_id, measured_at,
+        consumption_kwh, price_per_kwh, local_hour, day_type, created_at, updated_at)
+    SELECT customer.id, measured_at, 0.25, 0.1,
+        extract(hour FROM measured_at AT TIME ZONE 'Europe/Ljubljana'), 0, now(), now()
+    FROM customer, generate_series(
+        timestamptz '2025-01-01 00:00+01', timestamptz '2025-01-02 23:45+01',
+        interval '15 minutes'
+    ) measured_at
+    RETURNING customer_id
+"""
+DAY_START = "2025-01-01T00:00:00+01:00"
+SECOND_DAY_START = "2025-01-02T00:00:00+01:00"
+RANGE = {"from": DAY_START, "to": "2025-01-03T00:00:00+01:00"}
+
+
+@pytest.fixture(scope="module")
+def connection():
+    database_uri = os.getenv("DATABASE_URI")
+    if not database_uri or database_uri.startswith("driver://"):
+        pytest.skip("DATABASE_URI is not set")
+
+    # session module sets the local timezone on connections of its engine
+    from app.database.session import engine
+
+    try:
+        connection = engine.connect()
+    except OperationalError:
+        pytest.skip("database is not reachable")
+
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def client(connection):
+    from app.database.session import get_db_readonly
+    from app.main import app
+
+    # requests read test data of the transaction, which is rolled back
+    transaction = connection.begin()
+    session = Session(bind=connection)
+    app.dependency_overrides[get_db_readonly] = lambda: session
+    try:
+        yield TestClient(app), connection
+    finally:
+        app.dependency_overrides.clear()
+        session.close()
+        transaction.rollback()
+
+
+@pytest.fixture
+def series(client):
+    test_client, connection = client
+    if not connection.execute(
+        text("SELECT EXISTS (SELECT FROM pg_proc WHERE proname = 'time_bucket')")
+    ).scalar():
+        pytest.skip("TimescaleDB is not installed")
+
+    customer_id = connection.execute(text(TEST_DATA)).scalars().first()
+
+    def get(**params):
+        return test_client.get(
+            f"/customers/{customer_id}/consumption", params={**RANGE, **params}
+        )
+
+    return get
+
+
+def test_measurements_are_summed_into_local_buckets(series):
+    response = series(bucket="hour")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["buckets"] == 48
+    assert len(data["timestamps"]) == len(data["consumption_kwh"]) == 48
+    assert data["timestamps"][0] == DAY_START
+    assert data["consumption_kwh"] == [1.0] * 48
+    assert data["downsampled"] is False
+
+    data = series(bucket="day").json()
+    assert data["timestamps"] == [DAY_START, SECOND_DAY_START]
+    assert data["consumption_kwh"] == [24.0, 24.0]
+    assert data["buckets"] == 2
+
+
+def test_long_series_are_downsampled_to_max_points(series):
+    data = series(bucket="15min", max_points=10).json()
+
+    assert data["buckets"] == 192
+    assert len(data["timestamps"]) == len(data["consumption_kwh"]) == 10
+    assert data["downsampled"] is True
+    # first and last bucket are always kept
+    assert data["timestamps"][0] == DAY_START
+    assert data["timestamps"][-1] == "2025-01-02T23:45:00+01:00"
+
+    # series with fewer buckets than max_points are returned whole
+    data = series(bucket="hour", max_points=100).json()
+    assert len(data["timestamps"]) == data["buckets"] == 48
+    assert data["downsampled"] is False
+
+
+def test_range_without_measurements_is_empty(series):
+    response = series(
+        **{"from": "2025-03-01T00:00:00+01:00", "to": "2025-04-01T00:00:00+02:00"}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["timestamps"] == data["consumption_kwh"] == []
+    assert data["buckets"] == 0
+    assert data["downsampled"] is False
+
+
+def test_invalid_ranges_are_rejected(client):
+    test_client, _ = client
+    url = "/customers/0/consumption"
+
+    response = test_client.get(url, params={"from": RANGE["to"], "to": DAY_START})
+    assert response.status_code == 400
+
+    # two years of quarter hours are more buckets than allowed
+    response = test_client.get(
+        url,
+        params={
+            "from": DAY_START,
+            "to": "2027-01-01T00:00:00+01:00",
+            "bucket": "15min",
+        },
+    )
+    assert response.status_code == 400
+    assert "use larger buckets" in response.json()["detail"]
+
+    # range without timezone offset is not valid
+    response = test_client.get(
+        url, params={"from": "2025-01-01T00:00:00", "to": RANGE["to"]}
+    )
+    assert response.status_code == 422
+
+    response = test_client.get(url, params=RANGE)
+    assert response.status_code == 404
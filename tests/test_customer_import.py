@@ -0,0 +1,64 @@
+import io
+import json
+
+from app.utils.customer_import import parse_customer_import
+
+HEADER = (
+    "fullname;email;tax_code;street_address;zip_code;zip_name;"
+    "provider_id;customer_type;contract_number;energy_meter_number;package_name\n"
+)
+
+
+def parse_csv(content: str):
+    return parse_customer_import(io.BytesIO(content.encode()), ndjson=False)
+
+
+def test_valid_rows_are_converted_for_copy():
+    parsed = parse_csv(
+        HEADER
+        + "Ana Novak;ana@example.si;SI123;Trg 1;1000;Ljubljana;1;residential;C-1;M-1;Osnovni\n"
+    )
+
+    assert parsed.errors == []
+    assert (parsed.customers, parsed.contracts) == (1, 1)
+    assert parsed.buffer.read().splitlines() == [
+        "2,,True,Ana Novak,ana@example.si,SI123,Trg 1,1000,Ljubljana,"
+        "1,RESIDENTIAL,C-1,M-1,Osnovni"
+    ]
+
+
+def test_invalid_and_duplicate_rows_are_reported_with_line_numbers():
+    parsed = parse_csv(
+        HEADER
+        + "Ana;ana@example.si;SI1;Trg 1;1000;Ljubljana;1;residential;C-1;M-1;P\n"
+        + "Bor;not-an-email;SI2;Trg 2;1000;Ljubljana;1;residential;C-2;M-2;P\n"
+        + "Cene;cene@example.si;SI3;Trg 3;1000;Ljubljana;1;residential;C-1;M-3;P\n"
+    )
+
+    assert [error.line for error in parsed.errors] == [3, 4]
+    assert parsed.errors[0].error.startswith("email:")
+    assert parsed.errors[1].error == "Duplicate contract number 'C-1', first on line 2"
+
+
+def test_ndjson_rows_can_add_contracts_to_existing_customers():
+    rows = [
+        {
+            "customer_id": 5,
+            "provider_id": 1,
+            "customer_type": "business",
+            "contract_number": "C-5",
+            "energy_meter_number": "M-5",
+            "package_name": "P",
+        },
+        {"customer_id": 5, "contract_number": "C-6"},
+        "not an object",
+    ]
+    parsed = parse_customer_import(
+        io.BytesIO("\n".join(json.dumps(row) for row in rows).encode()), ndjson=True
+    )
+
+    assert parsed.existing_customer_ids == {5}
+    assert [(error.line, error.error.split(" ")[0]) for error in parsed.errors] == [
+        (2, "provider_id:"),
+        (3, "Line"),
+    ]
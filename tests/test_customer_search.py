@@ -0,0 +1,12 @@
+from app.utils.customer_search import _like_pattern
+
+
+def test_like_pattern_matches_fragments():
+    assert _like_pattern("SI123") == "%SI123%"
+
+
+def test_like_wildcards_in_query_are_escaped():
+    assert _like_pattern("100%") == "%100\\%%"
+    assert _like_pattern("a_b") == "%a\\_b%"
+    # escape character is escaped first, so escapes of wildcards are kept
+    assert _like_pattern("a\\%") == "%a\\\\\\%%"
@@ -0,0 +1,21 @@
+import math
+
+from app.utils.downsampling import lttb_indices
+
+
+def test_short_series_is_not_downsampled():
+    assert lttb_indices([0, 1, 2], [5, 1, 3], 10) == [0, 1, 2]
+
+
+def test_downsampling_keeps_ends_and_peaks():
+    x = list(range(1000))
+    y = [math.sin(value / 50) for value in x]
+    y[500] = 10.0
+    y[700] = -10.0
+
+    indices = lttb_indices(x, y, 50)
+
+    assert len(indices) == 50
+    assert indices[0] == 0 and indices[-1] == 999
+    assert indices == sorted(set(indices))
+    assert 500 in indices and 700 in indices
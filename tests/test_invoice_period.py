@@ -0,0 +1,120 @@
+from datetime import date
+from decimal import Decimal
+
+from pydantic import ValidationError
+import pytest
+
+from app.schema.invoice import CreateInvoice
+from app.utils.invoice import (
+    DailyUsage,
+    SeasonSegment,
+    season_month_numbers,
+    season_segment_peaks,
+    season_segment_totals,
+    season_segments,
+)
+
+# high season 11 - 2 crosses calendar year, low season is 3 - 10
+SEASON_MONTHS = {month: 1 if month in (11, 12, 1, 2) else 2 for month in range(1, 13)}
+
+
+def invoice_data(**period) -> CreateInvoice:
+    return CreateInvoice(
+        customer_id=1,
+        payment_reason="reason",
+        receiver_reference="reference",
+        invoice_number="1",
+        location_issued="Ljubljana",
+        **period,
+    )
+
+
+def test_period_is_split_at_season_changes():
+    segments = season_segments(SEASON_MONTHS, date(2024, 12, 15), date(2025, 11, 10))
+
+    assert segments == [
+        SeasonSegment(1, date(2024, 12, 15), date(2025, 2, 28)),
+        SeasonSegment(2, date(2025, 3, 1), date(2025, 10, 31)),
+        SeasonSegment(1, date(2025, 11, 1), date(2025, 11, 10)),
+    ]
+
+
+def test_seasons_crossing_calendar_year_wrap_around_december():
+    assert season_month_numbers(12, 2) == [12, 1, 2]
+    assert season_month_numbers(3, 11) == [3, 4, 5, 6, 7, 8, 9, 10, 11]
+    assert season_month_numbers(6, 6) == [6]
+
+
+def test_winter_season_segment_covers_january():
+    # december - february season, which matched no months before
+    season_months = dict.fromkeys(season_month_numbers(12, 2), 1)
+    season_months.update(dict.fromkeys(season_month_numbers(3, 11), 2))
+    segments = season_segments(season_months, date(2025, 1, 10), date(2025, 3, 5))
+
+    assert segments == [
+        SeasonSegment(1, date(2025, 1, 10), date(2025, 2, 28)),
+        SeasonSegment(2, date(2025, 3, 1), date(2025, 3, 5)),
+    ]
+
+
+def test_totals_are_summed_per_segment_and_time_block():
+    segments = season_segments(SEASON_MONTHS, date(2025, 2, 1), date(2025, 3, 31))
+    totals = season_segment_totals(
+        [
+            DailyUsage(date(2025, 3, 2), 2, Decimal("0.5"), Decimal("4")),
+            DailyUsage(date(2025, 2, 1), 2, Decimal("0.25"), Decimal("2")),
+            DailyUsage(date(2025, 2, 28), 2, Decimal("0.25"), Decimal("1")),
+            DailyUsage(date(2025, 2, 28), 1, Decimal("1"), Decimal("3")),
+        ],
+        segments,
+    )
+
+    assert list(totals.items()) == [
+        ((segments[0], 1), (Decimal("1"), Decimal("3"))),
+        ((segments[0], 2), (Decimal("0.50"), Decimal("3"))),
+        ((segments[1], 2), (Decimal("0.5"), Decimal("4"))),
+    ]
+
+
+def test_peaks_are_highest_per_segment_and_time_block():
+    segments = season_segments(SEASON_MONTHS, date(2025, 2, 1), date(2025, 3, 31))
+    peaks = season_segment_peaks(
+        [
+            DailyUsage(date(2025, 2, 1), 2, Decimal(0), Decimal(1), Decimal("3.5")),
+            DailyUsage(date(2025, 2, 2), 2, Decimal(0), Decimal(1), Decimal("4.25")),
+            DailyUsage(date(2025, 3, 1), 2, Decimal(0), Decimal(1), Decimal("2")),
+            # contracts without peak demand have no peaks
+            DailyUsage(date(2025, 3, 1), 1, Decimal(0), Decimal(1)),
+        ],
+        segments,
+    )
+
+    assert list(peaks.items()) == [
+        ((segments[0], 2), Decimal("4.25")),
+        ((segments[1], 2), Decimal("2")),
+    ]
+
+
+def test_calendar_month_and_period_are_invoice_periods():
+    assert invoice_data(month=2, year=2024).invoice_period == (
+        date(2024, 2, 1),
+        date(2024, 2, 29),
+    )
+    assert invoice_data(
+        period_start=date(2025, 1, 1), period_end=date(2025, 3, 31)
+    ).invoice_period == (date(2025, 1, 1), date(2025, 3, 31))
+
+
+@pytest.mark.parametrize(
+    "period",
+    [
+        {},
+        {"month": 1},
+        {"month": 1, "year": 2025, "period_start": date(2025, 1, 1)},
+        {"period_start": date(2025, 3, 1), "period_end": date(2025, 2, 1)},
+        {"period_start": date(2025, 1, 1), "period_end": date(2026, 1, 1)},
+    ],
+)
+def test_invalid_invoice_periods_are_rejected(period):
+    with pytest.raises(ValidationError):
+        invoice_data(**period)
@@ -0,0 +1,302 @@
+from datetime import datetime, timedelta
+import gzip
+import io
+import tracemalloc
+
+import pytest
+import zstandard
+
+from app.utils.measurement_csv import (
+    DECOMPRESSION_ERRORS,
+    MAX_REPORTED_ERRORS,
+    MEASUREMENT_FILENAME,
+    DecompressedSizeError,
+    ZstdFrames,
+    decompressed_stream,
+    parse_measurements_csv,
+)
+
+HEADER = "Časovna značka;Energija A+ [kWh];Cena [EUR/kWh]\n"
+# level 1 in January workday mornings, 2 otherwise, no levels in July
+BLOCK_LEVELS = {
+    (month, day_type, hour): 1 if month == 1 and day_type == 0 and hour < 12 else 2
+    for month in range(1, 13)
+    if month != 7
+    for day_type in (0, 1)
+    for hour in range(24)
+}
+
+
+def parse(content: str, customer_id: int = 7):
+    """Parsed file and its rows for COPY, errors are complete after rows are read."""
+    parsed = parse_measurements_csv(
+        io.BytesIO(content.encode()), customer_id, BLOCK_LEVELS
+    )
+    return parsed, parsed.read().decode().splitlines()
+
+
+def test_valid_rows_are_converted_for_copy():
+    parsed, rows = parse(
+        HEADER
+        + "2025-01-01T00:00:00+01:00;0,125;0,11\n"
+        + "2025-01-01T00:15:00+01:00;1;0,1\n"
+    )
+
+    assert parsed.errors == []
+    assert parsed.records == 2
+    assert rows == [
+        "7\t2025-01-01T00:00:00+01:00\t0.125\t0.11\t0\t0\t1",
+        "7\t2025-01-01T00:15:00+01:00\t1.0\t0.1\t0\t0\t1",
+    ]
+
+
+def test_utf8_bom_and_empty_lines_are_ignored():
+    parsed, _ = parse("﻿" + HEADER + "\n2025-01-01 00:00;0,5;0,1\n\n")
+
+    assert parsed.errors == []
+    assert parsed.records == 1
+
+
+def test_invalid_rows_are_reported_with_line_numbers():
+    parsed, rows = parse(
+        HEADER
+        + "2025-01-01T00:00:00+01:00;0,5;0,1\n"
+        + "01.01.2025 00:30;0,5;0,1\n"
+        + "2025-01-01T00:45:00+01:00;-0,5;0,1\n"
+        + "2025-01-01T01:00:00+01:00;abc;0,1\n"
+        + "2025-01-01T01:15:00+01:00;0,5\n"
+        + "2025-01-01T01:30:00+01:00;0,5;nan\n"
+    )
+
+    assert [(error.line, error.error.split(" ")[0]) for error in parsed.errors] == [
+        (3, "Invalid"),
+        (4, "Negative"),
+        (5, "Invalid"),
+        (6, "Expected"),
+        (7, "Invalid"),
+    ]
+    assert parsed.error_count == 5
+    # rows after the first invalid row are not copied, the whole file is still validated
+    assert len(rows) == 1
+
+
+def test_reported_errors_are_limited():
+    rows = "".join(f"invalid-{i};1;1\n" for i in range(MAX_REPORTED_ERRORS + 10))
+    parsed, _ = parse(HEADER + rows)
+
+    assert len(parsed.errors) == MAX_REPORTED_ERRORS
+    assert parsed.error_count == MAX_REPORTED_ERRORS + 10
+
+
+def test_range_of_measurements_is_tracked():
+    parsed, _ = parse(
+        HEADER
+        + "2025-02-01T00:15:00+01:00;0,5;0,1\n"
+        + "2025-01-31T23:00:00+00:00;0,5;0,1\n"
+        + "2025-02-01T00:30:00+01:00;0,5;0,1\n"
+    )
+
+    # timestamps with different offsets are compared as instants
+    assert parsed.first_measured_at.isoformat() == "2025-01-31T23:00:00+00:00"
+    assert parsed.last_measured_at.isoformat() == "2025-02-01T00:30:00+01:00"
+
+
+def test_rows_are_classified_in_local_time():
+    parsed, rows = parse(
+        HEADER
+        # 11:30 in Ljubljana on a workday
+        + "2025-01-02T10:30:00+00:00;0,5;0,1\n"
+        # local time without offset, Saturday
+        + "2025-01-04 08:00;0,5;0,1\n"
+        # summer time, 23:00 local time is 21:00 UTC
+        + "2025-06-30T21:00:00Z;0,5;0,1\n"
+        # no time blocks for July
+        + "2025-07-01T10:00:00+02:00;0,5;0,1\n"
+    )
+
+    assert parsed.errors == []
+    rows = [row.split("\t") for row in rows]
+    assert rows[1][1] == "2025-01-04T08:00:00+01:00"
+    assert [row[4:] for row in rows] == [
+        ["11", "0", "1"],
+        ["8", "1", "2"],
+        ["23", "0", "2"],
+        ["10", "0", "\\N"],
+    ]
+
+
+def test_local_times_skipped_by_summer_time_are_invalid():
+    parsed, _ = parse(
+        HEADER
+        + "2025-03-30 01:45;0,5;0,1\n"
+        + "2025-03-30 02:15;0,5;0,1\n"
+        + "2025-03-30 03:00;0,5;0,1\n"
+    )
+
+    assert [(error.line, error.error.split(" ")[0]) for error in parsed.errors] == [
+        (3, "Invalid"),
+    ]
+
+
+def test_local_times_repeated_when_summer_time_ends_are_in_file_order():
+    repeated_hour = "".join(
+        f"2025-10-26 02:{minute:02};0,5;0,1\n" for minute in (0, 15, 30, 45)
+    )
+    parsed, rows = parse(
+        HEADER
+        + "2025-10-26 01:45;0,5;0,1\n"
+        + repeated_hour
+        + repeated_hour
+        + "2025-10-26 03:00;0,5;0,1\n"
+    )
+
+    assert parsed.errors == []
+    assert parsed.records == 10
+    rows = [row.split("\t") for row in rows]
+    assert [row[1] for row in rows[3:7]] == [
+        "2025-10-26T02:30:00+02:00",
+        "2025-10-26T02:45:00+02:00",
+        "2025-10-26T02:00:00+01:00",
+        "2025-10-26T02:15:00+01:00",
+    ]
+    # both occurrences are in the same local hour
+    assert {row[4] for row in rows[1:9]} == {"2"}
+    assert parsed.last_measured_at.isoformat() == "2025-10-26T03:00:00+01:00"
+
+
+def test_files_without_price_column_have_null_prices():
+    parsed, rows = parse(
+        "Časovna značka;Energija A+ [kWh]\n"
+        + "2025-01-01T00:00:00+01:00;0,125\n"
+        + "2025-01-01T00:15:00+01:00;0,5;0,1\n"
+    )
+
+    assert parsed.has_prices is False
+    assert [(error.line, error.error) for error in parsed.errors] == [
+        (3, "Expected 2 columns, found 3")
+    ]
+    assert rows == [
+        "7\t2025-01-01T00:00:00+01:00\t0.125\t\\N\t0\t0\t1",
+    ]
+
+
+def test_header_with_unknown_columns_is_reported():
+    parsed, _ = parse("Časovna značka\n2025-01-01T00:00:00+01:00;0,125;0,1\n")
+
+    assert [(error.line, error.error) for error in parsed.errors] == [
+        (1, "Expected 2 or 3 columns, found 1")
+    ]
+
+
+@pytest.mark.parametrize(
+    "extension, compress",
+    [(".gz", gzip.compress), (".zst", zstandard.ZstdCompressor().compress)],
+)
+def test_compressed_files_are_parsed_from_stream(extension, compress):
+    content = HEADER + "2025-01-01T00:00:00+01:00;0,125;0,11\n"
+    stream = decompressed_stream(io.BytesIO(compress(content.encode())), extension)
+
+    parsed = parse_measurements_csv(stream, 7, BLOCK_LEVELS)
+
+    assert len(parsed.read().splitlines()) == 1
+    assert parsed.errors == []
+    assert parsed.records == 1
+    assert parsed.failure is None
+
+
+def test_highly_compressed_zstd_frames_are_decompressed_in_steps():
+    first = (HEADER + "2025-01-01T00:00:00+01:00;0,125;0,11\n").encode()
+    second = b" " * 32 * 1024 * 1024
+    compressor = zstandard.ZstdCompressor()
+    compressed = compressor.compress(first) + compressor.compress(second)
+
+    frames = ZstdFrames(io.BytesIO(compressed))
+
+    assert frames.read(len(first)) == first
+    assert frames.read(64) == second[:64]
+    # output of a single step is bounded, not the whole frame
+    assert len(frames._pending) <= 8 * 1024 * 1024
+    assert len(frames.readall()) == len(second) - 64
+
+
+@pytest.mark.parametrize(
+    "extension, compress",
+    [(".gz", gzip.compress), (".zst", zstandard.ZstdCompressor().compress)],
+)
+def test_decompressed_size_is_limited(extension, compress):
+    content = HEADER + "2025-01-01T00:00:00+01:00;0,125;0,11\n" * 1000
+    stream = decompressed_stream(
+        io.BytesIO(compress(content.encode())), extension, max_size=10_000
+    )
+
+    parsed = parse_measurements_csv(stream, 7, BLOCK_LEVELS)
+    parsed.read()
+
+    assert isinstance(parsed.failure, DecompressedSizeError)
+
+
+def test_truncated_zstd_file_is_an_error():
+    content = HEADER + "2025-01-01T00:00:00+01:00;0,125;0,11\n" * 100
+    compressed = zstandard.ZstdCompressor().compress(content.encode())
+    stream = decompressed_stream(io.BytesIO(compressed[:-10]), ".zst")
+
+    parsed = parse_measurements_csv(stream, 7, BLOCK_LEVELS)
+    parsed.read()
+
+    assert isinstance(parsed.failure, DECOMPRESSION_ERRORS)
+
+
+class GeneratedCsv(io.RawIOBase):
+    """Quarter hour measurements, generated while they are read."""
+
+    def __init__(self, rows: int):
+        start = datetime.fromisoformat("2020-01-01T00:00:00+00:00")
+        self._lines = (
+            f"{start + timedelta(minutes=15 * n):%Y-%m-%dT%H:%M:%S%z};0,125;0,11\n".encode()
+            for n in range(rows)
+        )
+        self._line = HEADER.encode()
+        self.size_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        if not self._line:
+            self._line = next(self._lines, b"")
+        size = min(len(target), len(self._line))
+        target[:size] = self._line[:size]
+        self._line = self._line[size:]
+        self.size_read += size
+        return size
+
+
+def test_rows_are_converted_while_they_are_read():
+    rows = 10_000
+    source = GeneratedCsv(rows)
+    parsed = parse_measurements_csv(io.BufferedReader(source), 7, BLOCK_LEVELS)
+
+    # COPY reads in chunks of 8 KiB, only the lines needed for them are read from the file
+    copied = len(parsed.read(8192))
+    assert source.size_read < 64 * 1024
+
+    # memory does not grow with the file or its rows, both are a few hundred KiB
+    tracemalloc.start()
+    try:
+        while chunk := parsed.read(8192):
+            copied += len(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert source.size_read > 350 * 1024
+    assert copied > 400 * 1024
+    assert peak < 128 * 1024
+    assert parsed.errors == []
+    assert parsed.records == rows
+
+
+def test_customer_id_is_read_from_compound_extensions():
+    for filename in ("export-2025-42.csv", "a-42.csv.gz", "a-42.csv.zst"):
+        assert MEASUREMENT_FILENAME.search(filename).group(1) == "42"
+    assert MEASUREMENT_FILENAME.search("a-42.csv.bz2") is None
@@ -0,0 +1,77 @@
+"""
+Errors of measurement uploads. Requires a migrated database,
+set with DATABASE_URI, otherwise tests are skipped.
+"""
+
+import os
+
+from dotenv import load_dotenv
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy.exc import OperationalError
+from structlog.testing import capture_logs
+
+from app.utils.measurement_csv import ParsedMeasurements
+
+load_dotenv()
+
+HEADER = "Časovna značka;Energija A+ [kWh];Cena [EUR/kWh]\n"
+# customer is never stored, rows referencing it violate the foreign key
+MISSING_CUSTOMER_ID = 2_000_000_000
+
+
+@pytest.fixture(scope="module")
+def client():
+    database_uri = os.getenv("DATABASE_URI")
+    if not database_uri or database_uri.startswith("driver://"):
+        pytest.skip("DATABASE_URI is not set")
+
+    # app creates the engine, so it is imported only with a database
+    from app.database.session import engine
+    from app.main import app
+
+    try:
+        engine.connect().close()
+    except OperationalError:
+        pytest.skip("database is not reachable")
+    return TestClient(app)
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    from app.endpoints import measurements
+
+    # customer lookup is skipped, so nothing has to be stored for the upload
+    monkeypatch.setattr(measurements, "get_customer", lambda session, customer_id: True)
+    return measurements
+
+
+def upload(client, content: str):
+    return client.post(
+        "/measurements/upload-csv",
+        files={"file": (f"export-{MISSING_CUSTOMER_ID}.csv", content.encode())},
+    )
+
+
+def test_violated_constraints_are_mapped_to_api_errors(client, endpoint):
+    response = upload(client, HEADER + "2025-01-01T00:00:00+01:00;0,5;0,1\n")
+
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Customer not found"}
+
+
+def test_database_errors_are_logged_and_not_returned(client, endpoint, monkeypatch):
+    class FailingMeasurements(ParsedMeasurements):
+        # driver cancels COPY with the error in its message
+        def readinto(self, target) -> int:
+            raise RuntimeError("internal details")
+
+    monkeypatch.setattr(
+        endpoint, "parse_measurements_csv", lambda *args: FailingMeasurements()
+    )
+    with capture_logs() as logs:
+        response = upload(client, HEADER + "2025-01-01T00:00:00+01:00;0,5;0,1\n")
+
+    assert response.status_code == 500
+    assert response.json() == {"detail": "Measurements could not be stored"}
+    assert [log["event"] for log in logs] == ["Measurements upload failed"]
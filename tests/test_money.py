@@ -0,0 +1,64 @@
+from decimal import Decimal
+import random
+
+from app.utils.money import (
+    CENT,
+    TAX_RATE,
+    WATT_HOUR,
+    allocate_rounded,
+    round_half_up,
+    to_decimal,
+)
+
+
+def test_round_half_up_rounds_cents_away_from_zero():
+    assert round_half_up(Decimal("2.675")) == Decimal("2.68")
+    # float 2.675 is stored as 2.67499..., it is converted through its repr
+    assert round_half_up(2.675) == Decimal("2.68")
+    assert round_half_up(Decimal("10.005") * TAX_RATE) == Decimal("2.20")
+
+
+def test_to_decimal_keeps_short_float_representation():
+    assert to_decimal(0.1) == Decimal("0.1")
+    assert to_decimal(3) == Decimal(3)
+
+
+def test_allocated_items_sum_to_rounded_total():
+    values = [Decimal("0.335"), Decimal("0.335"), Decimal("0.335")]
+
+    allocated = allocate_rounded(values)
+
+    # rounding each value separately would give 1.02
+    assert allocated == [Decimal("0.34"), Decimal("0.34"), Decimal("0.33")]
+    assert sum(allocated) == round_half_up(sum(values))
+
+
+def test_allocation_with_given_total_adds_and_removes_units():
+    values = [Decimal("1.004"), Decimal("2.003"), Decimal("3.002")]
+
+    assert allocate_rounded(values, CENT, total=Decimal("6.03")) == [
+        Decimal("1.01"),
+        Decimal("2.01"),
+        Decimal("3.01"),
+    ]
+    assert sum(allocate_rounded(values, CENT, total=Decimal("5.99"))) == Decimal("5.99")
+
+
+def test_random_allocations_are_reconciled():
+    generator = random.Random(7)
+    for _ in range(200):
+        values = [
+            Decimal(generator.randint(0, 10**7)) / 10**6
+            for _ in range(generator.randint(1, 6))
+        ]
+        allocated = allocate_rounded(values, WATT_HOUR)
+
+        assert sum(allocated) == round_half_up(sum(values), WATT_HOUR)
+        assert all(
+            abs(rounded - value) < WATT_HOUR
+            for rounded, value in zip(allocated, values)
+        )
+
+
+def test_empty_allocation():
+    assert allocate_rounded([]) == []
@@ -0,0 +1,82 @@
+import sys
+import threading
+import time
+
+from app.utils.profiling import Profile, sampler
+
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampled_stacks_are_collapsed_from_root_to_leaf():
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_loop, args=(stop,))
+    profile = Profile()
+    thread.start()
+    sampler.subscribe(profile)
+    try:
+        time.sleep(0.2)
+    finally:
+        sampler.unsubscribe(profile)
+        stop.set()
+        thread.join()
+
+    assert profile.samples > 0
+    lines = profile.containing(busy_loop.__code__).collapsed().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        frames = stack.split(";")
+        assert frames[0].startswith("Thread._bootstrap ")
+        assert any(
+            frame.startswith("busy_loop (tests/test_profiling.py:") for frame in frames
+        )
+        assert int(count) > 0
+
+
+def test_stacks_of_other_code_are_removed():
+    profile = Profile()
+    profile.add({threading.get_ident(): sys._getframe()})
+
+    assert profile.samples == 1
+    assert profile.stacks
+    assert not profile.containing(busy_loop.__code__).stacks
+
+
+class BlockedProfile(Profile):
+    # first sample waits until released, like a sample of many deep stacks
+    def __init__(self):
+        super().__init__()
+        self.adding = threading.Event()
+        self.release = threading.Event()
+
+    def add(self, frames: dict):
+        self.adding.set()
+        self.release.wait(5)
+        super().add(frames)
+
+
+def test_unsubscribe_waits_for_sample_in_progress():
+    profile = BlockedProfile()
+    sampler.subscribe(profile)
+    assert profile.adding.wait(5)
+
+    unsubscribed = threading.Event()
+
+    def unsubscribe():
+        sampler.unsubscribe(profile)
+        unsubscribed.set()
+
+    thread = threading.Thread(target=unsubscribe)
+    thread.start()
+    assert not unsubscribed.wait(0.2)
+
+    profile.release.set()
+    thread.join(5)
+    assert unsubscribed.is_set()
+    # profile is not changed anymore, so its stacks can be read
+    samples = profile.samples
+    time.sleep(sampler.interval * 5)
+    assert profile.samples == samples == 1
@@ -0,0 +1,224 @@
+"""
+Checks that queries of invoice and contract endpoints use indexes.
+Statements are taken from the helpers the endpoints call and explained
+with test data, which is rolled back. Requires a migrated database,
+set with DATABASE_URI, otherwise tests are skipped.
+"""
+
+from datetime import date
+import json
+import os
+
+from dotenv import load_dotenv
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.database.models.customer import ElectricityCustomer
+from app.utils.customer_search import search_customers
+from app.utils.invoice import find_period_invoice, load_invoices_with_details
+
+load_dotenv()
+
+# first customer has many terminated contracts and one active contract,
+# other customers have one contract each
+TEST_DATA = """
+    WITH provider AS (
+        INSERT INTO electricity_providers (full_title, email, webpage, tax_code,
+            iban_number, street_address, zip_code, zip_name, created_at, updated_at)
+        VALUES ('Provider', 'provider@test', 'test', '1', 'SI56', 'Street', 1000,
+            'Ljubljana', now(), now())
+        RETURNING id
+    ), customers AS (
+        INSERT INTO electricity_customers (fullname, email, tax_code, street_address,
+            zip_code, zip_name, created_at, updated_at)
+        SELECT 'Customer', 'customer-' || n || '@test', n, 'Street', 1000,
+            'Ljubljana', now(), now()
+        FROM generate_series(0, 1000) n
+        RETURNING id, email
+    ), contracts AS (
+        INSERT INTO electricity_customers_contracts (provider_id, customer_id,
+            customer_type, contract_number, energy_meter_number, package_name,
+            termination_date, created_at, updated_at)
+        SELECT provider.id, customers.id, 'RESIDENTIAL', 'plan-' || customers.id || '-' || n,
+            'meter', 'package', CASE WHEN n > 1 THEN now() END, now(), now()
+        FROM provider, customers, generate_series(1, 50) n
+        WHERE n = 1 OR customers.email = 'customer-0@test'
+        RETURNING id
+    ), invoices AS (
+        INSERT INTO electricity_invoices (contract_id, invoice_number, issued_date,
+            period_start, service_date, location_issued, due_date, invoice_code,
+            payment_reason, "receiver_IBAN", receiver_reference, base_amount,
+            tax_amount, total_amount, total_quantity, created_at, updated_at)
+        SELECT contracts.id, 'plan', now(), date '2025-08-01' + make_interval(months => n),
+            date '2025-08-31' + make_interval(months => n), 'Ljubljana', now(), 'ENRG',
+            'reason', 'SI56', 'reference', 0, 0, 0, 0, now(), now()
+        FROM contracts, generate_series(0, 3) n
+        RETURNING id
+    )
+    INSERT INTO electricity_invoices_items (electricity_invoice_id, name, unit,
+        quantity, amount, date_from, date_to, created_at, updated_at)
+    SELECT invoices.id, 'item', 'kWh', 0, 0, now(), now(), now(), now()
+    FROM invoices, generate_series(1, 3)
+"""
+
+CUSTOMER_SEARCH_INDEXES = {
+    "electricity_customers_fullname_trgm_idx",
+    "electricity_customers_email_trgm_idx",
+    "electricity_customers_tax_code_trgm_idx",
+    "electricity_customers_contracts_contract_number_trgm_idx",
+    "electricity_customers_contracts_energy_meter_number_trgm_idx",
+}
+
+TEST_TABLES = [
+    "electricity_customers",
+    "electricity_customers_contracts",
+    "electricity_invoices",
+    "electricity_invoices_items",
+]
+
+
+@pytest.fixture(scope="module")
+def connection():
+    database_uri = os.getenv("DATABASE_URI")
+    if not database_uri or database_uri.startswith("driver://"):
+        pytest.skip("DATABASE_URI is not set")
+
+    engine = create_engine(database_uri)
+    try:
+        connection = engine.connect()
+    except OperationalError:
+        pytest.skip("database is not reachable")
+
+    yield connection
+    connection.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def session(connection):
+    transaction = connection.begin()
+    connection.execute(text(TEST_DATA))
+    # statistics are updated in the transaction, so plans do not depend
+    # on whatever else is in the database
+    for table in TEST_TABLES:
+        connection.execute(text(f"ANALYZE {table}"))
+    session = Session(bind=connection)
+    yield session
+    session.close()
+    transaction.rollback()
+
+
+def plan_customer_id(session) -> int:
+    return session.execute(
+        text("SELECT id FROM electricity_customers WHERE email = 'customer-0@test'")
+    ).scalar_one()
+
+
+def explain_index_names(session, call) -> set[str]:
+    """Index names in plans of all statements executed by call(session)."""
+    connection = session.connection()
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(connection, "before_cursor_execute", capture)
+    try:
+        call(session)
+    finally:
+        event.remove(connection, "before_cursor_execute", capture)
+    assert statements
+
+    index_names = set()
+    for statement, parameters in statements:
+        plan = connection.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {statement}", parameters
+        ).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        nodes = [plan[0]["Plan"]]
+        while nodes:
+            node = nodes.pop()
+            if "Index Name" in node:
+                index_names.add(node["Index Name"])
+            nodes.extend(node.get("Plans", []))
+    return index_names
+
+
+def test_invoice_details_use_items_index(session):
+    # invoice details, documents and corrections load invoices with items
+    invoice_ids = session.execute(
+        text(
+            "SELECT id FROM electricity_invoices WHERE invoice_number = 'plan' LIMIT 3"
+        )
+    ).scalars()
+    invoice_ids = list(invoice_ids)
+
+    assert "ix_electricity_invoices_items_electricity_invoice_id" in (
+        explain_index_names(
+            session, lambda session: load_invoices_with_details(session, invoice_ids)
+        )
+    )
+
+
+def test_period_invoice_uses_contract_service_date_key(session):
+    # existing invoice lookup in create_invoice_record and billing run
+    contract_id = session.execute(
+        text(
+            "SELECT id FROM electricity_customers_contracts "
+            "WHERE customer_id = :customer_id AND termination_date IS NULL"
+        ),
+        {"customer_id": plan_customer_id(session)},
+    ).scalar_one()
+
+    assert "electricity_invoices_contract_service_date_key" in (
+        explain_index_names(
+            session,
+            lambda session: find_period_invoice(
+                session, contract_id, date(2025, 10, 1), date(2025, 10, 31)
+            ),
+        )
+    )
+
+
+def test_active_contract_uses_partial_index(session, monkeypatch):
+    # active contract lookup in customer, contract and invoice endpoints,
+    # with the cache disabled the contract is always loaded,
+    # cache module creates the engine, so it is imported only with a database
+    from app.database import cache
+
+    monkeypatch.setattr(cache, "cache_ttl", 0)
+    customer_id = plan_customer_id(session)
+
+    assert "electricity_customers_contracts_active_customer_key" in (
+        explain_index_names(
+            session, lambda session: cache.get_active_contract(session, customer_id)
+        )
+    )
+
+
+def test_customer_contracts_use_index(session):
+    # contracts are loaded to be deleted with the customer
+    customer = session.get(ElectricityCustomer, plan_customer_id(session))
+
+    assert "ix_electricity_customers_contracts_customer_id" in (
+        explain_index_names(session, lambda session: customer.contracts)
+    )
+
+
+def test_customer_search_uses_trigram_indexes(session):
+    # pg_trgm can be missing on development databases
+    if not session.execute(
+        text("SELECT to_regclass('electricity_customers_fullname_trgm_idx')")
+    ).scalar():
+        pytest.skip("trigram indexes are not created")
+
+    # every column of the search can be matched through its index, tables of the test
+    # are small enough that a sequential scan is cheaper, so it is disabled
+    session.execute(text("SET LOCAL enable_seqscan = off"))
+    assert CUSTOMER_SEARCH_INDEXES <= explain_index_names(
+        session, lambda session: search_customers(session, "Novak", 20)
+    )
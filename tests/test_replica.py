@@ -0,0 +1,98 @@
+import os
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.database import cache
+from app.database.session import (
+    REPLICA_SESSION,
+    ReplicaStatus,
+    engine,
+    replica_max_lag,
+    replica_usable,
+)
+
+NOW = 1_000_000.0
+
+
+def test_replica_without_writes_of_client_is_used_within_lag():
+    assert replica_usable(NOW - 1, None, NOW)
+    assert not replica_usable(NOW - replica_max_lag - 1, None, NOW)
+    assert not replica_usable(None, None, NOW)
+
+
+def test_recent_write_of_client_is_read_from_primary():
+    assert not replica_usable(NOW - 1, str(NOW - 0.5), NOW)
+    assert replica_usable(NOW - 1, str(NOW - 2), NOW)
+    # invalid cookie is ignored
+    assert replica_usable(NOW - 1, "abc", NOW)
+
+
+class BlockedReplicaStatus(ReplicaStatus):
+    # check waits until released, like a replica that does not respond
+    def __init__(self):
+        super().__init__(None, interval=0)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def _check(self):
+        self.started.set()
+        self.release.wait(5)
+        return NOW
+
+
+def test_other_requests_do_not_wait_for_replica_check():
+    status = BlockedReplicaStatus()
+    checking = threading.Thread(target=status.replayed_until)
+    checking.start()
+    assert status.started.wait(5)
+
+    # last known position is returned while the check is running
+    assert status.replayed_until() is None
+
+    status.release.set()
+    checking.join()
+    assert status.replayed_until() == NOW
+
+
+@pytest.fixture
+def connection():
+    database_uri = os.getenv("DATABASE_URI")
+    if not database_uri or database_uri.startswith("driver://"):
+        pytest.skip("DATABASE_URI is not set")
+    try:
+        connection = engine.connect()
+    except OperationalError:
+        pytest.skip("database is not reachable")
+
+    transaction = connection.begin()
+    yield connection
+    transaction.rollback()
+    connection.close()
+
+
+def test_values_read_on_replica_are_not_cached(connection, monkeypatch):
+    monkeypatch.setattr(cache, "cache_ttl", 300)
+    monkeypatch.setattr(cache, "_entries", {})
+    customer_id = connection.execute(
+        text("""
+            INSERT INTO electricity_customers (fullname, email, tax_code, street_address,
+                zip_code, zip_name, created_at, updated_at)
+            VALUES ('Customer', 'replica@test', '1', 'Street', 1000, 'Ljubljana',
+                now(), now())
+            RETURNING id
+        """)
+    ).scalar_one()
+
+    # replica session is simulated on the primary, only its marker matters
+    replica_session = Session(bind=connection, info={REPLICA_SESSION: True})
+    assert cache.get_customer(replica_session, customer_id) is not None
+    assert cache.get_active_contract(replica_session, customer_id) is None
+    assert cache._entries == {}
+
+    primary_session = Session(bind=connection)
+    assert cache.get_customer(primary_session, customer_id) is not None
+    assert cache._customer_key(customer_id) in cache._entries
@@ -0,0 +1,49 @@
+import asyncio
+
+from app.utils.scheduling import Lane, light_lane, metrics_text, select_lane
+
+
+def test_heavy_routes_are_selected_by_method_and_path():
+    assert select_lane("POST", "/measurements/upload-csv").name == "upload"
+    assert select_lane("POST", "/invoices").name == "invoices"
+    assert select_lane("GET", "/invoices/12/document").name == "documents"
+    assert select_lane("GET", "/invoices/12") is light_lane
+    assert select_lane("GET", "/customers/") is light_lane
+
+
+def test_requests_over_queue_size_are_rejected():
+    async def scenario():
+        lane = Lane("test", concurrency=1, queue_size=1)
+        assert await lane.acquire(timeout=1)
+
+        # second request waits for the first one, third one does not fit in the queue
+        waiting = asyncio.create_task(lane.acquire(timeout=1))
+        await asyncio.sleep(0)
+        assert lane.waiting == 1
+        assert not await lane.acquire(timeout=1)
+
+        lane.release(duration=2.0)
+        assert await waiting
+        return lane
+
+    lane = asyncio.run(scenario())
+    assert (lane.active, lane.admitted, lane.rejected) == (1, 2, 1)
+    assert lane.retry_after() == 2
+
+
+def test_waiting_request_is_rejected_after_timeout():
+    async def scenario():
+        lane = Lane("test", concurrency=1, queue_size=5)
+        assert await lane.acquire(timeout=1)
+        assert not await lane.acquire(timeout=0.01)
+        return lane
+
+    lane = asyncio.run(scenario())
+    assert (lane.waiting, lane.timed_out) == (0, 1)
+
+
+def test_metrics_are_exported_per_lane():
+    text = metrics_text()
+    assert 'lane_active_requests{lane="upload"} ' in text
+    assert 'lane_rejected_total{lane="light"} 0' in text
+    assert 'lane_concurrency_limit{lane="documents"} ' in text
@@ -0,0 +1,59 @@
+from datetime import date
+from decimal import Decimal
+import xml.dom.minidom
+
+from app.utils.document import environment, usage_chart
+from app.utils.invoice import DailyUsage, time_block_totals, usage_profile
+
+
+def daily(day: int, time_block: int, consumption: str, price: str = "0"):
+    return DailyUsage(
+        date(2025, 3, day), time_block, Decimal(price), Decimal(consumption)
+    )
+
+
+def test_usage_profile_is_a_dense_day_by_block_matrix():
+    profile = usage_profile(
+        [daily(1, 2, "1.2345"), daily(1, 4, "2"), daily(3, 2, "0.5")],
+        date(2025, 3, 1),
+        date(2025, 3, 4),
+    )
+
+    assert profile == {
+        "date_from": "2025-03-01",
+        "time_blocks": [2, 4],
+        "days": [[1.235, 2.0], [0.0, 0.0], [0.5, 0.0], [0.0, 0.0]],
+    }
+
+
+def test_time_block_totals_are_summed_over_days():
+    totals = time_block_totals(
+        [daily(1, 3, "1", "0.1"), daily(2, 1, "2", "0.3"), daily(2, 3, "4", "0.5")]
+    )
+
+    assert totals == {
+        1: (Decimal("0.3"), Decimal("2")),
+        3: (Decimal("0.6"), Decimal("5")),
+    }
+
+
+def test_usage_chart_is_rendered_as_valid_svg():
+    profile = usage_profile(
+        [daily(day, block, str(day)) for day in range(1, 32) for block in (2, 3)],
+        date(2025, 3, 1),
+        date(2025, 3, 31),
+    )
+    chart = usage_chart(profile)
+
+    assert len(chart["bars"]) == 31 * 2
+    # highest bar reaches the top of the axis
+    assert min(bar["y"] for bar in chart["bars"]) >= 0
+
+    html = environment.get_template("usage_chart.html").render(usage_chart=chart)
+    svg = html[html.index("<svg") : html.index("</svg>") + len("</svg>")]
+    xml.dom.minidom.parseString(svg)
+
+
+def test_usage_chart_is_skipped_without_consumption():
+    assert usage_chart(None) is None
+    assert usage_chart(usage_profile([], date(2025, 3, 1), date(2025, 3, 31))) is None